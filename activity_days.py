@@ -0,0 +1,180 @@
+# Each user's active days as a bitset: bit i is set when the user was active on day first_day + i
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from database import get_db_connection
+from result_cache import invalidate, user_tag
+
+EPOCH = date(1970, 1, 1)
+# Binary digits to byte values, for unpacking a window into a list of 0/1
+_DIGIT_VALUES = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def day_number(day: date) -> int:
+    return (day - EPOCH).days
+
+
+class ActivityDays:
+    """One user's active days, stored as a little-endian BLOB and worked on as a Python int"""
+
+    __slots__ = ('first_day', 'bits')
+
+    def __init__(self, first_day: int = 0, bits: int = 0):
+        self.first_day = first_day
+        self.bits = bits
+
+    @classmethod
+    def from_blob(cls, first_day: int, blob: bytes) -> 'ActivityDays':
+        return cls(first_day, int.from_bytes(blob, 'little'))
+
+    def to_blob(self) -> bytes:
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+
+    def add(self, days: Iterable[date]) -> bool:
+        """Mark days active, in any order; False when all of them already were"""
+        changed = False
+        for day in days:
+            number = day_number(day)
+            if not self.bits:
+                self.first_day = number
+            elif number < self.first_day:
+                # Backfilled activity from before the first recorded day
+                self.bits <<= self.first_day - number
+                self.first_day = number
+            bit = 1 << (number - self.first_day)
+            if not self.bits & bit:
+                self.bits |= bit
+                changed = True
+        return changed
+
+    def last_active(self) -> Optional[date]:
+        if not self.bits:
+            return None
+        return EPOCH + timedelta(days=self.first_day + self.bits.bit_length() - 1)
+
+    def window(self, start: date, end: date) -> int:
+        """Bits for start..end inclusive, bit 0 being start"""
+        length = (end - start).days + 1
+        if length <= 0:
+            return 0
+        offset = day_number(start) - self.first_day
+        bits = self.bits >> offset if offset >= 0 else self.bits << -offset
+        return bits & ((1 << length) - 1)
+
+    def count(self, start: date, end: date) -> int:
+        return self.window(start, end).bit_count()
+
+    def days(self, start: date, end: date) -> List[int]:
+        """1 or 0 for each day from start to end, for heatmaps"""
+        length = (end - start).days + 1
+        if length <= 0:
+            return []
+        return list(format(self.window(start, end), f'0{length}b')[::-1].encode().translate(_DIGIT_VALUES))
+
+    def current_streak(self, today: date) -> int:
+        """Active days in a row up to today, or up to yesterday while today has no activity yet"""
+        end = day_number(today) - self.first_day
+        if self.bits and end >= 0 and not self.bits >> end & 1:
+            end -= 1
+        if not self.bits or end < 0:
+            return 0
+        # The streak runs back from end to the latest inactive day
+        gaps = ~self.bits & ((1 << (end + 1)) - 1)
+        return end + 1 - gaps.bit_length()
+
+    def longest_streak(self) -> int:
+        """Longest run of active days, in O(log n) big-int operations"""
+        if not self.bits:
+            return 0
+        # runs[k] has bit i set when days i .. i + 2**k - 1 are all active
+        runs = [self.bits]
+        while True:
+            longer = runs[-1] & (runs[-1] >> (1 << (len(runs) - 1)))
+            if not longer:
+                break
+            runs.append(longer)
+        # Build the longest length from the largest powers of two down
+        length, covered = 0, None
+        for k in reversed(range(len(runs))):
+            candidate = runs[k] if covered is None else covered & (runs[k] >> length)
+            if candidate:
+                covered, length = candidate, length + (1 << k)
+        return length
+
+
+def load_activity(cursor, username: str) -> ActivityDays:
+    row = cursor.execute('SELECT first_day, bits FROM activity_days WHERE username = ?', (username,)).fetchone()
+    return ActivityDays.from_blob(row[0], row[1]) if row else ActivityDays()
+
+
+def get_activity(username: str) -> ActivityDays:
+    conn = get_db_connection()
+    if not conn:
+        return ActivityDays()
+    activity = load_activity(conn, username)
+    conn.close()
+    return activity
+
+
+def save_activity(cursor, username: str, activity: ActivityDays, today: date) -> Tuple[int, int]:
+    """Store the bitset and the user_streaks row derived from it"""
+    current_streak, longest_streak = activity.current_streak(today), activity.longest_streak()
+    cursor.execute('INSERT OR REPLACE INTO activity_days (username, first_day, bits) VALUES (?, ?, ?)',
+                   (username, activity.first_day, activity.to_blob()))
+    cursor.execute('''
+        INSERT OR REPLACE INTO user_streaks
+        (username, current_streak, longest_streak, last_activity_date)
+        VALUES (?, ?, ?, ?)
+    ''', (username, current_streak, longest_streak, activity.last_active()))
+    return current_streak, longest_streak
+
+
+def record_activity(username: str, days: Iterable[date]) -> Optional[Tuple[int, int]]:
+    """Mark days active for a user and return (current_streak, longest_streak)"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    # Read and write under the write lock so concurrent updates for one user can't lose days
+    conn.execute('BEGIN IMMEDIATE')
+    activity = load_activity(conn, username)
+    today = date.today()
+    changed = activity.add(days)
+    if changed:
+        streaks = save_activity(conn, username, activity, today)
+    else:
+        streaks = activity.current_streak(today), activity.longest_streak()
+    conn.commit()
+    conn.close()
+    if changed:
+        invalidate(user_tag(username))
+    return streaks
+
+
+def rebuild_activity_days(cursor):
+    """Build every user's bitset from game sessions, daily activities and existing streaks"""
+    users = {}
+    for username, number in cursor.execute('''
+        SELECT username, CAST(julianday(date(start_time)) - 2440587.5 AS INTEGER) FROM game_sessions
+        WHERE username IS NOT NULL AND start_time IS NOT NULL
+        UNION
+        SELECT username, CAST(julianday(activity_date) - 2440587.5 AS INTEGER) FROM daily_activities
+        WHERE username IS NOT NULL AND activity_date IS NOT NULL
+    '''):
+        if number is not None:
+            users.setdefault(username, set()).add(number)
+    # A streak recorded before the bitsets means every day of it was active
+    for username, current_streak, last_activity_date in cursor.execute(
+            'SELECT username, current_streak, last_activity_date FROM user_streaks').fetchall():
+        try:
+            last = day_number(date.fromisoformat(str(last_activity_date)[:10]))
+        except ValueError:
+            continue
+        users.setdefault(username, set()).update(range(last - max(current_streak or 1, 1) + 1, last + 1))
+
+    today = date.today()
+    for username, numbers in users.items():
+        first_day = min(numbers)
+        bits = 0
+        for number in numbers:
+            bits |= 1 << (number - first_day)
+        save_activity(cursor, username, ActivityDays(first_day, bits), today)
@@ -0,0 +1,279 @@
+# Admission control: token-bucket rate limits and load shedding shared by all workers
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from flask import g, jsonify, request, session
+
+# (tokens per second, burst) for each user, and for the endpoint as a whole
+RATE_LIMITS = {
+    'games.update_score': {'user': (10, 20), 'endpoint': (500, 1000)},
+    'games.capture_exercise': {'user': (5, 10), 'endpoint': (250, 500)},
+    'games.sync_exercise_data': {'user': (0.2, 5), 'endpoint': (20, 50)},
+    'auth.update_xp': {'user': (2, 10), 'endpoint': (100, 200)},
+}
+
+# Under load, polling is shed first and game completion is never shed
+PRIORITY_CRITICAL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+ENDPOINT_PRIORITIES = {
+    'games.end_game': PRIORITY_CRITICAL,
+    'games.start_game': PRIORITY_CRITICAL,
+    'dashboard.stats': PRIORITY_LOW,
+    'dashboard.weekly_progress': PRIORITY_LOW,
+    'dashboard.achievement_progress': PRIORITY_LOW,
+    'dashboard.summary': PRIORITY_LOW,
+    'games.game_data': PRIORITY_LOW,
+    'games.get_leaderboard': PRIORITY_LOW,
+    'games.activity_heatmap': PRIORITY_LOW,
+    'main.check_usage_limit': PRIORITY_LOW,
+    'diet.search': PRIORITY_LOW,
+    'jobs.job_status': PRIORITY_LOW,
+    'games.get_live_stats': PRIORITY_LOW,
+    'games.heartbeat': PRIORITY_LOW,
+}
+
+# Load is measured two ways, each shedding LOW requests at its threshold and NORMAL ones at 1.5x:
+# connections queued on the listen socket (requests no worker has picked up yet), and requests
+# in flight across all workers. Both default to the server's capacity, workers x threads (or x
+# connections for gevent), set by configure_worker; outside gunicorn it is DEFAULT_CAPACITY.
+DEFAULT_CAPACITY = 64
+SHED_BACKLOG = os.environ.get('ADMISSION_SHED_BACKLOG')
+SHED_THRESHOLD = os.environ.get('ADMISSION_SHED_THRESHOLD')
+SHED_RETRY_AFTER = 5
+# Linux struct tcp_info: for a listening socket, tcpi_unacked is the accept queue length
+TCP_INFO_BACKLOG = struct.Struct('<24xI')
+
+SHM_PATH = os.environ.get('ADMISSION_SHM_PATH') or os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'fitplay-admission')
+
+# Shared layout: per-worker in-flight slots, then an open-addressed table of buckets
+MAX_WORKERS = 256
+WORKER_SLOT = struct.Struct('<qq')    # pid, in-flight requests
+BUCKET_SLOT = struct.Struct('<Qdd')   # key hash, tokens, last refill time
+BUCKET_SLOTS = 8192
+BUCKET_PROBES = 8
+BUCKETS_OFFSET = MAX_WORKERS * WORKER_SLOT.size
+SHM_SIZE = BUCKETS_OFFSET + BUCKET_SLOTS * BUCKET_SLOT.size
+
+
+class SharedState:
+    """mmap'd file shared by every worker process on the host"""
+
+    def __init__(self, path: str = SHM_PATH):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < SHM_SIZE:
+            os.ftruncate(self.fd, SHM_SIZE)
+        self.buffer = mmap.mmap(self.fd, SHM_SIZE)
+        # fcntl record locks only exclude other processes, threads need their own lock
+        self.thread_lock = threading.Lock()
+        self.worker_slot = None
+        self.worker_pid = None
+
+    def _lock(self, offset: int, length: int):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, length, offset)
+
+    def _unlock(self, offset: int, length: int):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, length, offset)
+
+    def _claim_worker_slot(self) -> int:
+        """Take a free slot (or one left by a dead worker) for this process"""
+        pid = os.getpid()
+        self._lock(0, BUCKETS_OFFSET)
+        try:
+            claimed = None
+            for index in range(MAX_WORKERS):
+                offset = index * WORKER_SLOT.size
+                slot_pid, _ = WORKER_SLOT.unpack_from(self.buffer, offset)
+                if slot_pid == pid:
+                    claimed = index
+                    continue
+                if slot_pid and _pid_alive(slot_pid):
+                    continue
+                # Clear counts left behind by crashed or recycled workers
+                WORKER_SLOT.pack_into(self.buffer, offset, 0, 0)
+                if claimed is None:
+                    claimed = index
+            if claimed is None:
+                raise RuntimeError('No free admission worker slots')
+            WORKER_SLOT.pack_into(self.buffer, claimed * WORKER_SLOT.size, pid, 0)
+            return claimed
+        finally:
+            self._unlock(0, BUCKETS_OFFSET)
+
+    def add_in_flight(self, delta: int):
+        """Adjust this worker's in-flight count; only this process writes its slot"""
+        with self.thread_lock:
+            if self.worker_pid != os.getpid():
+                self.worker_slot = self._claim_worker_slot()
+                self.worker_pid = os.getpid()
+            offset = self.worker_slot * WORKER_SLOT.size
+            pid, count = WORKER_SLOT.unpack_from(self.buffer, offset)
+            WORKER_SLOT.pack_into(self.buffer, offset, pid, max(0, count + delta))
+
+    def total_in_flight(self) -> int:
+        """Sum of every worker's slot, read without locking"""
+        total = 0
+        for index in range(MAX_WORKERS):
+            pid, count = WORKER_SLOT.unpack_from(self.buffer, index * WORKER_SLOT.size)
+            if pid:
+                total += count
+        return total
+
+    def take_token(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        """Consume one token from key's bucket; returns (allowed, retry_after_seconds)"""
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        start = key_hash % BUCKET_SLOTS
+        now = time.time()
+
+        with self.thread_lock:
+            # Find the key, else an empty slot, else evict the least recently used probe
+            chosen, tokens, updated = None, burst, now
+            oldest_index, oldest_time = None, None
+            for probe in range(BUCKET_PROBES):
+                index = (start + probe) % BUCKET_SLOTS
+                offset = BUCKETS_OFFSET + index * BUCKET_SLOT.size
+                self._lock(offset, BUCKET_SLOT.size)
+                slot_key, slot_tokens, slot_updated = BUCKET_SLOT.unpack_from(self.buffer, offset)
+                if slot_key == key_hash:
+                    chosen, tokens, updated = index, slot_tokens, slot_updated
+                    self._release_probes(start, probe, keep=index)
+                    break
+                if slot_key == 0 and chosen is None:
+                    chosen = index
+                if oldest_time is None or slot_updated < oldest_time:
+                    oldest_index, oldest_time = index, slot_updated
+            else:
+                if chosen is None:
+                    chosen = oldest_index
+                self._release_probes(start, BUCKET_PROBES - 1, keep=chosen)
+
+            offset = BUCKETS_OFFSET + chosen * BUCKET_SLOT.size
+            try:
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                BUCKET_SLOT.pack_into(self.buffer, offset, key_hash, tokens, now)
+            finally:
+                self._unlock(offset, BUCKET_SLOT.size)
+
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def _release_probes(self, start: int, last_probe: int, keep: int):
+        for probe in range(last_probe + 1):
+            index = (start + probe) % BUCKET_SLOTS
+            if index != keep:
+                self._unlock(BUCKETS_OFFSET + index * BUCKET_SLOT.size, BUCKET_SLOT.size)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_state: Optional[SharedState] = None
+_capacity = DEFAULT_CAPACITY
+_listeners: List[socket.socket] = []
+
+
+def get_shared_state() -> SharedState:
+    global _state
+    if _state is None:
+        _state = SharedState()
+    return _state
+
+
+def configure_worker(server, worker):
+    """gunicorn post_fork hook: size the shedding thresholds and watch the worker's listen sockets"""
+    global _capacity, _listeners
+    cfg = server.cfg
+    per_worker = cfg.worker_connections if cfg.worker_class_str in ('gevent', 'eventlet') else cfg.threads
+    _capacity = max(1, cfg.workers * per_worker)
+    _listeners = [getattr(listener, 'sock', listener) for listener in worker.sockets]
+
+
+def shed_thresholds() -> Tuple[int, int]:
+    """(queued connections, in-flight requests) at which LOW requests are shed"""
+    return int(SHED_BACKLOG or _capacity), int(SHED_THRESHOLD or _capacity)
+
+
+def accept_backlog() -> int:
+    """Connections accepted by the kernel but not yet by any worker"""
+    total = 0
+    for listener in _listeners:
+        try:
+            info = listener.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 104)
+        except (OSError, AttributeError):
+            # Unix sockets, or a platform without TCP_INFO
+            continue
+        total += TCP_INFO_BACKLOG.unpack_from(info)[0]
+    return total
+
+
+def too_many_requests(retry_after: float, message: str, status: int = 429):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def check_rate_limits(endpoint: str, limits: Dict[str, Tuple[float, float]]):
+    """Return a 429 response if the user's or the endpoint's bucket is empty"""
+    state = get_shared_state()
+    if 'user' in limits:
+        rate, burst = limits['user']
+        allowed, retry_after = state.take_token(f"user:{session.get('user_id')}:{endpoint}", rate, burst)
+        if not allowed:
+            return too_many_requests(retry_after, 'Too many requests, slow down')
+    if 'endpoint' in limits:
+        rate, burst = limits['endpoint']
+        allowed, retry_after = state.take_token(f"endpoint:{endpoint}", rate, burst)
+        if not allowed:
+            return too_many_requests(retry_after, 'Server busy, try again shortly')
+    return None
+
+
+def init_admission(app):
+    """Shed low-priority requests under load and enforce RATE_LIMITS"""
+
+    @app.before_request
+    def admit_request():
+        endpoint = request.endpoint
+        state = get_shared_state()
+
+        priority = ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_NORMAL)
+        if priority != PRIORITY_CRITICAL:
+            backlog_limit, in_flight_limit = shed_thresholds()
+            factor = 1 if priority == PRIORITY_LOW else 1.5
+            if (accept_backlog() >= backlog_limit * factor or
+                    state.total_in_flight() >= in_flight_limit * factor):
+                return too_many_requests(SHED_RETRY_AFTER, 'Server busy, try again shortly', 503)
+
+        limits = RATE_LIMITS.get(endpoint)
+        if limits:
+            rejected = check_rate_limits(endpoint, limits)
+            if rejected is not None:
+                return rejected
+
+        state.add_in_flight(1)
+        g.admitted = True
+
+    @app.teardown_request
+    def release_request(exc=None):
+        if g.pop('admitted', False):
+            get_shared_state().add_in_flight(-1)
@@ -0,0 +1,290 @@
+# Plausibility audit of finished game sessions: rep rates, score jumps and timelines, checked in bulk with NumPy
+import logging
+import time
+from itertools import chain
+from operator import itemgetter
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import click
+import numpy as np
+
+from conditional import bump_version, leaderboard_version_key, user_version_key
+from database import get_db_connection
+from game_registry import get_registry
+from result_cache import game_tag, invalidate, user_tag
+from rep_counter import DEFAULT_PERIOD, HOLD_EXERCISES, REP_PERIODS
+
+logger = logging.getLogger(__name__)
+
+# Bits of game_sessions.audit_flags; 0 is clean and NULL not audited yet
+FLAG_RATE = 1  # final score beyond the exercise's fastest pace over the whole session
+FLAG_JUMP = 2  # score rose faster than possible between two tracking points
+FLAG_UNTRACKED = 4  # score higher than the tracking points account for
+FLAG_TIMELINE = 8  # tracking points out of order, outside the session, or counting down
+FLAG_NAMES = {
+    FLAG_RATE: 'implausible_rate',
+    FLAG_JUMP: 'score_jump',
+    FLAG_UNTRACKED: 'untracked_score',
+    FLAG_TIMELINE: 'timeline',
+}
+# Sessions with any of these are quarantined: left out of game_stats and so of leaderboards
+QUARANTINE_FLAGS = FLAG_RATE | FLAG_JUMP | FLAG_UNTRACKED
+
+# Headroom over the fastest plausible pace, plus units of slack for tap timing and rounding
+RATE_TOLERANCE = 1.25
+SLACK_UNITS = 10
+# Clock skew allowed between tracking points and the session's start and end
+CLOCK_SKEW_SECONDS = 60
+# Sessions loaded per batch in bulk audits
+AUDIT_BATCH_SESSIONS = 100000
+
+# julianday() of the Unix epoch; SQLite converts the stored ISO timestamps in C
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+
+
+class AuditReport(NamedTuple):
+    sessions: int
+    points: int
+    flagged: int
+    flag_counts: Dict[str, int]
+    # Ids of sessions that moved into or out of quarantine
+    quarantined: List[int]
+    released: List[int]
+    seconds: float
+
+
+def max_units_per_second(game_type: str) -> float:
+    """Fastest plausible scoring for a game: reps per second, or 1 for hold exercises"""
+    game = get_registry().games.get(game_type)
+    exercise = game.exercise if game else None
+    if exercise in HOLD_EXERCISES:
+        return RATE_TOLERANCE
+    return RATE_TOLERANCE / REP_PERIODS.get(exercise, DEFAULT_PERIOD)[0]
+
+
+def audit_arrays(session_index: np.ndarray, times: np.ndarray, counts: np.ndarray,
+                 starts: np.ndarray, ends: np.ndarray, scores: np.ndarray,
+                 max_rates: np.ndarray) -> np.ndarray:
+    """Audit flags for each session.
+
+    Sessions are described by starts/ends (Unix seconds), final scores and the
+    fastest plausible units per second. Tracking points are given by the index
+    of their session, grouped in ascending order with each session's points in
+    the order they were recorded, their time and the running score.
+    """
+    flags = np.zeros(len(scores), dtype=np.int64)
+    durations = np.maximum(ends - starts, 0.0)
+    flags[scores > max_rates * durations + SLACK_UNITS] |= FLAG_RATE
+    if not len(times):
+        flags[scores > SLACK_UNITS] |= FLAG_UNTRACKED
+        return flags
+
+    # Each point against the one before it; a session's first point against its start and a score of 0
+    first = np.ones(len(times), dtype=bool)
+    first[1:] = session_index[1:] != session_index[:-1]
+    previous_times = np.empty_like(times)
+    previous_times[1:] = times[:-1]
+    previous_times[first] = starts[session_index[first]]
+    previous_counts = np.empty_like(counts)
+    previous_counts[1:] = counts[:-1]
+    previous_counts[first] = 0
+
+    elapsed = times - previous_times
+    gained = counts - previous_counts
+    jumps = gained > max_rates[session_index] * np.maximum(elapsed, 0.0) + SLACK_UNITS
+    flags[session_index[jumps]] |= FLAG_JUMP
+
+    outside = ((times < starts[session_index] - CLOCK_SKEW_SECONDS) |
+               (times > ends[session_index] + CLOCK_SKEW_SECONDS))
+    backwards = ~first & ((elapsed < 0) | (gained < 0))
+    flags[session_index[outside | backwards]] |= FLAG_TIMELINE
+
+    group_starts = np.flatnonzero(first)
+    tracked = np.zeros(len(scores))
+    tracked[session_index[group_starts]] = np.maximum.reduceat(counts, group_starts)
+    flags[scores > tracked + SLACK_UNITS] |= FLAG_UNTRACKED
+    return flags
+
+
+def owner_version_keys(owners) -> set:
+    """ETag version keys for (owner_key, username) pairs; sessions saved before owner_key look up the account"""
+    keys = {owner_key for owner_key, _ in owners if owner_key}
+    legacy = {username for owner_key, username in owners if not owner_key and username}
+    if legacy:
+        from blueprints.auth.auth import load_users as load_accounts
+        keys.update(user_version_key(account_id) for account_id, account in load_accounts().items()
+                    if account.get('username') in legacy)
+    return keys
+
+
+def audit_batch(conn, where: str, params=()) -> Optional[AuditReport]:
+    """Audit the game_sessions rows (aliased gs) matching where, store the flags and fix up game_stats"""
+    started = time.perf_counter()
+    rows = conn.execute(f'''
+        SELECT gs.id, gs.username, gs.game_type,
+               (julianday(gs.start_time) - {UNIX_EPOCH_JULIAN_DAY}) * 86400,
+               (julianday(gs.end_time) - {UNIX_EPOCH_JULIAN_DAY}) * 86400,
+               gs.score, gs.audit_flags, gs.quarantined,
+               IFNULL(gs.points_earned, 0), IFNULL(gs.calories_burned, 0), IFNULL(gs.duration, 0),
+               gs.owner_key
+        FROM game_sessions gs WHERE {where} ORDER BY gs.id
+    ''', params).fetchall()
+    if not rows:
+        return None
+    (session_ids, usernames, game_types, starts, ends, scores, stored, was_quarantined,
+     points_earned, calories, durations, owner_keys) = zip(*rows)
+    ids = np.array(session_ids, dtype=np.int64)
+    game_codes, game_index = np.unique(np.array(game_types, dtype=object).astype(str), return_inverse=True)
+    max_rates = np.array([max_units_per_second(game) for game in game_codes])[game_index]
+
+    # Unreadable timestamps and counts become 0, which the timeline check flags
+    points = conn.execute(f'''
+        SELECT gs.id, IFNULL((julianday(et.timestamp) - {UNIX_EPOCH_JULIAN_DAY}) * 86400, 0),
+               IFNULL(et.exercise_count, 0)
+        FROM game_sessions gs JOIN exercise_tracking et ON et.game_session_id = gs.id
+        WHERE {where} ORDER BY gs.id, et.id
+    ''', params).fetchall()
+    # Ids are up to 63 bits, beyond float64 precision, so they are read separately
+    point_ids = np.fromiter(map(itemgetter(0), points), dtype=np.int64, count=len(points))
+    points = np.fromiter(chain.from_iterable(map(itemgetter(1, 2), points)), dtype=np.float64,
+                         count=2 * len(points)).reshape(-1, 2)
+
+    flags = audit_arrays(np.searchsorted(ids, point_ids), points[:, 0], points[:, 1],
+                         np.array(starts, dtype=np.float64), np.array(ends, dtype=np.float64),
+                         np.array(scores, dtype=np.float64), max_rates)
+
+    stored = np.array([-1 if value is None else value for value in stored], dtype=np.int64)
+    quarantined = (flags & QUARANTINE_FLAGS) != 0
+    was_quarantined = np.array(was_quarantined, dtype=bool)
+    changed = np.flatnonzero(flags != stored)
+    conn.executemany('UPDATE game_sessions SET audit_flags = ?, quarantined = ? WHERE id = ?',
+                     zip(flags[changed].tolist(), quarantined[changed].astype(int).tolist(),
+                         ids[changed].tolist()))
+
+    moved = np.flatnonzero(quarantined != was_quarantined)
+    if len(moved):
+        pairs = sorted({(usernames[i], game_types[i]) for i in moved})
+        rebuild_game_stats(conn, pairs)
+        # Quarantine takes back what end_game added to the user's totals; release restores it
+        adjust_user_totals(conn, [(usernames[i], -1 if quarantined[i] else 1, points_earned[i], calories[i],
+                                   durations[i]) for i in moved])
+    conn.commit()
+
+    if len(moved):
+        keys = {leaderboard_version_key(game_types[i]) for i in moved}
+        keys.update(owner_version_keys([(owner_keys[i], usernames[i]) for i in moved]))
+        bump_version(*sorted(keys))
+        invalidate(*sorted({user_tag(usernames[i]) for i in moved} | {game_tag(game_types[i]) for i in moved}))
+
+    return AuditReport(
+        sessions=len(rows),
+        points=len(points),
+        flagged=int(np.count_nonzero(flags)),
+        flag_counts={name: int(np.count_nonzero(flags & bit)) for bit, name in FLAG_NAMES.items()},
+        quarantined=[session_ids[i] for i in moved if quarantined[i]],
+        released=[session_ids[i] for i in moved if not quarantined[i]],
+        seconds=time.perf_counter() - started,
+    )
+
+
+def rebuild_game_stats(conn, pairs: Iterable[tuple]):
+    """Recompute game_stats for (username, game_type) pairs from their unquarantined sessions"""
+    conn.executemany('''
+        INSERT OR REPLACE INTO game_stats
+        (username, game_type, games_played, best_score, total_score, average_score, last_played)
+        SELECT ?1, ?2, COUNT(*), COALESCE(MAX(score), 0), COALESCE(SUM(score), 0),
+               COALESCE(AVG(score), 0), MAX(end_time)
+        FROM game_sessions WHERE username = ?1 AND game_type = ?2 AND quarantined = 0
+    ''', pairs)
+
+
+def adjust_user_totals(conn, changes: Iterable[tuple]):
+    """Apply (username, sign, points, calories, minutes) to users' totals, one workout each"""
+    conn.executemany('''
+        UPDATE users SET points = points + ?2 * ?3, calories_burned = calories_burned + ?2 * ?4,
+                         time_active = time_active + ?2 * ?5, workouts_completed = workouts_completed + ?2
+        WHERE username = ?1
+    ''', changes)
+
+
+def merge_reports(reports: List[AuditReport]) -> AuditReport:
+    return AuditReport(
+        sessions=sum(report.sessions for report in reports),
+        points=sum(report.points for report in reports),
+        flagged=sum(report.flagged for report in reports),
+        flag_counts={name: sum(report.flag_counts[name] for report in reports) for name in FLAG_NAMES.values()},
+        quarantined=[session_id for report in reports for session_id in report.quarantined],
+        released=[session_id for report in reports for session_id in report.released],
+        seconds=sum(report.seconds for report in reports),
+    )
+
+
+def audit_sessions(session_ids: Optional[List[int]] = None, full: bool = False) -> Optional[AuditReport]:
+    """Audit the given sessions, every session (full), or those not audited yet"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    conn.row_factory = None
+    reports = []
+    try:
+        if session_ids is not None:
+            placeholders = ','.join('?' * len(session_ids))
+            report = audit_batch(conn, f'gs.id IN ({placeholders})', session_ids) if session_ids else None
+            reports.extend([report] if report else [])
+        elif full:
+            # Ids are sparse, so batches continue after the last id seen rather than over id ranges
+            last_id = -1
+            while True:
+                batch = conn.execute('SELECT MAX(id) FROM (SELECT id FROM game_sessions WHERE id > ? ORDER BY id LIMIT ?)',
+                                     (last_id, AUDIT_BATCH_SESSIONS)).fetchone()[0]
+                if batch is None:
+                    break
+                report = audit_batch(conn, 'gs.id > ? AND gs.id <= ?', (last_id, batch))
+                reports.extend([report] if report else [])
+                last_id = batch
+        else:
+            # Each batch marks its sessions audited, so the next one starts where it stopped
+            while True:
+                report = audit_batch(conn, '''gs.id IN (
+                    SELECT id FROM game_sessions WHERE audit_flags IS NULL LIMIT ?)''', (AUDIT_BATCH_SESSIONS,))
+                if report is None:
+                    break
+                reports.append(report)
+    finally:
+        conn.close()
+
+    report = merge_reports(reports)
+    if report.quarantined or report.released:
+        logger.warning('Game sessions quarantined', extra={
+            'event': 'sessions_quarantined',
+            'quarantined': report.quarantined[:20],
+            'released': report.released[:20],
+            'flag_counts': report.flag_counts,
+        })
+    return report
+
+
+def audit_finished_session(session_id: int) -> bool:
+    """Audit one newly ended session; True when it is quarantined"""
+    audit_sessions([session_id])
+    conn = get_db_connection()
+    if not conn:
+        return False
+    row = conn.execute('SELECT quarantined FROM game_sessions WHERE id = ?', (session_id,)).fetchone()
+    conn.close()
+    return bool(row and row['quarantined'])
+
+
+def init_anti_cheat(app):
+    """Add the `flask audit-sessions` command"""
+    @app.cli.command('audit-sessions')
+    @click.option('--full', is_flag=True, help='re-audit every session, not only new ones')
+    def audit_sessions_command(full):
+        """Flag implausible game sessions and quarantine them from leaderboards"""
+        report = audit_sessions(full=full)
+        rate = report.points / report.seconds if report.seconds else 0
+        click.echo(f"{report.sessions} sessions, {report.points} tracking points in {report.seconds:.2f}s "
+                   f"({rate:,.0f} points/s)")
+        click.echo(f"{report.flagged} flagged: " +
+                   ', '.join(f"{name} {count}" for name, count in report.flag_counts.items()))
+        click.echo(f"{len(report.quarantined)} newly quarantined, {len(report.released)} released")
@@ -1,17 +1,37 @@
 import os
-import logging
 import secrets
+import stat
 from datetime import datetime, timedelta
 from flask import Flask, session
 from flask_session import Session
+from jinja2 import FileSystemBytecodeCache
+from logging_config import configure_logging
+from metrics import init_metrics
+from sqltrace import init_sql_trace
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-
 # Create Flask app
 app = Flask(__name__)
 
+# Configure logging
+configure_logging(app)
+
+# Cache compiled template bytecode on disk so restarted workers skip recompiling.
+# Bytecode is loaded and run, so the directory must be ours and closed to everyone else.
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR')
+
+def jinja_bytecode_cache():
+    """JINJA_CACHE_DIR when set, else Jinja's own per-user directory (which it checks the same way)"""
+    if not JINJA_CACHE_DIR:
+        return FileSystemBytecodeCache()
+    os.makedirs(JINJA_CACHE_DIR, mode=0o700, exist_ok=True)
+    info = os.lstat(JINJA_CACHE_DIR)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"JINJA_CACHE_DIR {JINJA_CACHE_DIR} must be a directory owned by this user with mode 0700")
+    return FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+app.jinja_options = {**app.jinja_options, 'bytecode_cache': jinja_bytecode_cache()}
+
 # Set SECRET_KEY from environment or generate secure default
 # Use standard Flask SECRET_KEY variable, fallback to SESSION_SECRET for backward compatibility
 app.secret_key = os.environ.get("SECRET_KEY") or os.environ.get("SESSION_SECRET") or secrets.token_hex(32)
@@ -25,6 +45,8 @@ app.config['SESSION_KEY_PREFIX'] = 'fitplay:'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
 
 Session(app)
+init_metrics(app)
+init_sql_trace(app)
 
 # Initialize session data
 @app.before_request
@@ -51,13 +73,49 @@ from blueprints.games import games_bp
 from blueprints.dashboard import dashboard_bp
 from blueprints.diet import diet_bp
 from blueprints.auth.auth import auth_bp
+from blueprints.events import events_bp
+from blueprints.jobs import jobs_bp
 from blueprints.auth.auth import get_current_user
+from database import init_database
+from admission import init_admission
+from profiling import init_profiling
+from food_search import get_search_index
+from game_registry import init_game_registry
+from jobs import init_jobs
+from anti_cheat import init_anti_cheat
 
 app.register_blueprint(main_bp)
 app.register_blueprint(games_bp, url_prefix='/games')
 app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
 app.register_blueprint(diet_bp, url_prefix='/diet')
 app.register_blueprint(auth_bp, url_prefix='/auth')
+app.register_blueprint(events_bp, url_prefix='/events')
+app.register_blueprint(jobs_bp, url_prefix='/jobs')
+
+# Rate limits and load shedding run after the session has been initialized
+init_admission(app)
+
+# Create the schema once; with gunicorn's preload_app this runs in the master only
+init_database()
+
+# Build the food search index before forking, so workers share it
+get_search_index()
+init_game_registry()
+
+# Post-game jobs run in worker threads started on first use, or in `flask worker`
+init_jobs(app)
+init_anti_cheat(app)
+
+# Outermost WSGI wrapper, so profiles include session loading and every hook
+init_profiling(app)
+
+def precompile_templates():
+    """Compile every template up front so no request pays the compile cost"""
+    compiled = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+        compiled += 1
+    return compiled
 
 # Global template variables
 @app.context_processor
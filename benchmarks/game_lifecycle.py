@@ -0,0 +1,317 @@
+"""End-to-end benchmark of the game lifecycle: signup, login, play, poll, leaderboard.
+
+Each simulated user signs up and logs in. For every game they open /games/,
+start it, post --updates score updates, end it, poll /dashboard/summary and
+read the leaderboard.
+
+In-process through the Flask test client (runs in a scratch directory, so the
+repo's database is untouched):
+
+    python benchmarks/game_lifecycle.py --mode inprocess --users 20 --games 3
+
+Over HTTP against a running server, from several client processes:
+
+    gunicorn -c gunicorn_config.py app:app
+    python benchmarks/game_lifecycle.py --mode http --url http://127.0.0.1:10000 \\
+        --processes 4 --concurrency 8 --users 64 --db fitness_games.db
+
+Prints (or writes with --output) JSON with throughput, per-endpoint latency
+percentiles, status counts and database growth, tagged with the git commit.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlparse
+
+from load_test import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GAME_TYPES = ['squat_tap', 'jump_counter', 'plank_timer', 'burpee_challenge']
+SUMMARY_POLLS = 3
+
+
+class HTTPClient:
+    """Keep-alive connection that carries the session cookie"""
+
+    def __init__(self, url):
+        target = urlparse(url)
+        self.host, self.port = target.hostname, target.port or 80
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, json_body=None, form=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body)
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.reconnect()
+            return None, b''
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        if response.getheader('Connection', '').lower() == 'close':
+            self.reconnect()
+        return response.status, data
+
+    def reconnect(self):
+        self.conn.close()
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def close(self):
+        self.conn.close()
+
+
+class InProcessClient:
+    """Flask test client with the same interface as HTTPClient"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, form=None):
+        response = self.client.open(path, method=method, json=json_body, data=form)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class Recorder:
+    """Latencies and status counts per endpoint label"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    def call(self, client, label, method, path, **kwargs):
+        started = time.perf_counter()
+        status, body = client.request(method, path, **kwargs)
+        self.latencies.setdefault(label, []).append(time.perf_counter() - started)
+        counts = self.statuses.setdefault(label, {})
+        key = str(status) if status else 'error'
+        counts[key] = counts.get(key, 0) + 1
+        return status, body
+
+    def merge(self, other):
+        for label, values in other.latencies.items():
+            self.latencies.setdefault(label, []).extend(values)
+        for label, counts in other.statuses.items():
+            merged = self.statuses.setdefault(label, {})
+            for key, count in counts.items():
+                merged[key] = merged.get(key, 0) + count
+
+
+def run_journey(client, recorder, games, updates):
+    """One user from signup to their last leaderboard read"""
+    name = f"bench_{uuid.uuid4().hex[:10]}"
+    password = 'benchmark-password'
+    email = f"{name}@example.com"
+    recorder.call(client, 'POST /auth/signup', 'POST', '/auth/signup', form={
+        'username': name, 'email': email, 'password': password, 'confirm_password': password,
+    })
+    recorder.call(client, 'GET /auth/logout', 'GET', '/auth/logout')
+    recorder.call(client, 'POST /auth/login', 'POST', '/auth/login', form={'email': email, 'password': password})
+
+    since = ''
+    for _ in range(games):
+        game_type = random.choice(GAME_TYPES)
+        recorder.call(client, 'GET /games/', 'GET', '/games/')
+        recorder.call(client, 'POST /games/start_game', 'POST', '/games/start_game',
+                      json_body={'game_type': game_type, 'tracking_method': 'manual'})
+        for score in range(1, updates + 1):
+            recorder.call(client, 'POST /games/update_score', 'POST', '/games/update_score',
+                          json_body={'score': score * random.randint(1, 5), 'tracking_data': {'confidence': 0.9}})
+        recorder.call(client, 'POST /games/end_game', 'POST', '/games/end_game')
+
+        for _ in range(SUMMARY_POLLS):
+            status, body = recorder.call(client, 'GET /dashboard/summary', 'GET',
+                                         '/dashboard/summary?' + urlencode({'since': since}))
+            if status == 200:
+                since = json.loads(body).get('version') or ''
+        recorder.call(client, 'GET /games/leaderboard', 'GET', f'/games/leaderboard/{game_type}')
+
+
+def run_threads(make_client, users, concurrency, games, updates):
+    """Spread the users over `concurrency` threads, one client per user"""
+    recorder = Recorder()
+    lock = threading.Lock()
+    remaining = list(range(users))
+
+    def worker():
+        local = Recorder()
+        while True:
+            with lock:
+                if not remaining:
+                    break
+                remaining.pop()
+            client = make_client()
+            try:
+                run_journey(client, local, games, updates)
+            finally:
+                client.close()
+        with lock:
+            recorder.merge(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder
+
+
+def http_process(args):
+    url, users, concurrency, games, updates = args
+    recorder = run_threads(lambda: HTTPClient(url), users, concurrency, games, updates)
+    return recorder.latencies, recorder.statuses
+
+
+def file_size(path):
+    """Database size including its WAL, or None when there is no file"""
+    if not path or not os.path.exists(path):
+        return None
+    size = os.path.getsize(path)
+    if os.path.exists(path + '-wal'):
+        size += os.path.getsize(path + '-wal')
+    return size
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_inprocess(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='fitplay-bench-')
+    os.chdir(workdir)
+    # Logs share stdout with the JSON result
+    os.environ.setdefault('LOG_LEVEL', 'ERROR')
+    os.environ.setdefault('METRICS_DIR', os.path.join(workdir, 'metrics'))
+    os.environ.setdefault('ADMISSION_SHM_PATH', os.path.join(workdir, 'admission'))
+    sys.path.insert(0, REPO_ROOT)
+
+    from app import app
+    import admission
+    import database
+    if args.no_rate_limits:
+        admission.RATE_LIMITS.clear()
+
+    db_path = os.path.join(workdir, database.DATABASE_FILE)
+    before = file_size(db_path)
+    started = time.perf_counter()
+    recorder = run_threads(lambda: InProcessClient(app), args.users, args.concurrency, args.games, args.updates)
+    return recorder, time.perf_counter() - started, db_path, before
+
+
+def run_http(args):
+    before = file_size(args.db)
+    per_process = [args.users // args.processes + (1 if i < args.users % args.processes else 0)
+                   for i in range(args.processes)]
+    jobs = [(args.url, users, args.concurrency, args.games, args.updates) for users in per_process if users]
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    with multiprocessing.Pool(len(jobs)) as pool:
+        for latencies, statuses in pool.map(http_process, jobs):
+            partial = Recorder()
+            partial.latencies, partial.statuses = latencies, statuses
+            recorder.merge(partial)
+    return recorder, time.perf_counter() - started, args.db, before
+
+
+def summarize(args, recorder, elapsed, db_path, before):
+    endpoints = {}
+    total = 0
+    for label, values in sorted(recorder.latencies.items()):
+        values.sort()
+        total += len(values)
+        endpoints[label] = {
+            'requests': len(values),
+            'statuses': recorder.statuses.get(label, {}),
+            'latency_ms': {
+                'mean': round(statistics.fmean(values) * 1000, 2),
+                'p50': round(percentile(values, 50) * 1000, 2),
+                'p95': round(percentile(values, 95) * 1000, 2),
+                'p99': round(percentile(values, 99) * 1000, 2),
+            },
+        }
+    after = file_size(db_path)
+    return {
+        'commit': git_commit(),
+        'mode': args.mode,
+        'users': args.users,
+        'games_per_user': args.games,
+        'updates_per_game': args.updates,
+        'concurrency': args.concurrency,
+        'processes': args.processes if args.mode == 'http' else 1,
+        'elapsed_seconds': round(elapsed, 3),
+        'requests': total,
+        'requests_per_second': round(total / elapsed, 1) if elapsed else 0.0,
+        'games_per_second': round(args.users * args.games / elapsed, 2) if elapsed else 0.0,
+        'endpoints': endpoints,
+        'database': {
+            'path': db_path,
+            'bytes_before': before,
+            'bytes_after': after,
+            'growth_bytes': after - (before or 0) if after is not None else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--games', type=int, default=3, help='games per user')
+    parser.add_argument('--updates', type=int, default=10, help='score updates per game')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads (per process in http mode)')
+    parser.add_argument('--processes', type=int, default=4, help='client processes in http mode')
+    parser.add_argument('--url', default='http://127.0.0.1:10000')
+    parser.add_argument('--db', help="server's database file, to report growth in http mode")
+    parser.add_argument('--workdir', help='directory for the in-process database and sessions')
+    parser.add_argument('--no-rate-limits', action='store_true',
+                        help='disable per-user rate limits in-process, so 429s do not skew latencies')
+    parser.add_argument('--output', help='write the JSON result to this file as well')
+    args = parser.parse_args()
+    # The in-process run changes into its scratch directory
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    if args.mode == 'inprocess':
+        result = summarize(args, *run_inprocess(args))
+    else:
+        result = summarize(args, *run_http(args))
+
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
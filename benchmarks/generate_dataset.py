@@ -0,0 +1,261 @@
+"""Fill a SQLite database with synthetic users and game history for scale testing.
+
+    python benchmarks/generate_dataset.py --db /tmp/fitplay_scale.db \\
+        --users 50000 --sessions 1000000 --points-per-session 8
+
+builds about 10M rows (users, game_sessions, exercise_tracking, game_stats,
+user_streaks, user_achievements) with the app's own schema. Activity per user
+follows a power law, sessions cluster around morning and evening, and scores
+improve with practice along a per-game curve. Point the app at the result by
+running it from the database's directory, or copying it to fitness_games.db.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import (SCHEMA_VERSION, create_audit_indexes, create_schema, create_tracking_indexes,  # noqa: E402
+                      new_session_id)
+from activity_days import rebuild_activity_days  # noqa: E402
+from blueprints.games import calculate_rewards  # noqa: E402
+
+# game: (share of sessions, typical first score, score after long practice as a multiple, minutes)
+GAME_PROFILES = {
+    'squat_tap': (0.35, 30, 3.5, 3.0),
+    'jump_counter': (0.30, 20, 3.0, 2.5),
+    'plank_timer': (0.20, 45, 3.0, 2.0),
+    'burpee_challenge': (0.15, 8, 4.0, 4.0),
+}
+# Plays of one game after which a user has made ~63% of their possible progress
+PRACTICE_SCALE = 25
+
+# Relative share of sessions starting in each local hour: morning and evening peaks
+HOUR_WEIGHTS = [1, 0.5, 0.3, 0.2, 0.3, 1, 3, 6, 5, 3, 2, 2,
+                3, 2, 2, 2, 3, 5, 8, 9, 7, 5, 3, 2]
+TRACKING_METHODS = ['manual', 'camera', 'sensor']
+TRACKING_WEIGHTS = [0.5, 0.3, 0.2]
+
+# Pareto shape for sessions per user; the top 20% of users play about 70% of sessions
+ACTIVITY_ALPHA = 1.16
+
+# Same thresholds as check_and_award_achievements
+SCORE_ACHIEVEMENTS = {
+    'squat_tap': ('squat_master', 100),
+    'jump_counter': ('jump_champion', 50),
+    'plank_timer': ('plank_pro', 120),
+    'burpee_challenge': ('burpee_beast', 25),
+}
+STREAK_ACHIEVEMENTS = [(3, 'streak_3'), (7, 'streak_7'), (30, 'streak_30')]
+
+# Placeholder the width of a real scrypt hash, shared by every generated user
+PASSWORD_HASH = 'scrypt:32768:8:1$' + 'x' * 16 + '$' + '0' * 128
+
+INSERTS = {
+    'users': '''INSERT INTO users (id, username, email, password_hash, created_at, points,
+                calories_burned, time_active, workouts_completed, level, experience)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+    'game_sessions': '''INSERT INTO game_sessions (id, user_id, username, game_type, start_time,
+                        end_time, duration, score, points_earned, calories_burned, tracking_method, raw_data)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+    'exercise_tracking': '''INSERT INTO exercise_tracking (game_session_id, username, timestamp,
+                            exercise_count, tracking_method, sensor_data, confidence_score)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
+    'game_stats': '''INSERT INTO game_stats (username, game_type, games_played, best_score, total_score,
+                     average_score, last_played) VALUES (?, ?, ?, ?, ?, ?, ?)''',
+    'user_streaks': '''INSERT INTO user_streaks (username, current_streak, longest_streak, last_activity_date)
+                       VALUES (?, ?, ?, ?)''',
+    'user_achievements': '''INSERT INTO user_achievements (username, achievement_id, earned_at)
+                            VALUES (?, ?, ?)''',
+}
+
+
+def session_counts(rng, users, sessions):
+    """Sessions per user drawn from a power law, summing to about `sessions`"""
+    weights = [rng.paretovariate(ACTIVITY_ALPHA) for _ in range(users)]
+    scale = sessions / sum(weights)
+    counts = []
+    for weight in weights:
+        expected = weight * scale
+        whole = int(expected)
+        counts.append(whole + (1 if rng.random() < expected - whole else 0))
+    return counts
+
+
+def generate_user(rng, user_id, count, now, days, points_per_session, rows):
+    """Append one user's rows to `rows`, in the order the app would have written them"""
+    username = f"user{user_id:07d}"
+    created = now - timedelta(days=rng.uniform(0, days), hours=rng.uniform(0, 24))
+    active_days = max(1, (now - created).days)
+
+    games = list(GAME_PROFILES)
+    game_weights = [GAME_PROFILES[game][0] for game in games]
+    skill = {game: rng.lognormvariate(0, 0.35) for game in games}
+
+    # Session starts: a day since signup, an hour from the diurnal profile
+    day_offsets = sorted(rng.randrange(active_days) for _ in range(count))
+    hours = rng.choices(range(24), weights=HOUR_WEIGHTS, k=count)
+    created_day = created.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    stats = {}
+    earned = {}
+    points = calories = time_active = 0
+    run = longest = 0
+    last_day = None
+
+    for index, (offset, hour) in enumerate(zip(day_offsets, hours)):
+        game = rng.choices(games, weights=game_weights)[0]
+        _, first_score, ceiling, minutes = GAME_PROFILES[game]
+
+        played = stats.get(game, (0, 0, 0, None))[0]
+        progress = 1 + (ceiling - 1) * (1 - math.exp(-played / PRACTICE_SCALE))
+        score = max(1, int(first_score * skill[game] * progress * rng.lognormvariate(0, 0.25)))
+        duration = max(0.5, rng.gauss(minutes, minutes * 0.3))
+        # Today's sessions can't have started later than now
+        start = min(created_day + timedelta(days=offset, hours=hour, seconds=rng.uniform(0, 3600)),
+                    now - timedelta(minutes=duration))
+        end = start + timedelta(minutes=duration)
+        points_earned, calories_burned = calculate_rewards(game, score, duration)
+        method = rng.choices(TRACKING_METHODS, weights=TRACKING_WEIGHTS)[0]
+        session_id = new_session_id(start.timestamp())
+        start_text = start.isoformat()
+
+        rows['game_sessions'].append((session_id, user_id, username, game, start_text, end.isoformat(),
+                                      duration, score, points_earned, calories_burned, method, '{}'))
+
+        samples = rng.randint(1, 2 * points_per_session - 1) if points_per_session > 0 else 0
+        for sample in range(1, samples + 1):
+            rows['exercise_tracking'].append((
+                session_id,
+                username,
+                (start + timedelta(minutes=duration * sample / samples)).isoformat(),
+                score * sample // samples,
+                method,
+                f'{{"x": {rng.gauss(0, 1):.3f}, "y": {rng.gauss(0, 1):.3f}, "z": {rng.gauss(9.8, 1):.3f}}}',
+                round(rng.uniform(0.6, 1.0), 3),
+            ))
+
+        best, total = stats.get(game, (0, 0, 0, None))[1:3]
+        stats[game] = (played + 1, max(best, score), total + score, start_text)
+        points += points_earned
+        calories += calories_burned
+        time_active += duration
+
+        day = start.date()
+        if day != last_day:
+            run = run + 1 if last_day and (day - last_day).days == 1 else 1
+            longest = max(longest, run)
+            last_day = day
+
+        # Achievements in the order they would have been earned
+        earned.setdefault('first_game', start_text)
+        for threshold, achievement_id in STREAK_ACHIEVEMENTS:
+            if run >= threshold:
+                earned.setdefault(achievement_id, start_text)
+        achievement_id, threshold = SCORE_ACHIEVEMENTS[game]
+        if score >= threshold:
+            earned.setdefault(achievement_id, start_text)
+        if index + 1 >= 100:
+            earned.setdefault('game_addict', start_text)
+        if calories >= 1000:
+            earned.setdefault('calorie_burner', start_text)
+
+    rows['users'].append((user_id, username, f"{username}@example.com", PASSWORD_HASH, created.isoformat(),
+                          points, round(calories, 2), round(time_active, 2), count,
+                          points // 1000 + 1, points))
+    for game, (played, best, total, last_played) in stats.items():
+        rows['game_stats'].append((username, game, played, best, total, total / played, last_played))
+    if last_day:
+        rows['user_streaks'].append((username, run, longest, last_day.isoformat()))
+    for achievement_id, earned_at in earned.items():
+        rows['user_achievements'].append((username, achievement_id, earned_at))
+
+
+def flush_rows(conn, rows, totals):
+    for table, batch in rows.items():
+        if batch:
+            conn.executemany(INSERTS[table], batch)
+            totals[table] += len(batch)
+            batch.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='fitplay_scale.db', help='database to create')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--sessions', type=int, default=200000, help='game sessions across all users')
+    parser.add_argument('--points-per-session', type=int, default=8,
+                        help='average exercise_tracking rows per session')
+    parser.add_argument('--days', type=int, default=365, help='history length')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=50000, help='rows buffered between inserts')
+    parser.add_argument('--force', action='store_true', help='replace an existing database')
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        if not args.force:
+            parser.error(f"{args.db} exists, pass --force to replace it")
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    rng = random.Random(args.seed)
+    now = datetime.now()
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    # Nothing to protect while building from scratch, so skip the journal and fsyncs
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('BEGIN')
+    create_schema(conn.cursor())
+
+    rows = {table: [] for table in INSERTS}
+    totals = {table: 0 for table in INSERTS}
+    buffered = 0
+    reported = started
+    for user_id, count in enumerate(session_counts(rng, args.users, args.sessions), start=1):
+        generate_user(rng, user_id, count, now, args.days, args.points_per_session, rows)
+        buffered += count * (args.points_per_session + 1) + 1
+        if buffered >= args.batch_size:
+            flush_rows(conn, rows, totals)
+            buffered = 0
+            if time.perf_counter() - reported >= 5:
+                reported = time.perf_counter()
+                print(f"{user_id}/{args.users} users, {sum(totals.values())} rows, "
+                      f"{reported - started:.1f}s", file=sys.stderr)
+    flush_rows(conn, rows, totals)
+    # Cheaper to build once the rows are in than to maintain during the inserts
+    create_audit_indexes(conn.cursor())
+    create_tracking_indexes(conn.cursor())
+    rebuild_activity_days(conn.cursor())
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    conn.execute('COMMIT')
+
+    generated = time.perf_counter() - started
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    total_rows = sum(totals.values())
+    print(json.dumps({
+        'database': os.path.abspath(args.db),
+        'rows': totals,
+        'total_rows': total_rows,
+        'seconds': round(elapsed, 1),
+        'rows_per_second': round(total_rows / generated) if generated else 0,
+        'bytes': os.path.getsize(args.db),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""HTTP load test for comparing gunicorn worker profiles.
+
+Start the server first, e.g.
+
+    GUNICORN_PROFILE=gthread gunicorn -c gunicorn_config.py app:app
+
+then run
+
+    python benchmarks/load_test.py --url http://127.0.0.1:10000 --concurrency 32 --duration 20
+"""
+import argparse
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from urllib.parse import urlparse
+
+# Read-heavy mix of the pages and JSON endpoints a logged-in tab hits
+REQUEST_MIX = [
+    ('/', 2),
+    ('/games/', 2),
+    ('/games/game_data', 2),
+    ('/games/leaderboard/squat_tap', 2),
+    ('/dashboard/stats', 4),
+    ('/dashboard/weekly_progress', 2),
+    ('/dashboard/achievement_progress', 2),
+    ('/diet/', 1),
+]
+
+
+def run_client(host, port, deadline, latencies, errors, lock):
+    """Issue requests over one keep-alive connection until the deadline"""
+    paths = [path for path, weight in REQUEST_MIX for _ in range(weight)]
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    cookie = None
+    local_latencies = []
+    local_errors = 0
+
+    while time.perf_counter() < deadline:
+        path = random.choice(paths)
+        headers = {'Cookie': cookie} if cookie else {}
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        local_latencies.append(time.perf_counter() - started)
+
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            cookie = set_cookie.split(';', 1)[0]
+        if response.status >= 500:
+            local_errors += 1
+        if response.getheader('Connection', '').lower() == 'close':
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:10000')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20.0)
+    args = parser.parse_args()
+
+    target = urlparse(args.url)
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    threads = [
+        threading.Thread(target=run_client,
+                         args=(target.hostname, target.port or 80, deadline, latencies, errors, lock))
+        for _ in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(json.dumps({
+        'concurrency': args.concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p95': round(percentile(latencies, 95) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2),
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Latency of the cached read helpers against computing their results each time.
+
+    python benchmarks/generate_dataset.py --db /tmp/fitplay_scale.db --sessions 200000
+    python benchmarks/result_cache.py --db /tmp/fitplay_scale.db
+
+times user stats, exercise history and leaderboards for sampled users and
+games three ways: uncached (the helper's own queries), a hit in the process's
+LRU, and a hit in the on-disk tier (LRU cleared before each call, as in a
+worker that has not seen the key yet). Medians and p99 over --samples calls
+each. The --db database is only read.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import result_cache  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+
+def timed(call, arguments, before=None):
+    timings = []
+    for args in arguments:
+        if before:
+            before()
+        started = time.perf_counter()
+        call(*args)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {'p50_ms': round(percentile(timings, 50) * 1000, 3), 'p99_ms': round(percentile(timings, 99) * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='generated database to read')
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database.DATABASE_FILE = args.db
+    from blueprints import games
+
+    conn = database.get_db_connection()
+    usernames = [row[0] for row in conn.execute('SELECT username FROM users')]
+    game_types = [row[0] for row in conn.execute('SELECT DISTINCT game_type FROM game_stats')]
+    conn.close()
+    rng = random.Random(args.seed)
+    today = date.today()
+    helpers = {
+        'user_stats': (games.load_user_stats, [(name, today) for name in rng.sample(usernames, args.samples)]),
+        'exercise_history': (games.load_exercise_history, [(name,) for name in rng.sample(usernames, args.samples)]),
+        'leaderboard': (games.load_leaderboard, [(rng.choice(game_types),) for _ in range(args.samples)]),
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        result_cache._generations = result_cache.TagGenerations(os.path.join(scratch, 'tags'))
+        result_cache._cache = result_cache.ResultCache(max_entries=4 * args.samples,
+                                                       directory=os.path.join(scratch, 'disk'))
+        for name, (helper, arguments) in helpers.items():
+            results[name] = {'uncached': timed(helper.__wrapped__, arguments)}
+            # Fill both tiers, then read from each
+            for values in arguments:
+                helper(*values)
+            results[name]['lru_hit'] = timed(helper, arguments)
+            results[name]['disk_hit'] = timed(helper, arguments, before=result_cache._cache.clear)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
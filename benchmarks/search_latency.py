@@ -0,0 +1,141 @@
+"""Measure food search latency over a large synthetic catalogue.
+
+    python benchmarks/search_latency.py --items 100000 --queries 2000
+
+builds a FoodSearchIndex over generated names ("smoked turkey breast wrap",
+"greek yogurt with honey" ...) and times prefix, multi-word and misspelled
+queries the way autocomplete sends them, one keystroke at a time, against a
+substring scan of every name. Latencies are in microseconds.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from food_search import FoodSearchIndex, normalize  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+STYLES = ['grilled', 'baked', 'smoked', 'roasted', 'steamed', 'raw', 'fried', 'poached',
+          'spicy', 'sweet', 'organic', 'low fat', 'wholegrain', 'homemade', 'frozen', 'greek']
+BASES = ['chicken', 'turkey', 'salmon', 'tuna', 'beef', 'pork', 'tofu', 'tempeh', 'egg',
+         'yogurt', 'cheese', 'oats', 'rice', 'quinoa', 'pasta', 'bread', 'potato', 'lentil',
+         'chickpea', 'bean', 'spinach', 'broccoli', 'kale', 'avocado', 'banana', 'apple',
+         'blueberry', 'strawberry', 'almond', 'peanut', 'walnut', 'cashew', 'mushroom', 'pepper']
+FORMS = ['breast', 'thigh', 'fillet', 'salad', 'wrap', 'bowl', 'soup', 'stew', 'curry',
+         'sandwich', 'smoothie', 'bar', 'muffin', 'pancake', 'omelette', 'burger', 'butter',
+         'chips', 'porridge', 'skewers', 'pie', 'risotto', 'noodles', 'shake']
+EXTRAS = ['with honey', 'with garlic', 'with herbs', 'with lemon', 'with rice', 'with cheese',
+          'in tomato sauce', 'in coconut milk', 'mini', 'family size']
+
+
+def catalogue(rng, count):
+    """Distinct, plausible food names"""
+    names = set()
+    while len(names) < count:
+        parts = []
+        if rng.random() < 0.6:
+            parts.append(rng.choice(STYLES))
+        parts.append(rng.choice(BASES))
+        if rng.random() < 0.8:
+            parts.append(rng.choice(FORMS))
+        if rng.random() < 0.4:
+            parts.append(rng.choice(EXTRAS))
+        if rng.random() < 0.3:
+            parts.append(str(rng.randint(1, 999)))
+        names.add(' '.join(parts).capitalize())
+    return sorted(names)
+
+
+def misspell(rng, word):
+    """One dropped, doubled or swapped letter"""
+    if len(word) < 4:
+        return word
+    at = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(['drop', 'double', 'swap'])
+    if edit == 'drop':
+        return word[:at] + word[at + 1:]
+    if edit == 'double':
+        return word[:at] + word[at] + word[at:]
+    return word[:at - 1] + word[at] + word[at - 1] + word[at + 1:]
+
+
+def query_sets(rng, names, count):
+    prefix, multi, typo = [], [], []
+    for _ in range(count):
+        words = normalize(rng.choice(names)).split()
+        word = rng.choice(words)
+        # Every keystroke of one word
+        prefix.extend(word[:length] for length in range(1, len(word) + 1))
+        if len(words) > 1:
+            last = words[-1]
+            multi.append(' '.join(words[:-1] + [last[:rng.randint(1, len(last))]]))
+        typo.append(misspell(rng, max(words, key=len)))
+    return {'prefix': prefix, 'multi_word': multi, 'typo': typo}
+
+
+def naive_search(names, query, limit):
+    """Baseline: substring scan of every lowercased name"""
+    needle = query.lower()
+    results = []
+    for name in names:
+        if needle in name:
+            results.append(name)
+            if len(results) == limit:
+                break
+    return results
+
+
+def time_queries(search, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return {
+        'queries': len(timings),
+        'mean_us': round(sum(timings) / len(timings), 1) if timings else 0.0,
+        'p50_us': round(percentile(timings, 50), 1),
+        'p95_us': round(percentile(timings, 95), 1),
+        'p99_us': round(percentile(timings, 99), 1),
+        'max_us': round(timings[-1], 1) if timings else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000, help='catalogue size')
+    parser.add_argument('--queries', type=int, default=2000, help='words typed per query kind')
+    parser.add_argument('--limit', type=int, default=10, help='results per query')
+    parser.add_argument('--baseline-queries', type=int, default=200,
+                        help='queries timed against the substring scan, which is slow')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = catalogue(rng, args.items)
+    queries = query_sets(rng, names, args.queries)
+
+    started = time.perf_counter()
+    index = FoodSearchIndex(names, limit=args.limit)
+    build_seconds = time.perf_counter() - started
+
+    lowered = [name.lower() for name in names]
+    fuzzy_hits = sum(1 for query in queries['typo'] if index.search(query)['results'])
+    print(json.dumps({
+        'items': len(index),
+        'build_seconds': round(build_seconds, 2),
+        'index': {kind: time_queries(index.search, batch) for kind, batch in queries.items()},
+        'typo_queries_with_results': round(fuzzy_hits / len(queries['typo']), 3),
+        'substring_scan': {kind: time_queries(lambda query: naive_search(lowered, query, args.limit),
+                                              batch[:args.baseline_queries])
+                           for kind, batch in queries.items()},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Compare JSON and binary frame uploads of sensor streams: bytes on the wire and decode time.
+
+    python benchmarks/sensor_ingest.py --seconds 300 --rate 50
+
+generates an accelerometer stream (and a 17-keypoint pose stream) of the given
+length and reports, for each upload format, the request body size, what
+exercise_tracking keeps, and percentiles for decoding the body into a NumPy
+array and for decoding plus counting reps. Latencies are in microseconds.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rep_counter import count_reps  # noqa: E402
+from sensor_frames import encode_frame, frame_from_json, parse_frame  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+POSE_KEYPOINTS = 17
+
+
+def accelerometer_stream(rng, seconds, rate):
+    """Squats every ~2.5 s: vertical acceleration around gravity plus sensor noise"""
+    t = np.arange(int(seconds * rate)) / rate
+    vertical = 9.81 + 3.0 * np.sin(2 * np.pi * t / 2.5)
+    return np.column_stack([rng.normal(0, 0.4, len(t)), rng.normal(0, 0.4, len(t)),
+                            vertical + rng.normal(0, 0.4, len(t))])
+
+
+def pose_stream(rng, seconds, rate):
+    t = np.arange(int(seconds * rate)) / rate
+    xs = np.tile(np.linspace(0.3, 0.7, POSE_KEYPOINTS), (len(t), 1))
+    ys = np.linspace(0.1, 0.9, POSE_KEYPOINTS) + 0.08 * np.sin(2 * np.pi * t / 2.5)[:, None]
+    return np.stack([xs, ys + rng.normal(0, 0.005, ys.shape)], axis=2)
+
+
+def timed(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return {'p50_us': round(percentile(timings, 50), 1), 'p99_us': round(percentile(timings, 99), 1)}
+
+
+def compare(samples, kind, rate, repeats):
+    json_body = json.dumps({'sensor_samples': {'kind': kind, 'sample_rate': rate,
+                                               'samples': samples.tolist()}}).encode()
+    frame_body = encode_frame(samples, kind, rate)
+
+    def decode_json():
+        return frame_from_json(json.loads(json_body)['sensor_samples'])[1]
+
+    def decode_frame():
+        return parse_frame(frame_body)
+
+    results = {}
+    for name, body, decode in (('json', json_body, decode_json), ('frame', frame_body, decode_frame)):
+        results[name] = {
+            'body_bytes': len(body),
+            # Both formats are stored as the frame BLOB
+            'stored_bytes': len(frame_body),
+            'decode': timed(decode, repeats),
+            'decode_and_count': timed(lambda: count_reps(decode().samples, rate, 'squat', kind), repeats),
+        }
+    # What storing the samples with json.dumps into sensor_data would have taken
+    results['json']['stored_bytes_as_json_text'] = len(json.dumps(samples.tolist()))
+    results['size_ratio'] = round(len(json_body) / len(frame_body), 1)
+    results['decode_speedup'] = round(results['json']['decode']['p50_us'] / max(results['frame']['decode']['p50_us'], 0.1), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=300, help='stream length')
+    parser.add_argument('--rate', type=float, default=50, help='samples per second')
+    parser.add_argument('--repeats', type=int, default=50, help='timed decodes per format')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(json.dumps({
+        'seconds': args.seconds,
+        'sample_rate': args.rate,
+        'accelerometer': compare(accelerometer_stream(rng, args.seconds, args.rate), 'accelerometer',
+                                 args.rate, args.repeats),
+        'pose': compare(pose_stream(rng, args.seconds, args.rate), 'pose', args.rate, args.repeats),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Throughput of the anti-cheat session audit, in memory and against a generated database.
+
+    python benchmarks/generate_dataset.py --db /tmp/fitplay_scale.db --sessions 200000
+    python benchmarks/session_audit.py --db /tmp/fitplay_scale.db
+
+times audit_arrays on synthetic sessions (a share of them doctored with score
+jumps, impossible rates and out-of-order points) and checks that the doctored
+ones are caught. With --db it also times a full audit of the database, reading
+from SQLite included, and reports the flag counts.
+A --db audit writes its flags, and quarantines what it catches, like
+`flask audit-sessions --full`.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anti_cheat  # noqa: E402
+import database  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+
+def synthetic_sessions(rng, sessions, points_per_session, cheat_share):
+    """Honest squat sessions (at most one rep per second), some doctored"""
+    lengths = rng.integers(1, 2 * points_per_session, sessions)
+    session_index = np.repeat(np.arange(sessions), lengths)
+    starts = rng.uniform(1.7e9, 1.73e9, sessions)
+    durations = rng.uniform(60, 300, sessions)
+    ends = starts + durations
+    # Points spread evenly over the session, running score at half the maximum pace
+    position = np.arange(len(session_index)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    fraction = (position + 1) / np.repeat(lengths, lengths)
+    times = starts[session_index] + fraction * durations[session_index]
+    counts = np.floor(0.5 * (times - starts[session_index]))
+    scores = np.zeros(sessions)
+    last = np.cumsum(lengths) - 1
+    scores[session_index[last]] = counts[last]
+
+    cheats = rng.random(sessions) < cheat_share
+    kind = rng.integers(0, 3, sessions)
+    jumped = cheats & (kind == 0)
+    counts[last[jumped]] += 1000
+    scores[jumped] += 1000
+    scores[cheats & (kind == 1)] += 10000
+    swapped = cheats & (kind == 2) & (lengths > 1)
+    times[last[swapped]] = times[last[swapped] - 1] - 5
+    max_rates = np.full(sessions, anti_cheat.max_units_per_second('squat_tap'))
+    return (session_index, times, counts, starts, ends, scores, max_rates), cheats & ((kind != 2) | swapped)
+
+
+def bench_arrays(args):
+    rng = np.random.default_rng(args.seed)
+    arrays, cheats = synthetic_sessions(rng, args.sessions, args.points_per_session, args.cheat_share)
+    timings = []
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+        flags = anti_cheat.audit_arrays(*arrays)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    points = len(arrays[0])
+    return {
+        'sessions': args.sessions,
+        'points': points,
+        'p50_ms': round(percentile(timings, 50) * 1000, 1),
+        'points_per_second': round(points / percentile(timings, 50)),
+        'doctored': int(cheats.sum()),
+        'caught': int(((flags != 0) & cheats).sum()),
+        'false_positives': int(((flags != 0) & ~cheats).sum()),
+    }
+
+
+def bench_database(path):
+    database.DATABASE_FILE = path
+    database.init_database()
+    report = anti_cheat.audit_sessions(full=True)
+    return {
+        'sessions': report.sessions,
+        'points': report.points,
+        'seconds': round(report.seconds, 2),
+        'points_per_second': round(report.points / report.seconds) if report.seconds else 0,
+        'flagged': report.flagged,
+        'flag_counts': report.flag_counts,
+        'quarantined': len(report.quarantined),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=500000, help='synthetic sessions audited in memory')
+    parser.add_argument('--points-per-session', type=int, default=8)
+    parser.add_argument('--cheat-share', type=float, default=0.01, help='share of doctored synthetic sessions')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--db', help='generated database to audit in full (its flags are updated)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    results = {'in_memory': bench_arrays(args)}
+    if args.db:
+        results['database'] = bench_database(args.db)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Index sizes and join speed of TEXT versus integer game session keys.
+
+    python benchmarks/generate_dataset.py --db /tmp/fitplay_scale.db --sessions 200000
+    python benchmarks/session_keys.py --db /tmp/fitplay_scale.db
+
+copies the generated game_sessions and exercise_tracking rows into a scratch
+database laid out as before schema 7 (session_id TEXT keys of the form
+<username>_<game>_<timestamp>, tracking rows joined on them), measures it,
+runs the schema 7 migration on it and measures again. Sizes come from the
+dbstat table; query timings are medians over --repeats runs. The --db database
+is only read.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+LEGACY_SCHEMA = [
+    '''CREATE TABLE game_sessions (
+        session_id TEXT PRIMARY KEY, user_id INTEGER, username TEXT, game_type TEXT,
+        start_time TIMESTAMP, end_time TIMESTAMP, duration REAL, score INTEGER, points_earned INTEGER,
+        calories_burned REAL, tracking_method TEXT, raw_data TEXT, audit_flags INTEGER,
+        quarantined INTEGER DEFAULT 0)''',
+    '''CREATE TABLE exercise_tracking (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, timestamp TIMESTAMP, exercise_count INTEGER,
+        tracking_method TEXT, sensor_data TEXT, sensor_frame BLOB, confidence_score REAL)''',
+]
+LEGACY_INDEXES = [
+    'CREATE INDEX idx_exercise_tracking_session ON exercise_tracking (session_id)',
+    'CREATE INDEX idx_game_sessions_user_game ON game_sessions (username, game_type)',
+    'CREATE INDEX idx_game_sessions_unaudited ON game_sessions (audit_flags) WHERE audit_flags IS NULL',
+]
+# Indexes that exist to find sessions and their tracking rows by key
+KEY_INDEXES = {'sqlite_autoindex_game_sessions_1', 'idx_exercise_tracking_session', 'idx_exercise_tracking_game_session'}
+TABLES = ('game_sessions', 'exercise_tracking')
+
+# The same questions asked of each layout
+QUERIES = {
+    'legacy': {
+        'history': '''SELECT et.*, gs.game_type, gs.score, gs.start_time, gs.duration
+                      FROM exercise_tracking et LEFT JOIN game_sessions gs ON et.session_id = gs.session_id
+                      WHERE gs.username = ? OR et.session_id LIKE ?
+                      ORDER BY et.timestamp DESC LIMIT 50''',
+        'session_points': '''SELECT et.timestamp, et.exercise_count FROM game_sessions gs
+                             JOIN exercise_tracking et ON et.session_id = gs.session_id
+                             WHERE gs.session_id = ? ORDER BY et.id''',
+        'full_join': '''SELECT COUNT(*), SUM(et.exercise_count) FROM game_sessions gs
+                        JOIN exercise_tracking et ON et.session_id = gs.session_id''',
+    },
+    'integer': {
+        'history': '''SELECT et.*, gs.game_type, gs.score, gs.start_time, gs.duration
+                      FROM exercise_tracking et LEFT JOIN game_sessions gs ON et.game_session_id = gs.id
+                      WHERE et.username = ?
+                      ORDER BY et.timestamp DESC LIMIT 50''',
+        'session_points': '''SELECT et.timestamp, et.exercise_count FROM game_sessions gs
+                             JOIN exercise_tracking et ON et.game_session_id = gs.id
+                             WHERE gs.id = ? ORDER BY et.id''',
+        'full_join': '''SELECT COUNT(*), SUM(et.exercise_count) FROM game_sessions gs
+                        JOIN exercise_tracking et ON et.game_session_id = gs.id''',
+    },
+}
+
+
+def build_legacy(source, path):
+    """A pre-schema-7 copy of source's game_sessions and exercise_tracking rows"""
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('ATTACH DATABASE ? AS source', (f'file:{source}?mode=ro',))
+    conn.execute('BEGIN')
+    for statement in LEGACY_SCHEMA:
+        conn.execute(statement)
+    conn.execute('''
+        INSERT INTO game_sessions
+        SELECT username || '_' || game_type || '_' || ((julianday(start_time) - 2440587.5) * 86400),
+               user_id, username, game_type, start_time, end_time, duration, score, points_earned,
+               calories_burned, tracking_method, raw_data, audit_flags, quarantined
+        FROM source.game_sessions ORDER BY id
+    ''')
+    conn.execute('''
+        INSERT INTO exercise_tracking
+        SELECT et.id, gs.username || '_' || gs.game_type || '_' || ((julianday(gs.start_time) - 2440587.5) * 86400),
+               et.timestamp, et.exercise_count, et.tracking_method, et.sensor_data, et.sensor_frame,
+               et.confidence_score
+        FROM source.exercise_tracking et JOIN source.game_sessions gs ON gs.id = et.game_session_id
+        ORDER BY et.id
+    ''')
+    for statement in LEGACY_INDEXES:
+        conn.execute(statement)
+    conn.execute('COMMIT')
+    conn.execute('DETACH DATABASE source')
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def sizes(conn):
+    """Bytes used by the two tables and each of their indexes"""
+    names = conn.execute(f'''
+        SELECT name FROM sqlite_master WHERE tbl_name IN ({','.join('?' * len(TABLES))}) ORDER BY name
+    ''', TABLES).fetchall()
+    return {name: conn.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = ?', (name,)).fetchone()[0]
+            for name, in names}
+
+
+def time_queries(conn, queries, samples, repeats):
+    """Median milliseconds per query, each run over all its samples"""
+    results = {}
+    for name, params in samples.items():
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            for values in params:
+                conn.execute(queries[name], values).fetchall()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        results[f'{name}_ms'] = round(percentile(timings, 50) * 1000 / len(params), 3)
+    return results
+
+
+def measure(conn, layout, usernames, keys, repeats):
+    index_sizes = sizes(conn)
+    samples = {
+        'history': ([(name, f'manual_{name}%') for name in usernames] if layout == 'legacy'
+                    else [(name,) for name in usernames]),
+        'session_points': [(key,) for key in keys],
+        'full_join': [()],
+    }
+    return {
+        'bytes': index_sizes,
+        'table_bytes': sum(size for name, size in index_sizes.items() if name in TABLES),
+        'key_index_bytes': sum(size for name, size in index_sizes.items() if name in KEY_INDEXES),
+        'index_bytes': sum(size for name, size in index_sizes.items() if name not in TABLES),
+        'queries': time_queries(conn, QUERIES[layout], samples, repeats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='generated database (schema 7) to copy rows from')
+    parser.add_argument('--users', type=int, default=200, help='users whose history is queried')
+    parser.add_argument('--lookups', type=int, default=2000, help='sessions whose points are looked up')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, 'legacy.db')
+        started = time.perf_counter()
+        build_legacy(args.db, path)
+        copied = time.perf_counter() - started
+
+        conn = sqlite3.connect(path, isolation_level=None)
+        usernames = rng.sample([name for name, in conn.execute('SELECT DISTINCT username FROM game_sessions')],
+                               args.users)
+        # The migration keeps each session's rowid as its id, so both layouts look up the same sessions
+        lookups = rng.sample(conn.execute('SELECT rowid, session_id FROM game_sessions').fetchall(), args.lookups)
+        results = {'sessions': conn.execute('SELECT COUNT(*) FROM game_sessions').fetchone()[0],
+                   'tracking_rows': conn.execute('SELECT COUNT(*) FROM exercise_tracking').fetchone()[0],
+                   'copy_seconds': round(copied, 2),
+                   'legacy': measure(conn, 'legacy', usernames, [key for _, key in lookups], args.repeats)}
+
+        # The migration as init_database runs it, then VACUUM to give back the pages of the old tables
+        started = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        database.rekey_game_sessions(conn.cursor())
+        conn.execute('COMMIT')
+        results['migration_seconds'] = round(time.perf_counter() - started, 2)
+        conn.execute('VACUUM')
+        conn.execute('ANALYZE')
+
+        results['integer'] = measure(conn, 'integer', usernames, [rowid for rowid, _ in lookups], args.repeats)
+        conn.close()
+
+    # idx_exercise_tracking_user is new (history by owner), so key indexes are compared on their own
+    for measured in ('table_bytes', 'key_index_bytes'):
+        results[f'{measured}_saved'] = results['legacy'][measured] - results['integer'][measured]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
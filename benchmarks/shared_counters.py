@@ -0,0 +1,105 @@
+"""Increment throughput of the shared-memory live counters against a SQLite row per counter.
+
+    python benchmarks/live_counters.py --processes 9
+
+forks --processes workers (like gunicorn's sync profile) that each bump a
+counter --increments times: once into their own shared-memory slot, and once
+with an upsert into SQLite, the write every request would otherwise make.
+Also times reading the totals, which every page showing them does.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import live_counters  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+
+def run_workers(processes, work):
+    """Fork workers running work(slot) and return the wall time until all finish"""
+    started = time.perf_counter()
+    children = []
+    for slot in range(1, processes + 1):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                work(slot)
+            finally:
+                os._exit(0)
+        children.append(pid)
+    for pid in children:
+        os.waitpid(pid, 0)
+    return time.perf_counter() - started
+
+
+def bench_shared_memory(counters, args):
+    def work(slot):
+        counters.slot = slot
+        for _ in range(args.increments):
+            counters.add('reps')
+
+    seconds = run_workers(args.processes, work)
+    timings = []
+    for _ in range(args.reads):
+        started = time.perf_counter()
+        live_counters.live_stats()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        'increments_per_second': round(args.processes * args.increments / seconds),
+        'total': counters.totals()['reps'],
+        'read_p50_us': round(percentile(timings, 50) * 1e6, 1),
+    }
+
+
+def bench_sqlite(path, args):
+    def work(slot):
+        conn = sqlite3.connect(path, timeout=60)
+        for _ in range(args.sqlite_increments):
+            conn.execute('''INSERT INTO live_counters (day, name, value) VALUES ('today', 'reps', 1)
+                            ON CONFLICT(day, name) DO UPDATE SET value = value + 1''')
+            conn.commit()
+        conn.close()
+
+    seconds = run_workers(args.processes, work)
+    conn = sqlite3.connect(path)
+    total = conn.execute("SELECT value FROM live_counters WHERE day = 'today' AND name = 'reps'").fetchone()[0]
+    conn.close()
+    return {
+        'increments_per_second': round(args.processes * args.sqlite_increments / seconds),
+        'total': total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=os.cpu_count() * 2 + 1)
+    parser.add_argument('--increments', type=int, default=100000, help='shared-memory increments per process')
+    parser.add_argument('--sqlite-increments', type=int, default=500, help='SQLite upserts per process')
+    parser.add_argument('--reads', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        database.DATABASE_FILE = os.path.join(scratch, 'counters.db')
+        database.init_database()
+        counters = live_counters.create_counters()
+        try:
+            results = {
+                'processes': args.processes,
+                'shared_memory': bench_shared_memory(counters, args),
+                'sqlite': bench_sqlite(database.DATABASE_FILE, args),
+            }
+        finally:
+            live_counters.close_counters()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Cost of the daily usage check: shared usage table against counting usage_log rows.
+
+    python benchmarks/usage_limit.py --users 2000 --processes 9
+
+fills usage_log with --minutes active minutes for each of --users users over
+the last day, then times the limit check both ways: usage_minutes() (a read
+of the shared table once the user is loaded) and a COUNT over the user's
+usage_log rows, the query a database-backed check would run. Also times
+record_usage() from --processes forked workers, flushing as the app does.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import usage_tracker  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+
+def fill_log(path, usernames, args, rng):
+    now = usage_tracker.current_minute()
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT OR IGNORE INTO usage_log (username, minute) VALUES (?, ?)',
+                     [(username, now - offset) for username in usernames
+                      for offset in rng.sample(range(1, usage_tracker.WINDOW_MINUTES), args.minutes)])
+    conn.commit()
+    conn.close()
+
+
+def time_checks(check, usernames, rng, checks):
+    timings = []
+    for _ in range(checks):
+        username = rng.choice(usernames)
+        started = time.perf_counter()
+        check(username)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {'p50_us': round(percentile(timings, 50) * 1e6, 1), 'p99_us': round(percentile(timings, 99) * 1e6, 1)}
+
+
+def bench_records(usernames, args):
+    started = time.perf_counter()
+    children = []
+    for worker in range(args.processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                rng = random.Random(worker)
+                for _ in range(args.records):
+                    usage_tracker.record_usage(rng.choice(usernames))
+                usage_tracker._log.flush()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    for pid in children:
+        os.waitpid(pid, 0)
+    return round(args.processes * args.records / (time.perf_counter() - started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--minutes', type=int, default=90, help='active minutes per user in the last day')
+    parser.add_argument('--checks', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() * 2 + 1)
+    parser.add_argument('--records', type=int, default=20000, help='record_usage calls per process')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    usernames = [f'user{number}' for number in range(args.users)]
+    with tempfile.TemporaryDirectory() as scratch:
+        database.DATABASE_FILE = os.path.join(scratch, 'usage.db')
+        database.init_database()
+        usage_tracker._table = usage_tracker.UsageTable(os.path.join(scratch, 'usage-table'))
+        fill_log(database.DATABASE_FILE, usernames, args, rng)
+
+        started = time.perf_counter()
+        for username in usernames:
+            usage_tracker.usage_minutes(username)
+        loaded = time.perf_counter() - started
+
+        conn = sqlite3.connect(database.DATABASE_FILE)
+
+        def count_rows(username):
+            conn.execute('SELECT COUNT(*) FROM usage_log WHERE username = ? AND minute > ?',
+                         (username, usage_tracker.current_minute() - usage_tracker.WINDOW_MINUTES)).fetchone()
+
+        results = {
+            'users': args.users,
+            'load_from_log_ms_per_user': round(loaded * 1000 / args.users, 3),
+            'check_shared_table': time_checks(usage_tracker.usage_minutes, usernames, rng, args.checks),
+            'check_sql_count': time_checks(count_rows, usernames, rng, args.checks),
+            'processes': args.processes,
+            'records_per_second': bench_records(usernames, args),
+        }
+        conn.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
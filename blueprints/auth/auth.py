@@ -5,6 +5,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 import uuid
 from datetime import datetime
+from conditional import bump_user_version
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -219,6 +220,7 @@ def update_profile():
             pass
     
     save_users(users)
+    bump_user_version()
     flash('Profile updated successfully!', 'success')
     return redirect(url_for('auth.profile'))
 
@@ -263,6 +265,7 @@ def update_xp():
             flash(f'Congratulations! You reached level {new_level}!', 'success')
         
         save_users(users)
+        bump_user_version()
         return jsonify({'success': True, 'new_xp': new_xp, 'level': new_level})
     
     return jsonify({'success': False}), 400
\ No newline at end of file
@@ -1,6 +1,9 @@
-from flask import Blueprint, render_template, jsonify, session
-from datetime import datetime, timedelta
+from flask import Blueprint, render_template, jsonify, session, request
+from datetime import datetime, date, timedelta
+import hashlib
 import json
+from conditional import conditional_response, user_version_key, get_versions
+from live_counters import live_stats
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -12,21 +15,28 @@ def dashboard():
     
     return render_template('dashboard.html', 
                          weekly_data=weekly_data,
-                         recent_activities=recent_activities)
+                         recent_activities=recent_activities,
+                         live=live_stats())
 
 @dashboard_bp.route('/stats')
+@conditional_response(lambda: [user_version_key()])
 def stats():
     """Return current user statistics"""
-    return jsonify({
+    return jsonify(get_stats())
+
+def get_stats():
+    """Current user statistics from the session"""
+    return {
         'points': session.get('points', 0),
         'badges': len(session.get('badges', [])),
         'workouts_completed': session.get('workouts_completed', 0),
         'calories_burned': session.get('calories_burned', 0),
         'time_active': session.get('time_active', 0),
         'daily_usage': session.get('daily_usage', 0)
-    })
+    }
 
 @dashboard_bp.route('/weekly_progress')
+@conditional_response(lambda: [user_version_key()], vary=lambda: date.today().isoformat())
 def weekly_progress():
     """Return weekly progress data for charts"""
     return jsonify(calculate_weekly_progress())
@@ -79,8 +89,13 @@ def get_recent_activities():
     return formatted_activities
 
 @dashboard_bp.route('/achievement_progress')
+@conditional_response(lambda: [user_version_key()])
 def achievement_progress():
     """Return progress towards next achievements"""
+    return jsonify(get_achievement_progress())
+
+def get_achievement_progress():
+    """Progress towards the next achievements"""
     progress = {
         'next_workout': {
             'name': 'Workout Streak',
@@ -105,4 +120,53 @@ def achievement_progress():
         }
     }
     
-    return jsonify(progress)
+    return progress
+
+# Sections of /summary, and whether each one also changes with the date
+SUMMARY_SECTIONS = {
+    'stats': (get_stats, False),
+    'achievement_progress': (get_achievement_progress, False),
+    'weekly_progress': (calculate_weekly_progress, True),
+}
+
+def summary_section_tokens():
+    """Version token per summary section, computed without building the sections"""
+    key = user_version_key()
+    versions = get_versions([key])
+    if versions is None:
+        return None
+    
+    user_version = versions.get(key, (0, None))[0]
+    scope = f"{session.get('user_id')}|{getattr(session, 'sid', '')}|{user_version}"
+    today = date.today().isoformat()
+    
+    tokens = {}
+    for name, (_, dated) in SUMMARY_SECTIONS.items():
+        source = f"{name}|{scope}|{today if dated else ''}"
+        tokens[name] = hashlib.sha1(source.encode()).hexdigest()[:12]
+    return tokens
+
+@dashboard_bp.route('/summary')
+def summary():
+    """Stats, achievement progress and weekly progress in one response.
+    
+    Pass the previous response's `version` as `since` to receive only the
+    sections that changed since then.
+    """
+    tokens = summary_section_tokens()
+    
+    since = {}
+    for part in request.args.get('since', '').split('.'):
+        if ':' in part:
+            name, token = part.split(':', 1)
+            since[name] = token
+    
+    sections = {}
+    for name, (build, _) in SUMMARY_SECTIONS.items():
+        if tokens is None or since.get(name) != tokens[name]:
+            sections[name] = build()
+    
+    return jsonify({
+        'version': '.'.join(f"{name}:{token}" for name, token in tokens.items()) if tokens else None,
+        'sections': sections
+    })
@@ -1,12 +1,17 @@
 from flask import Blueprint, render_template, request, jsonify, session, flash, redirect, url_for
-from models import DIET_RECOMMENDATIONS
+from nutrition import get_planner, nutrient_dict
+from food_search import get_search_index
+from conditional import bump_user_version
 import random
+from datetime import date, timedelta
+from functools import lru_cache
+from types import MappingProxyType
 
 diet_bp = Blueprint('diet', __name__)
 
 @diet_bp.route('/')
 def diet():
-    current_plan = get_personalized_diet_plan()
+    current_plan = get_current_diet_plan()
     return render_template('diet.html', diet_plan=current_plan)
 
 @diet_bp.route('/update_goals', methods=['POST'])
@@ -18,10 +23,10 @@ def update_goals():
     session['age'] = age
     session['weight'] = weight
     session['fitness_goal'] = fitness_goal
+    bump_user_version()
     
     # Generate new diet plan
-    new_plan = get_personalized_diet_plan()
-    session['diet_plan'] = new_plan
+    get_current_diet_plan()
     
     flash('Diet plan updated successfully!', 'success')
     return redirect(url_for('diet.diet'))
@@ -29,21 +34,80 @@ def update_goals():
 @diet_bp.route('/generate_plan')
 def generate_plan():
     """Generate a new personalized diet plan"""
-    plan = get_personalized_diet_plan()
-    session['diet_plan'] = plan
-    return jsonify(plan)
+    return jsonify(get_current_diet_plan())
 
-def get_personalized_diet_plan():
-    """Generate personalized diet recommendations based on user profile"""
-    age = session.get('age', 18)
-    weight = session.get('weight', 70)
-    fitness_goal = session.get('fitness_goal', 'weight_loss')
-    
-    # Get base recommendations
-    base_recommendations = DIET_RECOMMENDATIONS.get(fitness_goal, DIET_RECOMMENDATIONS['maintenance'])
+@diet_bp.route('/search')
+def search_foods():
+    """Autocomplete for meal logging"""
+    query = request.args.get('q', '')[:MAX_SEARCH_QUERY]
+    limit = max(1, min(request.args.get('limit', 10, type=int), MAX_SEARCH_RESULTS))
     
+    table = get_planner().table
+    found = get_search_index().search(query, limit)
+    response = jsonify({
+        'query': query,
+        'fuzzy': found['fuzzy'],
+        'results': [{'name': name, 'serving': table.servings[food], **nutrient_dict(table.nutrients[food])}
+                    for name, food in found['results']]
+    })
+    # The catalogue only changes on deploy
+    response.cache_control.public = True
+    response.cache_control.max_age = SEARCH_CACHE_SECONDS
+    return response
+
+@diet_bp.route('/weekly_plan')
+def weekly_plan():
+    """Meals for Monday to Sunday of the current week"""
+    return jsonify(get_weekly_diet_plan())
+
+MAX_SEARCH_QUERY = 64
+MAX_SEARCH_RESULTS = 25
+SEARCH_CACHE_SECONDS = 300
+
+# Share of the day's calories per meal
+MEAL_SHARES = (('breakfast', 0.25), ('lunch', 0.35), ('dinner', 0.30), ('snacks', 0.10))
+
+DIET_TIPS = {
+    'weight_loss': (
+        "Eat smaller, more frequent meals",
+        "Drink water before meals",
+        "Include protein in every meal",
+        "Avoid sugary drinks",
+        "Choose whole grains over refined carbs"
+    ),
+    'muscle_gain': (
+        "Consume protein within 30 minutes after workout",
+        "Include complex carbohydrates for energy",
+        "Eat every 3-4 hours",
+        "Don't skip breakfast",
+        "Stay hydrated throughout the day"
+    ),
+    'maintenance': (
+        "Maintain balanced portions",
+        "Include variety in your diet",
+        "Listen to your hunger cues",
+        "Stay consistent with meal times",
+        "Enjoy treats in moderation"
+    )
+}
+YOUNG_ADULT_TIP = "Focus on nutrient-dense foods for growth and development"
+
+MEAL_TIMING = MappingProxyType({
+    'breakfast': '7:00 AM - 8:00 AM',
+    'lunch': '12:00 PM - 1:00 PM',
+    'dinner': '6:00 PM - 7:00 PM',
+    'snacks': '10:00 AM, 3:00 PM'
+})
+
+def age_band(age):
+    """The only age distinction the plan makes"""
+    return 'under_25' if age < 25 else '25_plus'
+
+@lru_cache(maxsize=512)
+def get_profile_plan(band, weight, fitness_goal):
+    """Calories, tips and water for a profile; shared between users, so treat as read-only"""
     # Calculate daily calorie needs (simplified formula)
-    if age < 25:
+    if band == 'under_25':
         bmr = 1800 if fitness_goal == 'muscle_gain' else 1500
     else:
         bmr = 1700 if fitness_goal == 'muscle_gain' else 1400
@@ -58,70 +122,70 @@ def get_personalized_diet_plan():
     elif fitness_goal == 'muscle_gain':
         daily_calories += 300
     
+    return int(daily_calories), tuple(get_diet_tips(fitness_goal, band)), calculate_water_intake(weight)
+
+def diet_plan_key():
+    """Identifies the plan to show: it changes with the profile and once a day"""
+    return '|'.join(str(part) for part in (
+        session.get('user_id'), date.today().isoformat(), age_band(session.get('age', 18)),
+        session.get('weight', 70), session.get('fitness_goal', 'weight_loss')
+    ))
+
+def get_current_diet_plan():
+    """The plan stored in the session, rebuilt only when its key is out of date"""
+    key = diet_plan_key()
+    if session.get('diet_plan_key') != key or not session.get('diet_plan'):
+        session['diet_plan'] = get_personalized_diet_plan()
+        session['diet_plan_key'] = key
+    return session['diet_plan']
+
+def get_personalized_diet_plan():
+    """Generate personalized diet recommendations based on user profile"""
+    age = session.get('age', 18)
+    weight = session.get('weight', 70)
+    fitness_goal = session.get('fitness_goal', 'weight_loss')
+    
+    daily_calories, tips, water_intake = get_profile_plan(age_band(age), weight, fitness_goal)
+    
+    # Same user and day always get the same meals
+    rng = random.Random(f"{session.get('user_id')}:{date.today().isoformat()}:{fitness_goal}")
+    day = get_planner().plan_day(daily_calories, fitness_goal, MEAL_SHARES, rng)
+    
     # Generate personalized plan
-    plan = {
-        'daily_calories': int(daily_calories),
+    return {
+        'daily_calories': daily_calories,
         'goal': fitness_goal.replace('_', ' ').title(),
-        'meals': {
-            'breakfast': {
-                'options': base_recommendations['breakfast'],
-                'selected': random.choice(base_recommendations['breakfast']),
-                'calories': int(daily_calories * 0.25)
-            },
-            'lunch': {
-                'options': base_recommendations['lunch'],
-                'selected': random.choice(base_recommendations['lunch']),
-                'calories': int(daily_calories * 0.35)
-            },
-            'dinner': {
-                'options': base_recommendations['dinner'],
-                'selected': random.choice(base_recommendations['dinner']),
-                'calories': int(daily_calories * 0.30)
-            },
-            'snacks': {
-                'options': base_recommendations['snacks'],
-                'selected': random.choice(base_recommendations['snacks']),
-                'calories': int(daily_calories * 0.10)
-            }
-        },
-        'tips': get_diet_tips(fitness_goal, age),
-        'water_intake': calculate_water_intake(weight),
+        'meals': day['meals'],
+        'totals': day['totals'],
+        'targets': day['targets'],
+        'within_tolerance': day['within_tolerance'],
+        'tips': list(tips),
+        'water_intake': water_intake,
         'meal_timing': get_meal_timing_suggestions()
     }
+
+def get_weekly_diet_plan():
+    """Seven days of meals, avoiding repeats across the week"""
+    weight = session.get('weight', 70)
+    fitness_goal = session.get('fitness_goal', 'weight_loss')
+    daily_calories = get_profile_plan(age_band(session.get('age', 18)), weight, fitness_goal)[0]
     
-    return plan
+    week_start = date.today() - timedelta(days=date.today().weekday())
+    rng = random.Random(f"{session.get('user_id')}:{week_start.isoformat()}:{fitness_goal}")
+    days = get_planner().plan_week(daily_calories, fitness_goal, MEAL_SHARES, rng)
+    return {
+        'daily_calories': daily_calories,
+        'goal': fitness_goal.replace('_', ' ').title(),
+        'days': [{'date': (week_start + timedelta(days=offset)).isoformat(), **day}
+                 for offset, day in enumerate(days)]
+    }
 
-def get_diet_tips(fitness_goal, age):
+def get_diet_tips(fitness_goal, band):
     """Get personalized diet tips"""
-    tips = []
+    tips = list(DIET_TIPS.get(fitness_goal, DIET_TIPS['maintenance']))
     
-    if fitness_goal == 'weight_loss':
-        tips.extend([
-            "Eat smaller, more frequent meals",
-            "Drink water before meals",
-            "Include protein in every meal",
-            "Avoid sugary drinks",
-            "Choose whole grains over refined carbs"
-        ])
-    elif fitness_goal == 'muscle_gain':
-        tips.extend([
-            "Consume protein within 30 minutes after workout",
-            "Include complex carbohydrates for energy",
-            "Eat every 3-4 hours",
-            "Don't skip breakfast",
-            "Stay hydrated throughout the day"
-        ])
-    else:  # maintenance
-        tips.extend([
-            "Maintain balanced portions",
-            "Include variety in your diet",
-            "Listen to your hunger cues",
-            "Stay consistent with meal times",
-            "Enjoy treats in moderation"
-        ])
-    
-    if age < 25:
-        tips.append("Focus on nutrient-dense foods for growth and development")
+    if band == 'under_25':
+        tips.append(YOUNG_ADULT_TIP)
     
     return tips[:5]  # Return top 5 tips
 
@@ -131,9 +195,4 @@ def calculate_water_intake(weight):
 
 def get_meal_timing_suggestions():
     """Get meal timing suggestions"""
-    return {
-        'breakfast': '7:00 AM - 8:00 AM',
-        'lunch': '12:00 PM - 1:00 PM',
-        'dinner': '6:00 PM - 7:00 PM',
-        'snacks': '10:00 AM, 3:00 PM'
-    }
+    return dict(MEAL_TIMING)
@@ -0,0 +1,75 @@
+from flask import Blueprint, Response, jsonify, url_for
+import json
+import os
+import time
+from conditional import user_version_key
+from events import hub
+
+events_bp = Blueprint('events', __name__)
+
+# Comment lines keep proxies from closing idle streams
+HEARTBEAT_SECONDS = 15
+# Streams are closed after this long; EventSource reconnects on its own
+STREAM_MAX_SECONDS = 300
+RECONNECT_MILLISECONDS = 5000
+# Stream URL of a gevent deployment (GUNICORN_PROFILE=events) on the same host and origin,
+# e.g. /events/ routed to it by the proxy; without it only gevent workers stream
+EVENTS_STREAM_URL = os.environ.get('EVENTS_STREAM_URL')
+
+def streaming_supported():
+    """True in gevent workers, where an open stream costs a greenlet instead of a whole worker or thread"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+@events_bp.app_context_processor
+def inject_events_url():
+    """Where pages open their event stream; None tells them to poll"""
+    return {'events_stream_url': EVENTS_STREAM_URL or (url_for('events.stream') if streaming_supported() else None)}
+
+def format_event(event, data, event_id=None):
+    """Serialize one Server-Sent Event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+@events_bp.route('/stream')
+def stream():
+    """Push score, rank and achievement updates to the current user"""
+    # A sync or gthread worker would be held for the whole stream; EventSource gives up on a 503
+    if not streaming_supported():
+        return jsonify({'error': 'Event streams are not served by this deployment'}), 503
+    subscription = hub.subscribe([user_version_key(), 'leaderboard'])
+    if subscription is None:
+        return jsonify({'error': 'Too many open event streams'}), 503, {'Retry-After': '30'}
+    
+    def generate():
+        try:
+            yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            reported_drops = 0
+            while time.monotonic() < deadline:
+                events = subscription.get(HEARTBEAT_SECONDS)
+                if not events:
+                    yield ': heartbeat\n\n'
+                    continue
+                
+                # The client fell behind and lost events, tell it to refetch everything
+                if subscription.dropped > reported_drops:
+                    reported_drops = subscription.dropped
+                    yield format_event('resync', {'dropped': reported_drops})
+                
+                for event in events:
+                    yield format_event(event['event'], event['data'], event['id'])
+        finally:
+            subscription.close()
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -1,266 +1,33 @@
 # Enhanced games.py with detailed exercise tracking and database options
-from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, jsonify, session
+from flask import Blueprint, render_template, request, url_for, abort, jsonify, session, current_app
 from datetime import datetime, date, timedelta
 import json
+import logging
 import random
 import os
-import sqlite3
 from typing import Dict, List, Optional, Any
-import hashlib
+from database import USE_SQLITE, get_db_connection, new_session_id
+from conditional import (conditional_response, bump_version, bump_user_version,
+                         user_version_key, leaderboard_version_key)
+from events import hub
+from jobs import enqueue, job_handler
+from anti_cheat import audit_finished_session
+from activity_days import get_activity, load_activity, record_activity
+from blueprints.auth.auth import load_users as load_accounts
+from game_registry import get_registry
+from rep_counter import HOLD_EXERCISES, MIN_REP_CONFIDENCE, SensorDataError, count_reps
+from live_counters import increment, live_stats, mark_online
+from usage_tracker import record_usage, remaining_minutes
+from result_cache import LEADERBOARD_TAG, cached, game_tag, invalidate, user_tag
+from sensor_frames import FRAME_MIMETYPE, MAX_FRAME_BYTES, frame_from_json, parse_frame
 
 games_bp = Blueprint('games', __name__)
-main_bp = Blueprint('main', __name__)
 
-# Database Configuration
-DATABASE_FILE = 'fitness_games.db'
-USE_SQLITE = True  # Set to False to use JSON file storage
+logger = logging.getLogger(__name__)
 
-def init_database():
-    """Initialize SQLite database with required tables"""
-    if not USE_SQLITE:
-        return
-        
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    
-    # Users table - Fixed to include id column for compatibility
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT,
-            password_hash TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            points INTEGER DEFAULT 0,
-            calories_burned REAL DEFAULT 0,
-            time_active REAL DEFAULT 0,
-            workouts_completed INTEGER DEFAULT 0,
-            level INTEGER DEFAULT 1,
-            experience INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Game sessions table - Fixed to use user_id
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS game_sessions (
-            session_id TEXT PRIMARY KEY,
-            user_id INTEGER,
-            username TEXT,
-            game_type TEXT,
-            start_time TIMESTAMP,
-            end_time TIMESTAMP,
-            duration REAL,
-            score INTEGER,
-            points_earned INTEGER,
-            calories_burned REAL,
-            tracking_method TEXT,
-            raw_data TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (username) REFERENCES users (username)
-        )
-    ''')
-    
-    # Exercise tracking data table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS exercise_tracking (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            timestamp TIMESTAMP,
-            exercise_count INTEGER,
-            tracking_method TEXT,
-            sensor_data TEXT,
-            confidence_score REAL,
-            FOREIGN KEY (session_id) REFERENCES game_sessions (session_id)
-        )
-    ''')
-    
-    # Game statistics table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS game_stats (
-            username TEXT,
-            game_type TEXT,
-            games_played INTEGER DEFAULT 0,
-            best_score INTEGER DEFAULT 0,
-            total_score INTEGER DEFAULT 0,
-            average_score REAL DEFAULT 0,
-            last_played TIMESTAMP,
-            PRIMARY KEY (username, game_type),
-            FOREIGN KEY (username) REFERENCES users (username)
-        )
-    ''')
-    
-    # Achievements table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS achievements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            achievement_id TEXT UNIQUE,
-            name TEXT,
-            description TEXT,
-            category TEXT,
-            points_reward INTEGER,
-            icon TEXT
-        )
-    ''')
-    
-    # User achievements table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_achievements (
-            username TEXT,
-            achievement_id TEXT,
-            earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (username, achievement_id),
-            FOREIGN KEY (username) REFERENCES users (username),
-            FOREIGN KEY (achievement_id) REFERENCES achievements (achievement_id)
-        )
-    ''')
-    
-    # Streaks table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_streaks (
-            username TEXT PRIMARY KEY,
-            current_streak INTEGER DEFAULT 0,
-            longest_streak INTEGER DEFAULT 0,
-            last_activity_date DATE,
-            FOREIGN KEY (username) REFERENCES users (username)
-        )
-    ''')
-    
-    # Daily activities table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS daily_activities (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT,
-            activity_date DATE,
-            activity_type TEXT,
-            activity_data TEXT,
-            points_earned INTEGER,
-            calories_burned REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (username) REFERENCES users (username)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    
-    # Initialize default achievements
-    initialize_achievements()
-
-def initialize_achievements():
-    """Initialize default achievements in the database"""
-    if not USE_SQLITE:
-        return
-        
-    achievements = [
-        {
-            'achievement_id': 'first_game',
-            'name': 'First Steps',
-            'description': 'Play your first fitness game',
-            'category': 'beginner',
-            'points_reward': 10,
-            'icon': 'fa-star'
-        },
-        {
-            'achievement_id': 'streak_3',
-            'name': 'Consistent Player',
-            'description': 'Play games for 3 days in a row',
-            'category': 'streak',
-            'points_reward': 25,
-            'icon': 'fa-fire'
-        },
-        {
-            'achievement_id': 'streak_7',
-            'name': 'Week Warrior',
-            'description': 'Play games for 7 days in a row',
-            'category': 'streak',
-            'points_reward': 75,
-            'icon': 'fa-medal'
-        },
-        {
-            'achievement_id': 'streak_30',
-            'name': 'Monthly Master',
-            'description': 'Play games for 30 days in a row',
-            'category': 'streak',
-            'points_reward': 300,
-            'icon': 'fa-crown'
-        },
-        {
-            'achievement_id': 'squat_master',
-            'name': 'Squat Master',
-            'description': 'Score 100+ in Squat Tap Challenge',
-            'category': 'performance',
-            'points_reward': 50,
-            'icon': 'fa-arrows-alt-v'
-        },
-        {
-            'achievement_id': 'jump_champion',
-            'name': 'Jump Champion',
-            'description': 'Score 50+ in Jump Counter',
-            'category': 'performance',
-            'points_reward': 40,
-            'icon': 'fa-arrow-up'
-        },
-        {
-            'achievement_id': 'plank_pro',
-            'name': 'Plank Pro',
-            'description': 'Hold plank for 120+ seconds',
-            'category': 'endurance',
-            'points_reward': 60,
-            'icon': 'fa-clock'
-        },
-        {
-            'achievement_id': 'burpee_beast',
-            'name': 'Burpee Beast',
-            'description': 'Complete 25+ burpees',
-            'category': 'strength',
-            'points_reward': 80,
-            'icon': 'fa-dumbbell'
-        },
-        {
-            'achievement_id': 'game_addict',
-            'name': 'Game Addict',
-            'description': 'Play 100 games total',
-            'category': 'milestone',
-            'points_reward': 200,
-            'icon': 'fa-gamepad'
-        },
-        {
-            'achievement_id': 'calorie_burner',
-            'name': 'Calorie Burner',
-            'description': 'Burn 1000+ total calories',
-            'category': 'fitness',
-            'points_reward': 150,
-            'icon': 'fa-fire-alt'
-        }
-    ]
-    
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    
-    for achievement in achievements:
-        cursor.execute('''
-            INSERT OR IGNORE INTO achievements 
-            (achievement_id, name, description, category, points_reward, icon)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            achievement['achievement_id'],
-            achievement['name'], 
-            achievement['description'],
-            achievement['category'],
-            achievement['points_reward'],
-            achievement['icon']
-        ))
-    
-    conn.commit()
-    conn.close()
-
-def get_db_connection():
-    """Get database connection"""
-    if USE_SQLITE:
-        conn = sqlite3.connect(DATABASE_FILE)
-        conn.row_factory = sqlite3.Row
-        return conn
-    return None
+# Days in the /games/activity heatmap, by default and at most
+ACTIVITY_DAYS = 365
+MAX_ACTIVITY_DAYS = 3 * 366
 
 def load_users():
     """Load users from database or JSON file"""
@@ -305,6 +72,7 @@ def save_user(username: str, user_data: Dict[str, Any]):
             ))
             conn.commit()
             conn.close()
+            invalidate(user_tag(username))
             return True
     
     # Fallback to JSON
@@ -312,6 +80,7 @@ def save_user(username: str, user_data: Dict[str, Any]):
     users[username] = user_data
     with open('users.json', 'w') as f:
         json.dump(users, f, indent=2)
+    invalidate(user_tag(username))
     return True
 
 def save_game_session(session_data):
@@ -324,9 +93,9 @@ def save_game_session(session_data):
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO game_sessions
-            (session_id, user_id, username, game_type, start_time, end_time, 
-             duration, score, points_earned, calories_burned, tracking_method, raw_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            (id, user_id, username, game_type, start_time, end_time, 
+             duration, score, points_earned, calories_burned, tracking_method, raw_data, owner_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             session_data['session_id'],
             session_data.get('user_id'),
@@ -339,38 +108,50 @@ def save_game_session(session_data):
             session_data['points_earned'],
             session_data['calories_burned'],
             session_data.get('tracking_method', 'manual'),
-            json.dumps(session_data.get('raw_data', {}))
+            json.dumps(session_data.get('raw_data', {})),
+            session_data.get('owner_key')
         ))
         conn.commit()
         conn.close()
+        invalidate(user_tag(session_data.get('username')))
 
-def save_exercise_tracking_data(tracking_data: List[Dict[str, Any]]):
-    """Save exercise tracking data points"""
+def save_exercise_tracking_data(tracking_data: List[Dict[str, Any]], username: str,
+                                game_session_id: Optional[int] = None) -> List[int]:
+    """Save a user's exercise tracking data points, with the game session they belong to if any.
+    
+    Returns the new rows' ids.
+    """
     if not USE_SQLITE or not tracking_data:
-        return
+        return []
         
+    row_ids = []
     conn = get_db_connection()
     if conn:
         cursor = conn.cursor()
         for data in tracking_data:
             cursor.execute('''
                 INSERT INTO exercise_tracking
-                (session_id, timestamp, exercise_count, tracking_method, 
-                 sensor_data, confidence_score)
-                VALUES (?, ?, ?, ?, ?, ?)
+                (game_session_id, username, timestamp, exercise_count, tracking_method, 
+                 sensor_data, sensor_frame, confidence_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
-                data['session_id'],
+                game_session_id,
+                username,
                 data['timestamp'],
                 data['exercise_count'],
                 data['tracking_method'],
                 json.dumps(data.get('sensor_data', {})),
+                data.get('sensor_frame'),
                 data.get('confidence_score', 0.0)
             ))
+            row_ids.append(cursor.lastrowid)
         conn.commit()
         conn.close()
+        invalidate(user_tag(username))
+    return row_ids
 
-def update_game_stats(username: str, game_type: str, score: int):
-    """Update game statistics"""
+def update_game_stats(username: str, game_type: str, score: int) -> int:
+    """Update game statistics and return the user's best score for the game"""
     if USE_SQLITE:
         conn = get_db_connection()
         if conn:
@@ -407,56 +188,16 @@ def update_game_stats(username: str, game_type: str, score: int):
             
             conn.commit()
             conn.close()
+            invalidate(user_tag(username), game_tag(game_type))
+            return best_score
+    return score
 
-def update_user_streak(username: str):
-    """Update user's game streak"""
+def update_user_streak(username: str, day: Optional[date] = None) -> tuple:
+    """Record activity on day (default: today) and return the user's (current, longest) streak"""
     if not USE_SQLITE:
-        return
-        
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        
-        # Get current streak data
-        cursor.execute('''
-            SELECT current_streak, longest_streak, last_activity_date 
-            FROM user_streaks 
-            WHERE username = ?
-        ''', (username,))
-        
-        row = cursor.fetchone()
-        today = date.today()
-        
-        if row:
-            last_date = datetime.strptime(row['last_activity_date'], '%Y-%m-%d').date() if row['last_activity_date'] else None
-            current_streak = row['current_streak']
-            longest_streak = row['longest_streak']
-            
-            if last_date:
-                days_diff = (today - last_date).days
-                if days_diff == 1:
-                    current_streak += 1
-                elif days_diff > 1:
-                    current_streak = 1
-                # If same day, no change
-            else:
-                current_streak = 1
-                
-            longest_streak = max(longest_streak, current_streak)
-        else:
-            current_streak = 1
-            longest_streak = 1
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_streaks
-            (username, current_streak, longest_streak, last_activity_date)
-            VALUES (?, ?, ?, ?)
-        ''', (username, current_streak, longest_streak, today))
-        
-        conn.commit()
-        conn.close()
-        
-        return current_streak, longest_streak
+        return 0, 0
+    
+    return record_activity(username, [day or date.today()]) or (0, 0)
 
 def check_and_award_achievements(username: str, game_type: str, score: int, user_stats: Dict[str, Any]):
     """Check and award achievements"""
@@ -542,6 +283,8 @@ def check_and_award_achievements(username: str, game_type: str, score: int, user
     
     conn.commit()
     conn.close()
+    if new_achievements:
+        invalidate(user_tag(username))
     
     return new_achievements
 
@@ -563,19 +306,25 @@ def get_current_user():
                         conn.close()
                         return dict(row)
                 except (ValueError, TypeError):
-                    # If not numeric, try as username
-                    cursor.execute('SELECT * FROM users WHERE username = ?', (str(user_id),))
+                    # If not numeric, try as username, and in the same query the session's
+                    # username (accounts created at signup are keyed by a uuid)
+                    cursor.execute('''
+                        SELECT * FROM users WHERE username IN (?, ?)
+                        ORDER BY username = ? DESC LIMIT 1
+                    ''', (str(user_id), session.get('username') or str(user_id), str(user_id)))
                     row = cursor.fetchone()
+                    conn.close()
                     if row:
-                        conn.close()
                         return dict(row)
+                    return load_accounts().get(str(user_id))
                 conn.close()
         
-        # Fallback to JSON
-        users = load_users()
-        return users.get(str(user_id))
+        if not USE_SQLITE:
+            # Fallback to JSON
+            users = load_users()
+            return users.get(str(user_id))
     
-    # Fallback to check for username (legacy support)
+    # Accounts created at signup are keyed by a uuid; their game rows are keyed by username
     username = session.get('username')
     if username:
         if USE_SQLITE:
@@ -587,19 +336,20 @@ def get_current_user():
                 conn.close()
                 if row:
                     return dict(row)
-        
-        users = load_users()
-        # Search by username in JSON data
-        for user in users.values():
-            if user.get('username') == username:
-                return user
+        else:
+            users = load_users()
+            # Search by username in JSON data
+            for user in users.values():
+                if user.get('username') == username:
+                    return user
     
+    # Signed-up account that has not finished a game yet
+    if user_id:
+        return load_accounts().get(str(user_id))
     return None
 
-# Initialize database on import
-init_database()
-
 @games_bp.route('/')
+@conditional_response(lambda: [user_version_key()])
 def games():
     """Main games page"""
     user_data = get_current_user()
@@ -648,7 +398,13 @@ def start_game():
     game_type = request.json.get('game_type')
     tracking_method = request.json.get('tracking_method', 'manual')
     
-    session_id = f"{username}_{game_type}_{datetime.now().timestamp()}"
+    if username and remaining_minutes(username) == 0:
+        return jsonify({'error': 'Daily usage limit reached', 'remaining_time': 0}), 403
+    
+    session_id = new_session_id()
+    record_usage(username)
+    increment('games_started')
+    mark_online(username)
     
     session['current_game'] = {
         'session_id': session_id,
@@ -665,7 +421,8 @@ def start_game():
     return jsonify({
         'status': 'success',
         'game_type': game_type,
-        'session_id': session_id,
+        # Ids go past 2**53, so JavaScript gets them as strings
+        'session_id': str(session_id),
         'tracking_method': tracking_method
     })
 
@@ -675,28 +432,60 @@ def update_score():
     if 'current_game' not in session:
         return jsonify({'error': 'No active game'}), 400
     
-    score = request.json.get('score', 0)
-    tracking_data = request.json.get('tracking_data', {})
-    sensor_data = request.json.get('sensor_data', {})
+    # Binary sensor frames carry no JSON fields; the score comes from the samples
+    payload = {} if request.mimetype == FRAME_MIMETYPE else request.json
+    score = payload.get('score', 0)
+    tracking_data = payload.get('tracking_data', {})
+    sensor_data = payload.get('sensor_data', {})
+    confidence = tracking_data.get('confidence', 0.8)
+    sensor_frame = None
+    
+    # Raw samples are counted here instead of trusting the client's score and confidence
+    game = get_registry().games.get(session['current_game']['type'])
+    try:
+        upload = read_sensor_upload(payload, game.exercise if game else None)
+    except SensorDataError as exc:
+        return jsonify({'error': str(exc)}), 400
+    if upload:
+        counted, sensor_data, sensor_frame = upload
+        score = session['current_game']['score'] + counted.reps
+        confidence = counted.confidence
     
     # Update session data
     session['current_game']['score'] = score
+    username = session['current_game']['username']
+    mark_online(username)
+    record_usage(username)
     
     # Store tracking data point
     tracking_point = {
-        'session_id': session['current_game']['session_id'],
         'timestamp': datetime.now().isoformat(),
         'exercise_count': score,
         'tracking_method': session['current_game']['tracking_method'],
         'sensor_data': sensor_data,
-        'confidence_score': tracking_data.get('confidence', 0.8)
+        'confidence_score': confidence
     }
+    if sensor_frame is not None:
+        # Frames are written as they arrive, so the session file only holds the row id
+        if not isinstance(session['current_game']['session_id'], int):
+            # Games started before the integer keys get theirs now, as end_game would
+            start_time = datetime.fromisoformat(session['current_game']['start_time'])
+            session['current_game']['session_id'] = new_session_id(start_time.timestamp())
+        row_ids = save_exercise_tracking_data([{**tracking_point, 'sensor_frame': sensor_frame}], username,
+                                              session['current_game']['session_id'])
+        tracking_point['tracking_id'] = row_ids[0] if row_ids else None
+        tracking_point['frame_bytes'] = len(sensor_frame)
     
     session['current_game']['exercise_tracking_data'].append(tracking_point)
+    logger.debug('Score updated to %s', score, extra={
+        'event': 'update_score',
+        'game_session_id': session['current_game']['session_id'],
+    })
     
     return jsonify({
         'status': 'success', 
         'score': score,
+        'confidence': confidence,
         'tracking_data_stored': True
     })
 
@@ -715,6 +504,10 @@ def end_game():
     # Calculate duration
     start_time = datetime.fromisoformat(game_data['start_time'])
     end_time = datetime.now()
+    # Games started before the integer keys carry a text id
+    session_id = game_data['session_id']
+    if not isinstance(session_id, int):
+        session_id = new_session_id(start_time.timestamp())
     duration = (end_time - start_time).total_seconds() / 60  # minutes
     
     # Calculate points and calories
@@ -728,11 +521,14 @@ def end_game():
     
     # Save updated user data
     save_user(username, user_data)
+    record_usage(username)
     
     # Save game session
     session_data = {
-        'session_id': game_data['session_id'],
+        'session_id': session_id,
         'user_id': user_data.get('id'),
+        # The player's ETag version key, which anti_cheat bumps on quarantine or release
+        'owner_key': user_version_key(),
         'username': username,
         'game_type': game_type,
         'start_time': game_data['start_time'],
@@ -743,111 +539,218 @@ def end_game():
         'calories_burned': calories_burned,
         'tracking_method': game_data['tracking_method'],
         'raw_data': {
-            'exercise_tracking_data': game_data.get('exercise_tracking_data', []),
+            # Frames are stored once, in exercise_tracking.sensor_frame
+            'exercise_tracking_data': [{key: value for key, value in point.items() if key != 'sensor_frame'}
+                                       for point in game_data.get('exercise_tracking_data', [])],
             'sensor_readings': game_data.get('sensor_readings', [])
         }
     }
     save_game_session(session_data)
     
-    # Save exercise tracking data
-    save_exercise_tracking_data(game_data.get('exercise_tracking_data', []))
+    # Save exercise tracking data; points with frames were saved by update_score
+    save_exercise_tracking_data([point for point in game_data.get('exercise_tracking_data', [])
+                                 if not point.get('tracking_id')], username, session_id)
     
     # Update game statistics
-    update_game_stats(username, game_type, score)
-    
-    # Update streak
-    current_streak, longest_streak = update_user_streak(username)
-    
-    # Check achievements
-    new_achievements = check_and_award_achievements(
-        username, game_type, score, user_data
-    )
-    
-    # Get updated best score
-    if USE_SQLITE:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT best_score FROM game_stats 
-                WHERE username = ? AND game_type = ?
-            ''', (username, game_type))
-            row = cursor.fetchone()
-            best_score = row['best_score'] if row else score
-            conn.close()
-        else:
-            best_score = score
-    else:
-        best_score = score
+    best_score = update_game_stats(username, game_type, score)
+    increment('games_finished')
+    increment(f'plays:{game_type}')
+    game = get_registry().games.get(game_type)
+    if game and game.exercise not in HOLD_EXERCISES:
+        increment('reps', score)
     
     # Clear current game from session
     session.pop('current_game', None)
     
+    bump_version(user_version_key(), leaderboard_version_key(game_type))
+    logger.info('Game finished', extra={
+        'event': 'end_game',
+        'username': username,
+        'game_type': game_type,
+        'score': score,
+        'points_earned': points_earned,
+    })
+    
+    # Streak, achievements and leaderboard rank are worked out by a background job,
+    # which pushes them to this user's tabs and to leaderboard viewers when done
+    user_channel = user_version_key()
+    job_id = enqueue('post_game', {
+        'username': username,
+        'game_type': game_type,
+        'score': score,
+        'best_score': best_score,
+        'calories_burned': user_data['calories_burned'],
+        'session_calories': calories_burned,
+        'played_on': end_time.date().isoformat(),
+        'session_id': session_id,
+        'channel': user_channel
+    }, key=f"post_game:{session_id}", owner=user_channel)
+    hub.publish(user_channel, 'score', {
+        'game_type': game_type,
+        'score': score,
+        'best_score': best_score,
+        'total_points': user_data['points']
+    })
+    
     return jsonify({
         'status': 'success',
         'points_earned': points_earned,
         'calories_burned': calories_burned,
         'duration': duration,
         'total_points': user_data['points'],
-        'new_achievements': new_achievements,
-        'current_streak': current_streak,
-        'longest_streak': longest_streak,
         'best_score': best_score,
         'is_personal_best': score == best_score,
-        'session_id': game_data['session_id']
+        'session_id': str(session_id),
+        'post_game_job': {'id': job_id, 'status_url': url_for('jobs.job_status', job_id=job_id)}
     })
 
+@job_handler('post_game')
+def process_finished_game(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Anti-cheat audit, streak, achievements and leaderboard rank for a finished game.
+    
+    Safe to run again: the audit gives the same verdict, the streak doesn't move
+    twice in a day and earned achievements are skipped.
+    """
+    username = payload['username']
+    game_type = payload['game_type']
+    # A quarantined session is already out of game_stats; its score earns no achievements or rank
+    quarantined = isinstance(payload.get('session_id'), int) and audit_finished_session(payload['session_id'])
+    current_streak, longest_streak = update_user_streak(
+        username, date.fromisoformat(payload['played_on']))
+    calories = payload['calories_burned'] - (payload.get('session_calories', 0) if quarantined else 0)
+    new_achievements = check_and_award_achievements(
+        username, game_type, 0 if quarantined else payload['score'], {'calories_burned': calories}
+    )
+    
+    rank = None
+    if USE_SQLITE and not quarantined:
+        conn = get_db_connection()
+        if conn:
+            rank = conn.execute('''
+                SELECT COUNT(*) + 1 AS rank FROM game_stats
+                WHERE game_type = ? AND best_score > ?
+            ''', (game_type, payload['best_score'])).fetchone()['rank']
+            conn.close()
+    
+    # The streak (and any new achievements) changed after end_game bumped the version
+    bump_version(payload['channel'])
+    live_events = [(payload['channel'], 'achievement', achievement) for achievement in new_achievements]
+    if rank is not None:
+        live_events.append(('leaderboard', 'rank', {
+            'game_type': game_type,
+            'username': username,
+            'best_score': payload['best_score'],
+            'rank': rank
+        }))
+    hub.publish_many(live_events)
+    
+    return {
+        'current_streak': current_streak,
+        'longest_streak': longest_streak,
+        'new_achievements': new_achievements,
+        'rank': rank,
+        'quarantined': quarantined
+    }
+
+def read_sensor_upload(payload, exercise: Optional[str]) -> Optional[tuple]:
+    """Count reps from a binary frame body or a JSON sensor_samples field.
+    
+    Returns (RepCount, sensor_data summary, frame bytes), or None when the
+    request carries no samples. A count below MIN_REP_CONFIDENCE comes back as
+    0 reps; the summary keeps what was detected. Raises SensorDataError for
+    malformed uploads.
+    """
+    if request.mimetype == FRAME_MIMETYPE:
+        if (request.content_length or 0) > MAX_FRAME_BYTES:
+            raise SensorDataError(f"frames are limited to {MAX_FRAME_BYTES} bytes")
+        frame_bytes = request.get_data(cache=False)
+        frame = parse_frame(frame_bytes)
+        upload_format = 'frame'
+    elif payload.get('sensor_samples') is not None:
+        frame_bytes, frame = frame_from_json(payload['sensor_samples'])
+        upload_format = 'json'
+    else:
+        return None
+    
+    counted = count_reps(frame.samples, frame.sample_rate, exercise, frame.kind)
+    summary = counted.summary(frame.kind, frame.sample_rate, len(frame.samples))
+    summary.update({'format': upload_format, 'frame_bytes': len(frame_bytes), 'started_at': frame.started_at})
+    if exercise not in HOLD_EXERCISES and counted.confidence < MIN_REP_CONFIDENCE:
+        # Too irregular to be reps, e.g. shaking the phone: stored but not scored
+        counted = counted._replace(reps=0)
+        summary['rejected'] = True
+    return counted, summary, frame_bytes
+
 def calculate_rewards(game_type: str, score: int, duration: float) -> tuple:
     """Calculate points and calories based on game type and performance"""
-    base_multipliers = {
-        'squat_tap': {'points': 2, 'calories': 0.5},
-        'jump_counter': {'points': 3, 'calories': 0.8},
-        'plank_timer': {'points': 5, 'calories': 0.1},
-        'burpee_challenge': {'points': 10, 'calories': 1.5}
-    }
-    
-    multiplier = base_multipliers.get(game_type, {'points': 1, 'calories': 0.3})
+    registry = get_registry()
+    points_per_unit, calories_per_unit = registry.multipliers(game_type)
     
     # Base calculation
-    points_earned = int(score * multiplier['points'])
-    calories_burned = score * multiplier['calories']
+    points_earned = int(score * points_per_unit)
+    calories_burned = score * calories_per_unit
     
     # Duration bonus (for longer sessions)
-    if duration > 5:  # More than 5 minutes
-        points_earned = int(points_earned * 1.2)
-        calories_burned *= 1.1
+    bonus = registry.duration_bonus
+    if duration > bonus['after_minutes']:
+        points_earned = int(points_earned * bonus['points'])
+        calories_burned *= bonus['calories']
     
     return points_earned, round(calories_burned, 2)
 
 @games_bp.route('/leaderboard/<game_type>')
+@conditional_response(lambda game_type: [leaderboard_version_key(game_type)], private=False)
 def get_leaderboard(game_type):
     """Get leaderboard for specific game type"""
-    if USE_SQLITE:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT u.username, gs.best_score, gs.games_played, gs.average_score
-                FROM game_stats gs
-                JOIN users u ON gs.username = u.username
-                WHERE gs.game_type = ? AND gs.best_score > 0
-                ORDER BY gs.best_score DESC
-                LIMIT 10
-            ''', (game_type,))
-            
-            leaderboard = []
-            for row in cursor.fetchall():
-                leaderboard.append({
-                    'username': row['username'],
-                    'best_score': row['best_score'],
-                    'games_played': row['games_played'],
-                    'average_score': round(row['average_score'], 1)
-                })
-            
-            conn.close()
-            return jsonify(leaderboard)
+    return jsonify(load_leaderboard(game_type) or [])
+
+@cached('leaderboard', tags=lambda game_type: [LEADERBOARD_TAG, game_tag(game_type)])
+def load_leaderboard(game_type: str) -> Optional[List[Dict[str, Any]]]:
+    """Top 10 best scores for a game"""
+    if not USE_SQLITE:
+        return None
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT u.username, gs.best_score, gs.games_played, gs.average_score
+        FROM game_stats gs
+        JOIN users u ON gs.username = u.username
+        WHERE gs.game_type = ? AND gs.best_score > 0
+        ORDER BY gs.best_score DESC
+        LIMIT 10
+    ''', (game_type,))
+    
+    leaderboard = []
+    for row in cursor.fetchall():
+        leaderboard.append({
+            'username': row['username'],
+            'best_score': row['best_score'],
+            'games_played': row['games_played'],
+            'average_score': round(row['average_score'], 1)
+        })
     
-    return jsonify([])
+    conn.close()
+    return leaderboard
+
+@games_bp.route('/live')
+def get_live_stats():
+    """Players online, games and reps today across every worker, read from shared memory"""
+    response = jsonify(live_stats())
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@games_bp.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    """Sent every minute while a game is running, so long games count as active time"""
+    if 'current_game' not in session:
+        return jsonify({'error': 'No active game'}), 400
+    username = session['current_game']['username']
+    record_usage(username)
+    mark_online(username)
+    remaining = remaining_minutes(username) if username else None
+    return jsonify({'status': 'success', 'remaining_time': remaining, 'limit_reached': remaining == 0})
 
 @games_bp.route('/user_stats')
 def get_user_stats():
@@ -867,127 +770,141 @@ def get_user_stats():
         }
     }
     
-    if USE_SQLITE:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            
-            # Get game stats
-            cursor.execute('''
-                SELECT * FROM game_stats WHERE username = ?
-            ''', (user_data['username'],))
-            game_stats = {}
-            for row in cursor.fetchall():
-                game_stats[row['game_type']] = dict(row)
-            
-            # Get streak info
-            cursor.execute('''
-                SELECT * FROM user_streaks WHERE username = ?
-            ''', (user_data['username'],))
-            streak_row = cursor.fetchone()
-            
-            # Get achievements
-            cursor.execute('''
-                SELECT a.*, ua.earned_at
-                FROM achievements a
-                JOIN user_achievements ua ON a.achievement_id = ua.achievement_id
-                WHERE ua.username = ?
-                ORDER BY ua.earned_at DESC
-            ''', (user_data['username'],))
-            achievements = [dict(row) for row in cursor.fetchall()]
-            
-            # Get recent sessions
-            cursor.execute('''
-                SELECT * FROM game_sessions 
-                WHERE username = ? 
-                ORDER BY end_time DESC 
-                LIMIT 10
-            ''', (user_data['username'],))
-            recent_sessions = [dict(row) for row in cursor.fetchall()]
-            
-            conn.close()
-
-            
-            stats.update({
-                'game_stats': game_stats,
-                'streak_info': dict(streak_row) if streak_row else None,
-                'achievements': achievements,
-                'recent_sessions': recent_sessions
-            })
+    # Streaks depend on the day, so it is part of the cache key
+    stats.update(load_user_stats(user_data['username'], date.today()) or {})
     
     return jsonify(stats)
 
+@cached('user_stats', tags=lambda username, today: [user_tag(username)])
+def load_user_stats(username: str, today: date) -> Optional[Dict[str, Any]]:
+    """Game stats, streaks, achievements and recent sessions for /user_stats"""
+    if not USE_SQLITE:
+        return None
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    
+    # Get game stats
+    cursor.execute('''
+        SELECT * FROM game_stats WHERE username = ?
+    ''', (username,))
+    game_stats = {}
+    for row in cursor.fetchall():
+        game_stats[row['game_type']] = dict(row)
+    
+    # Streaks from the activity bitset, so a lapsed streak reads 0 without a write
+    activity = load_activity(cursor, username)
+    
+    # Get achievements
+    cursor.execute('''
+        SELECT a.*, ua.earned_at
+        FROM achievements a
+        JOIN user_achievements ua ON a.achievement_id = ua.achievement_id
+        WHERE ua.username = ?
+        ORDER BY ua.earned_at DESC
+    ''', (username,))
+    achievements = [dict(row) for row in cursor.fetchall()]
+    
+    # Get recent sessions
+    cursor.execute('''
+        SELECT * FROM game_sessions 
+        WHERE username = ? 
+        ORDER BY end_time DESC 
+        LIMIT 10
+    ''', (username,))
+    recent_sessions = [dict(row) for row in cursor.fetchall()]
+    
+    conn.close()
+    
+    return {
+        'game_stats': game_stats,
+        'streak_info': {
+            'current_streak': activity.current_streak(today),
+            'longest_streak': activity.longest_streak(),
+            'last_activity_date': activity.last_active().isoformat(),
+            'active_days_this_month': activity.count(today.replace(day=1), today)
+        } if activity.bits else None,
+        'achievements': achievements,
+        'recent_sessions': recent_sessions
+    }
+
+@games_bp.route('/activity')
+@conditional_response(lambda: [user_version_key()], vary=lambda: f"{date.today().isoformat()}:{request.args.get('days', '')}")
+def activity_heatmap():
+    """Active days for a calendar heatmap (the last 365 days by default), with streaks"""
+    user_data = get_current_user()
+    if not user_data:
+        return jsonify({'error': 'User not logged in'}), 401
+    
+    days = min(max(request.args.get('days', ACTIVITY_DAYS, type=int), 1), MAX_ACTIVITY_DAYS)
+    today = date.today()
+    start = today - timedelta(days=days - 1)
+    activity = get_activity(user_data['username'])
+    return jsonify({
+        'start': start.isoformat(),
+        'end': today.isoformat(),
+        'days': activity.days(start, today),
+        'active_days': activity.count(start, today),
+        'active_days_this_month': activity.count(today.replace(day=1), today),
+        'current_streak': activity.current_streak(today),
+        'longest_streak': activity.longest_streak()
+    })
+
 @games_bp.route('/game_data')
+@conditional_response(lambda: [], vary=lambda: get_registry().version, private=False)
 def game_data():
     """Provide game configuration data"""
-    return jsonify({
-        'squat_tap': {
-            'name': 'Squat Tap Challenge',
-            'description': 'Tap the screen while doing',
-            'icon': 'fa-arrows-alt-v',
-            'target_score': 50,
-            'time_limit': 60,
-            'points_per_unit': 2,
-            'calories_per_unit': 0.5
-        },
-        'jump_counter': {
-            'name': 'Jump Counter',
-            'description': 'Jump and tap to count your jumps!',
-            'icon': 'fa-arrow-up',
-            'target_score': 30,
-            'time_limit': 60,
-            'points_per_unit': 3,
-            'calories_per_unit': 0.8
-        },
-        'plank_timer': {
-            'name': 'Plank Timer',
-            'description': 'Hold your plank and beat the timer!',
-            'icon': 'fa-clock',
-            'target_score': 60,
-            'time_limit': 300,  
-            'points_per_unit': 5,
-            'calories_per_unit': 0.1
-        }
-    })
+    registry = get_registry()
+    response = current_app.response_class(registry.catalogue_body, mimetype='application/json')
+    response.headers['X-Game-Data-Version'] = registry.version
+    return response
 
 
-@main_bp.route('/capture_exercise', methods=['POST'])
+@games_bp.route('/capture_exercise', methods=['POST'])
 def capture_exercise():
     """Capture exercise data from tracking systems"""
     user_data = get_current_user()
     if not user_data:
         return jsonify({'error': 'User not logged in'}), 401
     
-    data = request.json
+    # Binary sensor frames send their fields in the query string
+    data = request.args if request.mimetype == FRAME_MIMETYPE else request.json
     exercise_type = data.get('exercise_type')
     count = data.get('count', 1)
     tracking_method = data.get('tracking_method', 'manual')
     sensor_data = data.get('sensor_data', {})
     confidence_score = data.get('confidence', 0.8)
     
+    sensor_frame = None
+    try:
+        upload = read_sensor_upload(data, exercise_type)
+    except SensorDataError as exc:
+        return jsonify({'error': str(exc)}), 400
+    if upload:
+        counted, sensor_data, sensor_frame = upload
+        count = counted.reps
+        confidence_score = counted.confidence
+        tracking_method = 'sensor'
+    
     # Create tracking data entry
     tracking_entry = {
-        'session_id': f"manual_{user_data['username']}_{datetime.now().timestamp()}",
         'timestamp': datetime.now().isoformat(),
         'exercise_count': count,
         'tracking_method': tracking_method,
         'sensor_data': sensor_data,
+        'sensor_frame': sensor_frame,
         'confidence_score': confidence_score
     }
     
     # Save tracking data
-    save_exercise_tracking_data([tracking_entry])
+    save_exercise_tracking_data([tracking_entry], user_data['username'])
+    if exercise_type not in HOLD_EXERCISES:
+        increment('reps', count)
+    mark_online(user_data['username'])
     
     # Calculate calories and points
-    calories_per_exercise = {
-        'squat': 0.5,
-        'jump': 0.8,
-        'pushup': 0.3,
-        'burpee': 1.5,
-        'plank_second': 0.1
-    }
-    
-    calories_burned = count * calories_per_exercise.get(exercise_type, 0.3)
+    calories_burned = count * get_registry().calories_per_exercise(exercise_type)
     points_earned = count * 2
     
     # Update user stats
@@ -1003,9 +920,22 @@ def capture_exercise():
     new_achievements = check_and_award_achievements(
         user_data['username'], exercise_type, count, user_data
     )
+    bump_user_version()
+    
+    user_channel = user_version_key()
+    live_events = [(user_channel, 'score', {
+        'exercise_type': exercise_type,
+        'count': count,
+        'total_points': user_data['points'],
+        'current_streak': current_streak
+    })]
+    live_events.extend((user_channel, 'achievement', achievement) for achievement in new_achievements)
+    hub.publish_many(live_events)
     
     return jsonify({
         'status': 'success',
+        'count': count,
+        'confidence': confidence_score,
         'points_earned': points_earned,
         'calories_burned': calories_burned,
         'total_points': user_data['points'],
@@ -1013,110 +943,46 @@ def capture_exercise():
         'current_streak': current_streak
     })
 
-@main_bp.route('/get_exercise_history')
+@games_bp.route('/get_exercise_history')
 def get_exercise_history():
     """Get user's exercise history"""
     user_data = get_current_user()
     if not user_data:
         return jsonify({'error': 'User not logged in'}), 401
     
-    if USE_SQLITE:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT et.*, gs.game_type, gs.score, gs.start_time, gs.duration
-                FROM exercise_tracking et
-                LEFT JOIN game_sessions gs ON et.session_id = gs.session_id
-                WHERE gs.username = ? OR et.session_id LIKE ?
-                ORDER BY et.timestamp DESC
-                LIMIT 50
-            ''', (user_data['username'], f"manual_{user_data['username']}%"))
-            
-            history = []
-            for row in cursor.fetchall():
-                history.append({
-                    'timestamp': row['timestamp'],
-                    'exercise_count': row['exercise_count'],
-                    'tracking_method': row['tracking_method'],
-                    'game_type': row['game_type'] if row['game_type'] else 'manual_exercise',
-                    'score': row['score'] if row['score'] else row['exercise_count'],
-                    'confidence_score': row['confidence_score']
-                })
-            
-            conn.close()
-            return jsonify(history)
-    
-    return jsonify([])
+    return jsonify(load_exercise_history(user_data['username']) or [])
 
-@main_bp.route('/dashboard')
-def dashboard():
-    """Enhanced dashboard with exercise tracking stats"""
-    user_data = get_current_user()
-    if not user_data:
-        flash('Please log in first', 'error')
-        return redirect(url_for('auth.login'))
-    
-    dashboard_stats = {
-        'total_points': user_data.get('points', 0),
-        'calories_burned': user_data.get('calories_burned', 0),
-        'workouts_completed': user_data.get('workouts_completed', 0),
-        'time_active': user_data.get('time_active', 0)
-    }
-    
-    # Get recent exercise data
-    if USE_SQLITE:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            
-            # Get recent sessions
-            cursor.execute('''
-                SELECT game_type, score, calories_burned, duration, end_time
-                FROM game_sessions 
-                WHERE username = ? 
-                ORDER BY end_time DESC 
-                LIMIT 5
-            ''', (user_data['username'],))
-            recent_workouts = [dict(row) for row in cursor.fetchall()]
-            
-            # Get exercise tracking stats for today
-            cursor.execute('''
-                SELECT COUNT(*) as exercises_today, SUM(exercise_count) as total_exercises
-                FROM exercise_tracking et
-                JOIN game_sessions gs ON et.session_id = gs.session_id
-                WHERE gs.username = ? AND DATE(et.timestamp) = DATE('now')
-            ''', (user_data['username'],))
-            today_stats = cursor.fetchone()
-            
-            # Get streak info
-            cursor.execute('''
-                SELECT current_streak, longest_streak 
-                FROM user_streaks 
-                WHERE username = ?
-            ''', (user_data['username'],))
-            streak_info = cursor.fetchone()
-            
-            conn.close()
-            
-            dashboard_stats.update({
-                'recent_workouts': recent_workouts,
-                'exercises_today': today_stats['total_exercises'] if today_stats else 0,
-                'current_streak': streak_info['current_streak'] if streak_info else 0,
-                'longest_streak': streak_info['longest_streak'] if streak_info else 0
-            })
+@cached('exercise_history', tags=lambda username: [user_tag(username)])
+def load_exercise_history(username: str) -> Optional[List[Dict[str, Any]]]:
+    """A user's latest 50 tracking points with the games they belong to"""
+    if not USE_SQLITE:
+        return None
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT et.*, gs.game_type, gs.score, gs.start_time, gs.duration
+        FROM exercise_tracking et
+        LEFT JOIN game_sessions gs ON et.game_session_id = gs.id
+        WHERE et.username = ?
+        ORDER BY et.timestamp DESC
+        LIMIT 50
+    ''', (username,))
     
-    return render_template('dashboard.html', stats=dashboard_stats)
-
-@main_bp.route('/check_usage_limit')
-def check_usage_limit():
-    daily_limit = 120  # 2 hours in minutes
-    current_usage = session.get('daily_usage', 0)
+    history = []
+    for row in cursor.fetchall():
+        history.append({
+            'timestamp': row['timestamp'],
+            'exercise_count': row['exercise_count'],
+            'tracking_method': row['tracking_method'],
+            'game_type': row['game_type'] if row['game_type'] else 'manual_exercise',
+            'score': row['score'] if row['score'] else row['exercise_count'],
+            'confidence_score': row['confidence_score']
+        })
     
-    if current_usage >= daily_limit:
-        return jsonify({'limit_reached': True, 'remaining_time': 0})
-    else:
-        return jsonify({'limit_reached': False, 'remaining_time': daily_limit - current_usage})
+    conn.close()
+    return history
 
 def award_badge(username, badge_id):
     """Award a badge to the user if they don't already have it"""
@@ -1152,6 +1018,8 @@ def award_badge(username, badge_id):
                 
                 conn.commit()
                 conn.close()
+                invalidate(user_tag(username))
+                bump_user_version()
                 return True
     
     # Fallback to session-based badges
@@ -1160,6 +1028,7 @@ def award_badge(username, badge_id):
         badges.append(badge_id)
         session['badges'] = badges
         session['points'] = session.get('points', 0) + 50
+        bump_user_version()
         return True
     return False
 
@@ -1194,7 +1063,7 @@ def check_badge_requirements():
     
     return new_badges
 
-@main_bp.route('/sync_exercise_data', methods=['POST'])
+@games_bp.route('/sync_exercise_data', methods=['POST'])
 def sync_exercise_data():
     """Sync exercise data from external devices or apps"""
     user_data = get_current_user()
@@ -1207,11 +1076,12 @@ def sync_exercise_data():
     synced_count = 0
     total_calories = 0
     total_points = 0
+    active_days = set()
+    tracking_ids = []
     
     for session in exercise_sessions:
         # Create tracking data
         tracking_data = {
-            'session_id': f"sync_{user_data['username']}_{datetime.now().timestamp()}_{synced_count}",
             'timestamp': session.get('timestamp', datetime.now().isoformat()),
             'exercise_count': session.get('count', 1),
             'tracking_method': session.get('source', 'external_sync'),
@@ -1219,7 +1089,13 @@ def sync_exercise_data():
             'confidence_score': session.get('confidence', 0.9)
         }
         
-        save_exercise_tracking_data([tracking_data])
+        tracking_ids.extend(save_exercise_tracking_data([tracking_data], user_data['username']))
+        
+        # Backfilled sessions count towards the day they happened on
+        try:
+            active_days.add(datetime.fromisoformat(str(tracking_data['timestamp'])).date().isoformat())
+        except ValueError:
+            active_days.add(date.today().isoformat())
         
         # Calculate rewards
         calories = session.get('calories', session.get('count', 1) * 0.5)
@@ -1235,16 +1111,41 @@ def sync_exercise_data():
         user_data['points'] = user_data.get('points', 0) + total_points
         user_data['workouts_completed'] = user_data.get('workouts_completed', 0) + synced_count
         save_user(user_data['username'], user_data)
+        bump_user_version()
         
-        # Check for new achievements
-        new_achievements = check_and_award_achievements(
-            user_data['username'], 'synced_exercise', synced_count, user_data
-        )
-    
-    return jsonify({
+        # Streaks and new achievements are updated in the background, achievements pushed
+        # when awarded; the key names the rows this upload added, so a later upload of the
+        # same payload is recorded as the new activity it is
+        job_id = enqueue('award_achievements', {
+            'username': user_data['username'],
+            'game_type': 'synced_exercise',
+            'score': synced_count,
+            'calories_burned': user_data['calories_burned'],
+            'active_days': sorted(active_days),
+            'channel': user_version_key()
+        }, key=f"sync:{user_data['username']}:{min(tracking_ids)}-{max(tracking_ids)}" if tracking_ids else None,
+            owner=user_version_key())
+    
+    response = {
         'status': 'success',
         'synced_sessions': synced_count,
         'total_calories': total_calories,
-        'total_points': total_points,
-        'new_achievements': new_achievements if synced_count > 0 else []
-    })
\ No newline at end of file
+        'total_points': total_points
+    }
+    if synced_count > 0:
+        response['achievements_job'] = {'id': job_id, 'status_url': url_for('jobs.job_status', job_id=job_id)}
+    return jsonify(response)
+
+@job_handler('award_achievements')
+def award_achievements(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Streak and achievement update after synced exercise; safe to re-run like post_game"""
+    streaks = None
+    if payload.get('active_days'):
+        streaks = record_activity(payload['username'], [date.fromisoformat(day) for day in payload['active_days']])
+    new_achievements = check_and_award_achievements(
+        payload['username'], payload['game_type'], payload['score'], {'calories_burned': payload['calories_burned']}
+    )
+    bump_version(payload['channel'])
+    hub.publish_many([(payload['channel'], 'achievement', achievement) for achievement in new_achievements])
+    current_streak, longest_streak = streaks or (None, None)
+    return {'current_streak': current_streak, 'longest_streak': longest_streak, 'new_achievements': new_achievements}
@@ -0,0 +1,21 @@
+from flask import Blueprint, jsonify
+from conditional import user_version_key
+from jobs import get_job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+# A job that hasn't finished is asked about again after this many seconds
+POLL_RETRY_SECONDS = 1
+
+@jobs_bp.route('/<int:job_id>')
+def job_status(job_id):
+    """Status and result of a background job started by the current user"""
+    job = get_job(job_id)
+    if job is None or job.pop('owner') != user_version_key():
+        return jsonify({'error': 'Job not found'}), 404
+
+    response = jsonify(job)
+    response.headers['Cache-Control'] = 'no-store'
+    if job['status'] in ('queued', 'running'):
+        response.headers['Retry-After'] = str(POLL_RETRY_SECONDS)
+    return response
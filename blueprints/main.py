@@ -1,12 +1,15 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
 from datetime import datetime
 import json
+from conditional import bump_user_version
+from live_counters import live_stats
+from usage_tracker import session_username, usage_limit_status
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', live=live_stats())
 
 @main_bp.route('/profile', methods=['GET', 'POST'])
 def profile():
@@ -15,6 +18,7 @@ def profile():
         session['age'] = int(request.form.get('age', session.get('age', 18)))
         session['weight'] = float(request.form.get('weight', session.get('weight', 70)))
         session['fitness_goal'] = request.form.get('fitness_goal', session.get('fitness_goal', 'weight_loss'))
+        bump_user_version()
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('main.profile'))
     
@@ -38,17 +42,12 @@ def leaderboard():
     for i, user in enumerate(leaderboard_data):
         user['rank'] = i + 1
     
-    return render_template('leaderboard.html', leaderboard=leaderboard_data)
+    return render_template('leaderboard.html', leaderboard=leaderboard_data, live=live_stats())
 
 @main_bp.route('/check_usage_limit')
 def check_usage_limit():
-    daily_limit = 120  # 2 hours in minutes
-    current_usage = session.get('daily_usage', 0)
-    
-    if current_usage >= daily_limit:
-        return {'limit_reached': True, 'remaining_time': 0}
-    else:
-        return {'limit_reached': False, 'remaining_time': daily_limit - current_usage}
+    # Active minutes over the last 24 hours, read from the shared usage table
+    return usage_limit_status(session_username())
 
 def award_badge(badge_id):
     """Award a badge to the user if they don't already have it"""
@@ -57,6 +56,7 @@ def award_badge(badge_id):
         badges.append(badge_id)
         session['badges'] = badges
         session['points'] = session.get('points', 0) + 50  # Bonus points for badge
+        bump_user_version()
         return True
     return False
 
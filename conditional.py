@@ -0,0 +1,150 @@
+# Conditional GET support using version counters instead of rendered bodies
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import lru_cache, wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import current_app, request, session, make_response
+
+from database import get_db_connection
+
+
+@lru_cache(maxsize=1)
+def build_version() -> str:
+    """Token for the deployed code, part of every ETag so a deploy never answers 304 with old HTML.
+
+    BUILD_VERSION or Render's RENDER_GIT_COMMIT when set, else a hash of the templates and static files.
+    """
+    configured = os.environ.get('BUILD_VERSION') or os.environ.get('RENDER_GIT_COMMIT')
+    if configured:
+        return configured
+    digest = hashlib.sha1()
+    for folder in ('templates', 'static'):
+        for root, dirs, files in os.walk(os.path.join(current_app.root_path, folder)):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, current_app.root_path).encode())
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def user_version_key(user_id=None) -> str:
+    """Version key for everything derived from one user's data"""
+    if user_id is None:
+        user_id = session.get('user_id', 'guest')
+        if user_id == 'guest':
+            # Every guest has user_id 'guest'; their own session keeps their data and events apart
+            return f"guest:{getattr(session, 'sid', None) or 'anonymous'}"
+    return f"user:{user_id}"
+
+
+def leaderboard_version_key(game_type: str) -> str:
+    """Version key for a single game's leaderboard"""
+    return f"leaderboard:{game_type}"
+
+
+def get_versions(keys: List[str]) -> Optional[Dict[str, Tuple[int, Optional[str]]]]:
+    """Return {key: (version, updated_at)} or None when no database is available"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    placeholders = ', '.join('?' for _ in keys)
+    cursor.execute(f'''
+        SELECT resource_key, version, updated_at FROM resource_versions
+        WHERE resource_key IN ({placeholders})
+    ''', keys)
+    versions = {row['resource_key']: (row['version'], row['updated_at']) for row in cursor.fetchall()}
+    conn.close()
+    return versions
+
+
+def bump_version(*keys: str):
+    """Mark resources as changed so clients holding old ETags refetch them"""
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT INTO resource_versions (resource_key, version, updated_at)
+        VALUES (?, 1, ?)
+        ON CONFLICT(resource_key) DO UPDATE SET
+            version = version + 1,
+            updated_at = excluded.updated_at
+    ''', [(key, now) for key in keys])
+    conn.commit()
+    conn.close()
+
+
+def bump_user_version(user_id=None):
+    """Mark the current (or given) user's data as changed"""
+    bump_version(user_version_key(user_id))
+
+
+def conditional_response(version_keys: Callable[..., List[str]],
+                         vary: Optional[Callable[..., str]] = None,
+                         private: bool = True):
+    """Answer 304 from version counters before the view does any work.
+
+    version_keys receives the view arguments and returns the resource keys the
+    response depends on. vary can add a cheap extra token (e.g. today's date).
+    Private responses are additionally scoped to the caller's session.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pending flash messages are consumed by rendering, never skip it then
+            if session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            keys = version_keys(**kwargs)
+            versions = get_versions(keys) if keys else {}
+            if versions is None:
+                return view(*args, **kwargs)
+
+            parts = [request.full_path, build_version()]
+            parts.extend(f"{key}={versions.get(key, (0, None))[0]}" for key in keys)
+            if vary:
+                parts.append(vary(**kwargs))
+            if private:
+                parts.append(str(session.get('user_id')))
+                parts.append(getattr(session, 'sid', '') or '')
+            etag = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+            stamps = [updated for _, updated in versions.values() if updated]
+            last_modified = None
+            if stamps:
+                last_modified = datetime.strptime(max(stamps), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+            # If-None-Match takes precedence; dates alone can't tell sessions apart
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = (not private and not vary and last_modified is not None
+                                and request.if_modified_since is not None
+                                and last_modified <= request.if_modified_since)
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if private:
+                response.cache_control.private = True
+            else:
+                response.cache_control.public = True
+            return response
+        return wrapper
+    return decorator
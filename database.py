@@ -0,0 +1,487 @@
+# Database configuration and one-time schema bootstrap
+import itertools
+import os
+import sqlite3
+import time
+from typing import Optional
+
+DATABASE_FILE = 'fitness_games.db'
+USE_SQLITE = True  # Set to False to use JSON file storage
+
+# Bump when the schema changes so existing databases are brought up to date
+SCHEMA_VERSION = 10
+
+# Game session ids: milliseconds since SESSION_EPOCH_MS above 22 low bits (10 of the
+# process id, 12 of a per-process counter), so they sort by start time and fit 63 bits
+SESSION_EPOCH_MS = 1704067200000  # 2024-01-01
+SESSION_SEQUENCE_BITS = 22
+_session_counter = itertools.count()
+
+def new_session_id(at: Optional[float] = None) -> int:
+    """A time-ordered integer key for a new game session (at: Unix time, default now)"""
+    milliseconds = int((time.time() if at is None else at) * 1000) - SESSION_EPOCH_MS
+    sequence = (os.getpid() & 0x3ff) << 12 | next(_session_counter) & 0xfff
+    return milliseconds << SESSION_SEQUENCE_BITS | sequence
+
+def add_column(cursor, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN, skipped when create_schema already made the column"""
+    columns = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+# Changes to tables that already exist, keyed by the version that introduced them.
+# create_schema always has the latest definitions, so every step must tolerate a fresh database.
+MIGRATIONS = {
+    3: [lambda cursor: add_column(cursor, 'exercise_tracking', 'sensor_frame', 'BLOB')],
+    5: [lambda cursor: add_column(cursor, 'game_sessions', 'audit_flags', 'INTEGER'),
+        lambda cursor: add_column(cursor, 'game_sessions', 'quarantined', 'INTEGER DEFAULT 0'),
+        lambda cursor: create_audit_indexes(cursor)],
+    6: [lambda cursor: backfill_activity_days(cursor)],
+    7: [lambda cursor: rekey_game_sessions(cursor)],
+    10: [lambda cursor: add_column(cursor, 'game_sessions', 'owner_key', 'TEXT')],
+}
+
+def backfill_activity_days(cursor):
+    """Fill activity_days from the history recorded before it existed"""
+    from activity_days import rebuild_activity_days
+    rebuild_activity_days(cursor)
+
+def create_audit_indexes(cursor):
+    """Indexes for anti_cheat.py: stats rebuilds and sessions awaiting audit"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_game_sessions_user_game ON game_sessions (username, game_type)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_game_sessions_unaudited ON game_sessions (audit_flags)
+        WHERE audit_flags IS NULL
+    ''')
+
+def create_tracking_indexes(cursor):
+    """exercise_tracking by game session (joins, audits) and by owner (history)"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_exercise_tracking_game_session ON exercise_tracking (game_session_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_exercise_tracking_user ON exercise_tracking (username, timestamp)')
+
+def legacy_owner(session_id):
+    """Username in a pre-schema-7 tracking key: manual_<user>_<time> or sync_<user>_<time>_<n>"""
+    for prefix, suffixes in (('manual_', 1), ('sync_', 2)):
+        if session_id and session_id.startswith(prefix):
+            return session_id[len(prefix):].rsplit('_', suffixes)[0]
+    return None
+
+def rekey_game_sessions(cursor):
+    """Replace the TEXT session_id keys with integer ones in game_sessions and exercise_tracking.
+    
+    Existing sessions keep their rowid as id, which is far below any new_session_id().
+    Tracking rows point at the integer id and name their owner, which the old keys
+    only encoded in their text.
+    """
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(game_sessions)')}
+    if 'session_id' in columns:
+        cursor.connection.create_function('legacy_owner', 1, legacy_owner, deterministic=True)
+        cursor.execute('ALTER TABLE game_sessions RENAME TO game_sessions_v6')
+        cursor.execute('ALTER TABLE exercise_tracking RENAME TO exercise_tracking_v6')
+        create_schema(cursor)
+        # Tables made before create_schema had user_id never gained it
+        copied = ['user_id', 'username', 'game_type', 'start_time', 'end_time', 'duration', 'score', 'points_earned',
+                  'calories_burned', 'tracking_method', 'raw_data', 'audit_flags', 'quarantined']
+        cursor.execute(f'''
+            INSERT INTO game_sessions (id, {', '.join(copied)})
+            SELECT rowid, {', '.join(column if column in columns else 'NULL' for column in copied)}
+            FROM game_sessions_v6 ORDER BY rowid
+        ''')
+        cursor.execute('''
+            INSERT INTO exercise_tracking
+            (id, game_session_id, username, timestamp, exercise_count, tracking_method, sensor_data,
+             sensor_frame, confidence_score)
+            SELECT et.id, gs.rowid, COALESCE(gs.username, legacy_owner(et.session_id)), et.timestamp,
+                   et.exercise_count, et.tracking_method, et.sensor_data, et.sensor_frame, et.confidence_score
+            FROM exercise_tracking_v6 et LEFT JOIN game_sessions_v6 gs ON gs.session_id = et.session_id
+            ORDER BY et.id
+        ''')
+        cursor.execute('DROP TABLE exercise_tracking_v6')
+        cursor.execute('DROP TABLE game_sessions_v6')
+    create_audit_indexes(cursor)
+    create_tracking_indexes(cursor)
+
+def init_database():
+    """Create the schema once; later calls are a single PRAGMA read"""
+    if not USE_SQLITE:
+        return
+        
+    conn = sqlite3.connect(DATABASE_FILE, timeout=30, isolation_level=None)
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        
+        # Take the write lock first so concurrent bootstraps run one at a time
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            conn.execute('ROLLBACK')
+            return
+        
+        cursor = conn.cursor()
+        create_schema(cursor)
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            for step in MIGRATIONS.get(target, []):
+                step(cursor)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.execute('COMMIT')
+        
+        # Readers no longer block the writer across gunicorn workers
+        conn.execute('PRAGMA journal_mode=WAL')
+    finally:
+        conn.close()
+
+def create_schema(cursor):
+    """Create all tables and default rows"""
+    # Users table - Fixed to include id column for compatibility
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT,
+            password_hash TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            points INTEGER DEFAULT 0,
+            calories_burned REAL DEFAULT 0,
+            time_active REAL DEFAULT 0,
+            workouts_completed INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1,
+            experience INTEGER DEFAULT 0
+        )
+    ''')
+    
+    # Game sessions, keyed by new_session_id()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS game_sessions (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            username TEXT,
+            game_type TEXT,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            duration REAL,
+            score INTEGER,
+            points_earned INTEGER,
+            calories_burned REAL,
+            tracking_method TEXT,
+            raw_data TEXT,
+            audit_flags INTEGER,
+            quarantined INTEGER DEFAULT 0,
+            owner_key TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+    
+    # Exercise tracking data table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exercise_tracking (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            game_session_id INTEGER,
+            username TEXT,
+            timestamp TIMESTAMP,
+            exercise_count INTEGER,
+            tracking_method TEXT,
+            sensor_data TEXT,
+            sensor_frame BLOB,
+            confidence_score REAL,
+            FOREIGN KEY (game_session_id) REFERENCES game_sessions (id),
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+    
+    # Game statistics table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS game_stats (
+            username TEXT,
+            game_type TEXT,
+            games_played INTEGER DEFAULT 0,
+            best_score INTEGER DEFAULT 0,
+            total_score INTEGER DEFAULT 0,
+            average_score REAL DEFAULT 0,
+            last_played TIMESTAMP,
+            PRIMARY KEY (username, game_type),
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+    
+    # Achievements table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS achievements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            achievement_id TEXT UNIQUE,
+            name TEXT,
+            description TEXT,
+            category TEXT,
+            points_reward INTEGER,
+            icon TEXT
+        )
+    ''')
+    
+    # User achievements table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            username TEXT,
+            achievement_id TEXT,
+            earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (username, achievement_id),
+            FOREIGN KEY (username) REFERENCES users (username),
+            FOREIGN KEY (achievement_id) REFERENCES achievements (achievement_id)
+        )
+    ''')
+    
+    # Streaks table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_streaks (
+            username TEXT PRIMARY KEY,
+            current_streak INTEGER DEFAULT 0,
+            longest_streak INTEGER DEFAULT 0,
+            last_activity_date DATE,
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+    
+    # Active days per user as a bitset (see activity_days.py); user_streaks is derived from it
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_days (
+            username TEXT PRIMARY KEY,
+            first_day INTEGER,
+            bits BLOB,
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+    
+    # Daily activities table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_activities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT,
+            activity_date DATE,
+            activity_type TEXT,
+            activity_data TEXT,
+            points_earned INTEGER,
+            calories_burned REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+    
+    # Change counters used for conditional GET responses
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resource_versions (
+            resource_key TEXT PRIMARY KEY,
+            version INTEGER DEFAULT 0,
+            updated_at TIMESTAMP
+        )
+    ''')
+    
+    # Recent live events, relayed between workers for Server-Sent Events
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT,
+            event TEXT,
+            data TEXT,
+            origin_pid INTEGER,
+            created_at REAL
+        )
+    ''')
+    
+    # Background jobs (see jobs.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            owner TEXT,
+            payload TEXT,
+            status TEXT NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            max_attempts INTEGER DEFAULT 5,
+            run_after REAL,
+            locked_by TEXT,
+            locked_until REAL,
+            result TEXT,
+            error TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (status, run_after)')
+    
+    # Daily totals checkpointed from the shared-memory counters (see live_counters.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS live_counters (
+            day TEXT,
+            name TEXT,
+            value INTEGER,
+            PRIMARY KEY (day, name)
+        )
+    ''')
+    
+    # Active minutes per user, flushed in batches from the shared usage table (see usage_tracker.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS usage_log (
+            username TEXT,
+            minute INTEGER,
+            PRIMARY KEY (username, minute)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Initialize default achievements
+    initialize_achievements(cursor)
+
+def initialize_achievements(cursor):
+    """Initialize default achievements in the database"""
+    achievements = [
+        {
+            'achievement_id': 'first_game',
+            'name': 'First Steps',
+            'description': 'Play your first fitness game',
+            'category': 'beginner',
+            'points_reward': 10,
+            'icon': 'fa-star'
+        },
+        {
+            'achievement_id': 'streak_3',
+            'name': 'Consistent Player',
+            'description': 'Play games for 3 days in a row',
+            'category': 'streak',
+            'points_reward': 25,
+            'icon': 'fa-fire'
+        },
+        {
+            'achievement_id': 'streak_7',
+            'name': 'Week Warrior',
+            'description': 'Play games for 7 days in a row',
+            'category': 'streak',
+            'points_reward': 75,
+            'icon': 'fa-medal'
+        },
+        {
+            'achievement_id': 'streak_30',
+            'name': 'Monthly Master',
+            'description': 'Play games for 30 days in a row',
+            'category': 'streak',
+            'points_reward': 300,
+            'icon': 'fa-crown'
+        },
+        {
+            'achievement_id': 'squat_master',
+            'name': 'Squat Master',
+            'description': 'Score 100+ in Squat Tap Challenge',
+            'category': 'performance',
+            'points_reward': 50,
+            'icon': 'fa-arrows-alt-v'
+        },
+        {
+            'achievement_id': 'jump_champion',
+            'name': 'Jump Champion',
+            'description': 'Score 50+ in Jump Counter',
+            'category': 'performance',
+            'points_reward': 40,
+            'icon': 'fa-arrow-up'
+        },
+        {
+            'achievement_id': 'plank_pro',
+            'name': 'Plank Pro',
+            'description': 'Hold plank for 120+ seconds',
+            'category': 'endurance',
+            'points_reward': 60,
+            'icon': 'fa-clock'
+        },
+        {
+            'achievement_id': 'burpee_beast',
+            'name': 'Burpee Beast',
+            'description': 'Complete 25+ burpees',
+            'category': 'strength',
+            'points_reward': 80,
+            'icon': 'fa-dumbbell'
+        },
+        {
+            'achievement_id': 'game_addict',
+            'name': 'Game Addict',
+            'description': 'Play 100 games total',
+            'category': 'milestone',
+            'points_reward': 200,
+            'icon': 'fa-gamepad'
+        },
+        {
+            'achievement_id': 'calorie_burner',
+            'name': 'Calorie Burner',
+            'description': 'Burn 1000+ total calories',
+            'category': 'fitness',
+            'points_reward': 150,
+            'icon': 'fa-fire-alt'
+        }
+    ]
+    
+    for achievement in achievements:
+        cursor.execute('''
+            INSERT OR IGNORE INTO achievements 
+            (achievement_id, name, description, category, points_reward, icon)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            achievement['achievement_id'],
+            achievement['name'], 
+            achievement['description'],
+            achievement['category'],
+            achievement['points_reward'],
+            achievement['icon']
+        ))
+
+# Callables notified with (sql, params, seconds) after every statement or commit
+QUERY_LISTENERS = []
+# Callables notified with each new connection
+CONNECTION_LISTENERS = []
+
+def _notify(sql, params, started):
+    duration = time.perf_counter() - started
+    for listener in QUERY_LISTENERS:
+        listener(sql, params, duration)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports statement timings to QUERY_LISTENERS"""
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _notify(sql, parameters, started)
+    
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _notify(sql, None, started)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including implicit ones) are instrumented"""
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _notify('COMMIT', None, started)
+
+def get_db_connection():
+    """Get database connection"""
+    if USE_SQLITE:
+        conn = sqlite3.connect(DATABASE_FILE, factory=InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        for listener in CONNECTION_LISTENERS:
+            listener(conn)
+        return conn
+    return None
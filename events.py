@@ -0,0 +1,175 @@
+# In-process pub/sub hub for Server-Sent Events, relayed between workers through SQLite
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Events held per connection; the oldest are dropped when a client falls behind
+SUBSCRIBER_BUFFER_SIZE = 100
+MAX_SUBSCRIBERS = int(os.environ.get('SSE_MAX_SUBSCRIBERS', 5000))
+
+# How often each worker with subscribers picks up events published by other workers
+RELAY_POLL_SECONDS = 1.0
+EVENT_LOG_RETENTION_SECONDS = 300
+
+
+class Subscription:
+    """One client connection's bounded event buffer"""
+
+    def __init__(self, hub: 'EventHub', channels: Set[str], buffer_size: int):
+        self.hub = hub
+        self.channels = channels
+        self.buffer = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.condition = threading.Condition()
+
+    def put(self, event: Dict[str, Any]):
+        with self.condition:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(event)
+            self.condition.notify()
+
+    def get(self, timeout: float) -> List[Dict[str, Any]]:
+        """Wait up to timeout seconds and return everything buffered"""
+        with self.condition:
+            if not self.buffer:
+                self.condition.wait(timeout)
+            events = list(self.buffer)
+            self.buffer.clear()
+            return events
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """Fan out published events to the subscriptions of matching channels"""
+
+    def __init__(self, buffer_size: int = SUBSCRIBER_BUFFER_SIZE, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._channels: Dict[str, Set[Subscription]] = {}
+        self._count = 0
+        self._relay_pid = None
+        self._last_event_id = None
+
+    def subscribe(self, channels: List[str]) -> Optional[Subscription]:
+        """Register a connection, or return None when this worker is full"""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            subscription = Subscription(self, set(channels), self.buffer_size)
+            for channel in subscription.channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+            self._count += 1
+        self._ensure_relay()
+        if self._last_event_id is None:
+            self._last_event_id = self._latest_event_id()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers and subscription in subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+            self._count -= 1
+
+    def publish(self, channel: str, event: str, data: Dict[str, Any]):
+        self.publish_many([(channel, event, data)])
+
+    def publish_many(self, events: List[Tuple[str, str, Dict[str, Any]]]):
+        """Deliver locally now and log for the other workers' relays"""
+        if not events:
+            return
+
+        now = time.time()
+        conn = get_db_connection()
+        if conn:
+            cursor = conn.cursor()
+            for channel, event, data in events:
+                cursor.execute('''
+                    INSERT INTO event_log (channel, event, data, origin_pid, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (channel, event, json.dumps(data, default=str), os.getpid(), now))
+                self._deliver(channel, {'id': cursor.lastrowid, 'event': event, 'data': data})
+            if cursor.lastrowid % 100 == 0:
+                cursor.execute('DELETE FROM event_log WHERE created_at < ?',
+                               (now - EVENT_LOG_RETENTION_SECONDS,))
+            conn.commit()
+            conn.close()
+        else:
+            for channel, event, data in events:
+                self._deliver(channel, {'id': None, 'event': event, 'data': data})
+
+    def _deliver(self, channel: str, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def _latest_event_id(self) -> Optional[int]:
+        conn = get_db_connection()
+        if not conn:
+            return None
+        row = conn.execute('SELECT MAX(id) FROM event_log').fetchone()
+        conn.close()
+        return row[0] or 0
+
+    def _ensure_relay(self):
+        """Start this process's relay thread (forked workers need their own)"""
+        pid = os.getpid()
+        with self._lock:
+            if self._relay_pid == pid:
+                return
+            self._relay_pid = pid
+            self._last_event_id = None
+        threading.Thread(target=self._relay_loop, name='sse-relay', daemon=True).start()
+
+    def _relay_loop(self):
+        pid = os.getpid()
+        while True:
+            time.sleep(RELAY_POLL_SECONDS)
+            with self._lock:
+                active = self._count > 0
+            if not active:
+                # Nobody is listening, so skip ahead instead of replaying later
+                self._last_event_id = None
+                continue
+            if self._last_event_id is None:
+                self._last_event_id = self._latest_event_id()
+                continue
+
+            conn = get_db_connection()
+            if not conn:
+                return
+            try:
+                rows = conn.execute('''
+                    SELECT id, channel, event, data, origin_pid FROM event_log
+                    WHERE id > ? ORDER BY id
+                ''', (self._last_event_id,)).fetchall()
+            except Exception:
+                logger.exception('Event relay poll failed')
+                continue
+            finally:
+                conn.close()
+
+            for row in rows:
+                self._last_event_id = row['id']
+                if row['origin_pid'] != pid:
+                    self._deliver(row['channel'], {'id': row['id'], 'event': row['event'],
+                                                   'data': json.loads(row['data'])})
+
+
+hub = EventHub()
@@ -0,0 +1,197 @@
+# In-memory autocomplete over the food catalogue: word-prefix lookup with a trigram fallback for typos
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from nutrition import get_planner
+
+# Prefixes this short cover too many words to merge per keystroke, so their item lists are precomputed
+SHORT_PREFIX = 2
+# Best-ranked candidates checked against the other query words before falling back to all of them
+FIRST_PASS = 64
+# Share of a query word's trigrams a catalogue word must contain to count as its correction
+FUZZY_MIN_CONTAINMENT = 0.5
+# Closest corrections tried per misspelled word
+FUZZY_WORDS = 5
+
+
+def normalize(text: str) -> str:
+    return ' '.join(re.findall(r'[a-z0-9]+', text.lower()))
+
+
+def trigrams(word: str) -> List[str]:
+    padded = f"${word}$"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def postings_table(lists: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted id lists packed into one array, list k at ids[offsets[k]:offsets[k + 1]]"""
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(items) for items in lists])
+    ids = np.fromiter((item for items in lists for item in items), dtype=np.int32, count=int(offsets[-1]))
+    return ids, offsets
+
+
+class FoodSearchIndex:
+    """Ranked autocomplete over food names.
+
+    Items are numbered by rank (shorter, then alphabetical names first), so
+    every id list is already in result order and the first matches found are
+    the best ones.
+    """
+
+    def __init__(self, names: Sequence[str], limit: int = 10):
+        order = sorted(range(len(names)), key=lambda index: (len(names[index]), names[index].lower()))
+        # rank -> position in the catalogue the index was built from
+        self.catalogue_ids = order
+        self.names = [names[index] for index in order]
+        self.normalized = [normalize(name) for name in self.names]
+        self.limit = limit
+
+        # Sorted vocabulary; the words starting with a prefix are a contiguous range of it
+        words_of = [sorted(set(name.split())) for name in self.normalized]
+        self.vocab = sorted({word for words in words_of for word in words})
+        word_index = {word: number for number, word in enumerate(self.vocab)}
+        word_items: List[List[int]] = [[] for _ in self.vocab]
+        # Each item's word numbers, padded with -1, to test a range against many items at once
+        self.item_words = np.full((len(self.names), max((len(words) for words in words_of), default=1)),
+                                  -1, dtype=np.int32)
+        for item, words in enumerate(words_of):
+            for column, word in enumerate(words):
+                number = word_index[word]
+                word_items[number].append(item)
+                self.item_words[item, column] = number
+        self.word_ids, self.word_offsets = postings_table(word_items)
+
+        self.short_prefixes: Dict[str, np.ndarray] = {}
+        for word in self.vocab:
+            for length in range(1, min(SHORT_PREFIX, len(word)) + 1):
+                prefix = word[:length]
+                if prefix not in self.short_prefixes:
+                    low, high = self.word_range(prefix)
+                    self.short_prefixes[prefix] = np.unique(self.word_ids[self.word_offsets[low]:self.word_offsets[high]])
+
+        # Trigrams of the vocabulary, for correcting misspelled query words
+        gram_words: Dict[str, List[int]] = {}
+        for number, word in enumerate(self.vocab):
+            for gram in set(trigrams(word)):
+                gram_words.setdefault(gram, []).append(number)
+        self.grams = {gram: np.array(numbers, dtype=np.int32) for gram, numbers in gram_words.items()}
+        self.gram_counts = np.array([len(set(trigrams(word))) for word in self.vocab], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    def word_range(self, prefix: str) -> Tuple[int, int]:
+        """Vocabulary numbers [low, high) of the words starting with prefix"""
+        low = bisect_left(self.vocab, prefix)
+        return low, bisect_left(self.vocab, prefix + '\uffff', low)
+
+    def ranked_ids(self, prefix: str, low: int, high: int, count: int = None) -> np.ndarray:
+        """The count best-ranked items (all when None) with a word in vocab[low:high]"""
+        if prefix in self.short_prefixes:
+            return self.short_prefixes[prefix][:count]
+        return self.items_with(np.arange(low, high), count)
+
+    def items_with(self, numbers: np.ndarray, count: int = None, each: bool = False) -> np.ndarray:
+        """Sorted ids of items containing any of the given words, the first count of them
+        (or of each word's items, when each is set)"""
+        starts, ends = self.word_offsets[numbers], self.word_offsets[numbers + 1]
+        if count is not None:
+            ends = np.minimum(ends, starts + count)
+        if len(numbers) == 1:
+            return self.word_ids[starts[0]:ends[0]]
+        items = np.unique(np.concatenate([self.word_ids[start:end] for start, end in zip(starts, ends)]))
+        return items if each else items[:count]
+
+    def search(self, query: str, limit: int = None) -> Dict:
+        """Items whose words start with every query word, or typo matches when there are none"""
+        limit = limit or self.limit
+        terms = normalize(query).split()
+        if not terms:
+            return {'results': [], 'fuzzy': False}
+
+        results = self.prefix_matches(terms, limit)
+        # Names that start with the query go first
+        phrase = ' '.join(terms)
+        results.sort(key=lambda item: not self.normalized[item].startswith(phrase))
+
+        # Only a query with no prefix match is treated as a typo
+        fuzzy = False
+        if not results:
+            results = self.fuzzy_ids(terms, limit)
+            fuzzy = bool(results)
+
+        return {'results': [(self.names[item], self.catalogue_ids[item]) for item in results], 'fuzzy': fuzzy}
+
+    def prefix_matches(self, terms: List[str], limit: int) -> List[int]:
+        ranges = [(term, *self.word_range(term)) for term in terms]
+        if any(low == high for _, low, high in ranges):
+            return []
+        # Walk the term matching the fewest items in rank order, testing the others per candidate
+        ranges.sort(key=lambda term_range: self.word_offsets[term_range[2]] - self.word_offsets[term_range[1]])
+        driver = ranges.pop(0)
+        if not ranges:
+            # One word: its items are already the results, in rank order
+            return self.ranked_ids(*driver, limit).tolist()
+
+        # Most queries fill up from the best-ranked few; rare combinations need the whole list
+        for count in (max(FIRST_PASS, limit), None):
+            candidates = self.ranked_ids(*driver, count)
+            matches, words = candidates, self.item_words[candidates]
+            # Most selective first, so later terms test fewer rows
+            for _, low, high in ranges:
+                keep = ((words >= low) & (words < high)).any(axis=1)
+                matches, words = matches[keep], words[keep]
+            if len(matches) >= limit or count is None or len(candidates) < count:
+                return [int(item) for item in matches[:limit]]
+
+    def corrections(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Vocabulary words sharing most of term's trigrams, with their similarity"""
+        grams = set(trigrams(term))
+        postings = [self.grams[gram] for gram in grams if gram in self.grams]
+        if not postings:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.vocab))
+        numbers = np.flatnonzero(shared >= len(grams) * FUZZY_MIN_CONTAINMENT)
+        similarity = shared[numbers] / (len(grams) + self.gram_counts[numbers] - shared[numbers])
+        best = np.argsort(-similarity, kind='stable')[:FUZZY_WORDS]
+        return numbers[best], similarity[best]
+
+    def fuzzy_ids(self, terms: List[str], limit: int) -> List[int]:
+        """Items containing a close spelling of every query word, most similar first"""
+        corrections = [self.corrections(term) for term in terms]
+        if any(not len(numbers) for numbers, _ in corrections):
+            return []
+        sizes = [int((self.word_offsets[numbers + 1] - self.word_offsets[numbers]).sum()) for numbers, _ in corrections]
+        driver = corrections[int(np.argmin(sizes))][0]
+
+        # An item scores its best correction of each word, and every correction's items are in
+        # rank order, so a one-word query's results are among the first limit items of each
+        # correction. More words can need the whole lists, when the first pass falls short.
+        for count in (max(FIRST_PASS, limit), None):
+            candidates = self.items_with(driver, count, each=True)
+            words = self.item_words[candidates]
+            total = np.zeros(len(candidates))
+            keep = np.ones(len(candidates), dtype=bool)
+            for numbers, similarity in corrections:
+                # Padding (-1) reads the trailing zero
+                lookup = np.zeros(len(self.vocab) + 1)
+                lookup[numbers] = similarity
+                best = lookup[words].max(axis=1)
+                total += best
+                keep &= best > 0
+            matches, total = candidates[keep], total[keep]
+            truncated = count is not None and bool((self.word_offsets[driver + 1] - self.word_offsets[driver] > count).any())
+            if len(terms) == 1 or len(matches) >= limit or not truncated:
+                order = np.lexsort((matches, -total))[:limit]
+                return [int(item) for item in matches[order]]
+
+
+@lru_cache(maxsize=1)
+def get_search_index() -> FoodSearchIndex:
+    """Index of the nutrient table's foods, built once per process"""
+    return FoodSearchIndex(get_planner().table.names)
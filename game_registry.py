@@ -0,0 +1,128 @@
+# Game definitions from data/games.json, shared by rewards, exercise capture and /games/game_data
+import hashlib
+import json
+import logging
+import os
+import signal
+import threading
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+GAMES_FILE = os.environ.get('GAMES_FILE') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'games.json')
+
+
+class Game(NamedTuple):
+    key: str
+    name: str
+    description: str
+    icon: str
+    target_score: int
+    time_limit: int
+    exercise: str
+    points_per_unit: float
+    calories_per_unit: float
+
+    def catalogue_entry(self) -> dict:
+        entry = self._asdict()
+        del entry['key']
+        return entry
+
+
+class GameRegistry:
+    """One load of the games file. Never mutated; a reload swaps in a new instance."""
+
+    def __init__(self, games: Mapping[str, Game], exercise_calories: Mapping[str, float],
+                 default_points: float, default_calories: float, duration_bonus: Mapping[str, float],
+                 version: str):
+        self.games = MappingProxyType(dict(games))
+        self.exercise_calories = MappingProxyType(dict(exercise_calories))
+        self.default_points = default_points
+        self.default_calories = default_calories
+        self.duration_bonus = MappingProxyType(dict(duration_bonus))
+        self.version = version
+        # /games/game_data sends these bytes as they are
+        self.catalogue_body = json.dumps({key: game.catalogue_entry() for key, game in self.games.items()},
+                                         separators=(',', ':')).encode()
+
+    @classmethod
+    def load(cls, path: str = GAMES_FILE) -> 'GameRegistry':
+        with open(path, 'rb') as f:
+            raw = f.read()
+        data = json.loads(raw)
+        default = data['default']
+        exercises = {name: float(calories) for name, calories in data['exercises'].items()}
+        games = {}
+        for key, spec in data['games'].items():
+            games[key] = Game(
+                key=key,
+                name=spec['name'],
+                description=spec['description'],
+                icon=spec['icon'],
+                target_score=int(spec['target_score']),
+                time_limit=int(spec['time_limit']),
+                exercise=spec['exercise'],
+                points_per_unit=spec['points_per_unit'],
+                calories_per_unit=exercises.get(spec['exercise'], default['calories_per_unit']),
+            )
+        return cls(games, exercises, default['points_per_unit'], default['calories_per_unit'],
+                   data['duration_bonus'], hashlib.sha1(raw).hexdigest()[:12])
+
+    def multipliers(self, game_type: str) -> Tuple[float, float]:
+        """Points and calories per unit of score; unknown games get the defaults"""
+        game = self.games.get(game_type)
+        if game is None:
+            return self.default_points, self.default_calories
+        return game.points_per_unit, game.calories_per_unit
+
+    def calories_per_exercise(self, exercise_type: str) -> float:
+        return self.exercise_calories.get(exercise_type, self.default_calories)
+
+
+_registry = None
+_load_lock = threading.Lock()
+
+
+def get_registry() -> GameRegistry:
+    """The current registry; keep the returned object for the whole request"""
+    if _registry is None:
+        with _load_lock:
+            if _registry is None:
+                reload_registry()
+    return _registry
+
+
+def reload_registry(path: str = None) -> GameRegistry:
+    """Re-read the games file; a broken file is logged and the loaded registry kept"""
+    global _registry
+    try:
+        registry = GameRegistry.load(path or GAMES_FILE)
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        if _registry is None:
+            raise
+        logger.error('Game registry reload failed, keeping the loaded version',
+                     extra={'event': 'game_registry_reload_failed', 'version': _registry.version,
+                            'error': str(exc)})
+        return _registry
+
+    _registry = registry
+    logger.info('Game registry loaded', extra={'event': 'game_registry_loaded', 'version': registry.version,
+                                               'games': len(registry.games)})
+    return registry
+
+
+def handle_sighup(signum, frame):
+    reload_registry()
+
+
+def init_game_registry():
+    """Load the registry up front and reload it on SIGHUP.
+
+    Under gunicorn the master owns SIGHUP: its on_reload hook (gunicorn_config.py)
+    re-reads the file and the replacement workers fork with the new registry.
+    """
+    get_registry()
+    if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, handle_sighup)
@@ -1,18 +1,68 @@
+import importlib.util
 import multiprocessing
 import os
 
+# Worker profiles, selected with GUNICORN_PROFILE (see README for measured throughput)
+#   sync   - one request per process, the safe default
+#   gthread - fewer processes with a thread pool each, better for I/O waits on SQLite/sessions
+#   gevent - cooperative workers for many slow or idle connections (needs `pip install gevent`)
+#   events - gevent tuned to hold thousands of idle /events/stream connections
+CPU_COUNT = multiprocessing.cpu_count()
+WORKER_PROFILES = {
+    'sync': {
+        'worker_class': 'sync',
+        'workers': CPU_COUNT * 2 + 1,
+        'threads': 1,
+    },
+    'gthread': {
+        'worker_class': 'gthread',
+        'workers': CPU_COUNT + 1,
+        'threads': 4,
+    },
+    'gevent': {
+        'worker_class': 'gevent',
+        'workers': CPU_COUNT,
+        'threads': 1,
+        'worker_connections': 1000,
+    },
+    'events': {
+        'worker_class': 'gevent',
+        'workers': CPU_COUNT,
+        'threads': 1,
+        'worker_connections': 5000,
+    },
+}
+
+profile_name = os.environ.get('GUNICORN_PROFILE', 'sync')
+if profile_name not in WORKER_PROFILES:
+    raise RuntimeError(f"Unknown GUNICORN_PROFILE {profile_name!r}, expected one of {sorted(WORKER_PROFILES)}")
+if WORKER_PROFILES[profile_name]['worker_class'] == 'gevent' and importlib.util.find_spec('gevent') is None:
+    raise RuntimeError(f"GUNICORN_PROFILE={profile_name} requires the gevent package")
+profile = WORKER_PROFILES[profile_name]
+
 # Server configuration
 bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+worker_class = profile['worker_class']
+workers = int(os.environ.get('GUNICORN_WORKERS', profile['workers']))
+threads = int(os.environ.get('GUNICORN_THREADS', profile['threads']))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', profile.get('worker_connections', 1000)))
 timeout = 60
 keepalive = 2
 
+# Recycle workers to bound memory growth; jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+
+# Load the app once in the master so the schema bootstrap runs a single time
+# and workers fork with templates already compiled
+preload_app = True
+
 # Process naming
 proc_name = "fitplay"
 
-# Logging
-accesslog = "-"
+# Logging (the app emits structured access records itself; set GUNICORN_ACCESS_LOG=- to
+# also get gunicorn's synchronous access log)
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")
 errorlog = "-"
 loglevel = "info"
 
@@ -27,10 +77,47 @@ keyfile = os.environ.get("GUNICORN_KEYFILE")
 certfile = os.environ.get("GUNICORN_CERTFILE")
 
 # Server hooks
+def on_starting(server):
+    """Called just before the master process is initialized."""
+    from metrics import reset_metrics_dir
+    reset_metrics_dir()
+    # Shared with every worker forked from here
+    from game_registry import get_registry
+    from live_counters import create_counters
+    create_counters(get_registry().games)
+
+def pre_fork(server, worker):
+    """Called in the master just before a worker is forked."""
+    from live_counters import assign_worker_slot
+    assign_worker_slot(server, worker)
+
 def post_fork(server, worker):
     """Called after a worker has been forked."""
-    pass
+    from admission import configure_worker
+    configure_worker(server, worker)
+    # Preloaded workers inherit the master's compiled templates
+    if not server.cfg.preload_app:
+        from app import precompile_templates
+        precompile_templates()
+
+def on_reload(server):
+    """Called in the master on SIGHUP, before the replacement workers are spawned."""
+    # Preloaded workers fork from the master, so refresh what they inherit
+    if server.cfg.preload_app:
+        from game_registry import get_registry, reload_registry
+        from live_counters import register_games
+        reload_registry()
+        register_games(get_registry().games)
 
 def when_ready(server):
     """Called when the server is ready."""
-    print("FitPlay server is ready. Spawning workers")
+    if server.cfg.preload_app:
+        from app import precompile_templates
+        count = precompile_templates()
+        print(f"Precompiled {count} templates")
+    print(f"FitPlay server is ready ({profile_name} profile). Spawning workers")
+
+def on_exit(server):
+    """Called in the master just before it exits."""
+    from live_counters import close_counters
+    close_counters()
@@ -0,0 +1,237 @@
+# Durable background jobs in SQLite, run by threads in each app process or by `flask worker`
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import click
+
+from database import get_db_connection
+from events import hub
+
+logger = logging.getLogger(__name__)
+
+# Threads started in each app process on its first enqueue; 0 leaves the queue to `flask worker`
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 1))
+# How often idle workers look for jobs queued by other processes
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1.0))
+# A running job whose worker died is handed out again after this long
+JOB_LEASE_SECONDS = 60
+DEFAULT_MAX_ATTEMPTS = 5
+# Retry n waits RETRY_BASE_SECONDS * 2**(n-1), up to RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = 2
+RETRY_MAX_SECONDS = 300
+# Finished jobs are kept this long for polling
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+# kind -> handler(payload) returning a JSON-serializable result
+HANDLERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+
+
+def job_handler(kind: str):
+    """Register the handler for a job kind.
+
+    A job can run more than once (retries, or a worker dying mid-job), so
+    handlers must be idempotent.
+    """
+    def decorator(handler):
+        HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+def enqueue(kind: str, payload: Dict[str, Any], key: Optional[str] = None, owner: Optional[str] = None,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> Optional[int]:
+    """Queue a job and return its id.
+
+    Jobs with the same key are the same work: enqueueing again returns the
+    existing job. owner is the event channel (user_version_key()) that may poll
+    the job and is told when it finishes.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    now = time.time()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR IGNORE INTO jobs
+        (kind, idempotency_key, owner, payload, status, attempts, max_attempts, run_after, created_at, updated_at)
+        VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?)
+    ''', (kind, key, owner, json.dumps(payload, default=str), max_attempts, now, now, now))
+    if cursor.rowcount:
+        job_id = cursor.lastrowid
+    else:
+        job_id = cursor.execute('SELECT id FROM jobs WHERE idempotency_key = ?', (key,)).fetchone()['id']
+    conn.commit()
+    conn.close()
+
+    if JOB_WORKER_THREADS > 0:
+        runner.ensure_started(JOB_WORKER_THREADS)
+    runner.wake()
+    return job_id
+
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    conn = get_db_connection()
+    if not conn:
+        return None
+    row = conn.execute('''
+        SELECT id, kind, owner, status, attempts, max_attempts, result, error, created_at, updated_at
+        FROM jobs WHERE id = ?
+    ''', (job_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def claim_job(worker_id: str):
+    """Lease the next due job to this worker, or return None"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    now = time.time()
+    row = conn.execute('''
+        UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?, locked_until = ?,
+                        updated_at = ?
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE (status = 'queued' AND run_after <= ?) OR (status = 'running' AND locked_until < ?)
+            ORDER BY run_after LIMIT 1
+        )
+        RETURNING id, kind, owner, payload, attempts, max_attempts
+    ''', (worker_id, now + JOB_LEASE_SECONDS, now, now, now)).fetchone()
+    conn.commit()
+    conn.close()
+    return row
+
+
+def finish_job(job, status: str, result: Any = None, error: Optional[str] = None, retry_in: float = 0.0):
+    now = time.time()
+    conn = get_db_connection()
+    if not conn:
+        return
+    conn.execute('''
+        UPDATE jobs SET status = ?, result = ?, error = ?, run_after = ?, locked_by = NULL,
+                        locked_until = NULL, updated_at = ?
+        WHERE id = ?
+    ''', (status, json.dumps(result, default=str) if result is not None else None, error,
+          now + retry_in, now, job['id']))
+    if job['id'] % 100 == 0:
+        conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                     (now - JOB_RETENTION_SECONDS,))
+    conn.commit()
+    conn.close()
+
+    if status in ('done', 'failed') and job['owner']:
+        hub.publish(job['owner'], 'job', {'id': job['id'], 'kind': job['kind'], 'status': status,
+                                          'result': result, 'error': error})
+
+
+def run_next_job(worker_id: str) -> bool:
+    """Run one due job; False when there was nothing to do"""
+    job = claim_job(worker_id)
+    if job is None:
+        return False
+
+    extra = {'event': 'job', 'job_id': job['id'], 'job_kind': job['kind'], 'attempt': job['attempts']}
+    if job['attempts'] > job['max_attempts']:
+        # Its lease ran out on the last attempt, most likely because the worker died
+        logger.error('Job abandoned after its last attempt', extra=extra)
+        finish_job(job, 'failed', error='worker lost')
+        return True
+
+    handler = HANDLERS.get(job['kind'])
+    started = time.perf_counter()
+    try:
+        if handler is None:
+            raise LookupError(f"no handler registered for job kind {job['kind']!r}")
+        result = handler(json.loads(job['payload']))
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        if job['attempts'] < job['max_attempts']:
+            delay = min(RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1), RETRY_MAX_SECONDS)
+            logger.warning('Job failed, retrying in %ss', delay, exc_info=True, extra=extra)
+            finish_job(job, 'queued', error=error, retry_in=delay)
+        else:
+            logger.error('Job failed permanently', exc_info=True, extra=extra)
+            finish_job(job, 'failed', error=error)
+        return True
+
+    extra['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info('Job done', extra=extra)
+    finish_job(job, 'done', result=result)
+    return True
+
+
+class JobRunner:
+    """Worker threads for this process, started on demand (forked workers need their own)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._wake = threading.Event()
+
+    def ensure_started(self, threads: int):
+        pid = os.getpid()
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._wake = threading.Event()
+        for number in range(threads):
+            threading.Thread(target=self.work, args=(self.worker_id(number),),
+                             name=f'job-worker-{number}', daemon=True).start()
+
+    def wake(self):
+        self._wake.set()
+
+    def worker_id(self, number: int) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}:{number}"
+
+    def work(self, worker_id: str, stop: Optional[threading.Event] = None, drain: bool = False):
+        """Run jobs until stop is set (or, with drain, until none are due)"""
+        while stop is None or not stop.is_set():
+            try:
+                ran = run_next_job(worker_id)
+            except Exception:
+                logger.exception('Job worker poll failed')
+                ran = False
+            if ran:
+                continue
+            if drain:
+                return
+            self._wake.wait(JOB_POLL_SECONDS)
+            self._wake.clear()
+
+
+runner = JobRunner()
+
+
+def init_jobs(app):
+    """Add the `flask worker` command"""
+    @app.cli.command('worker')
+    @click.option('--threads', default=2, show_default=True, help='jobs run at once')
+    @click.option('--drain', is_flag=True, help='exit once no jobs are due')
+    def worker(threads, drain):
+        """Run queued background jobs (set JOB_WORKER_THREADS=0 on the web processes)"""
+        stop = threading.Event()
+        workers = [threading.Thread(target=runner.work, args=(runner.worker_id(number), stop, drain),
+                                    name=f'job-worker-{number}') for number in range(threads)]
+        for thread in workers:
+            thread.start()
+        click.echo(f"Running jobs with {threads} threads: {', '.join(sorted(HANDLERS))}")
+        try:
+            for thread in workers:
+                while thread.is_alive():
+                    thread.join(1)
+        except KeyboardInterrupt:
+            stop.set()
+            runner.wake()
+            for thread in workers:
+                thread.join()
@@ -0,0 +1,255 @@
+# Host-wide live statistics in shared memory: one slot per worker, summed on read, checkpointed to SQLite
+import atexit
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Counters every process may bump; `plays:<game_type>` ones are added from the game registry
+BASE_COUNTERS = ('games_started', 'games_finished', 'reps')
+MAX_COUNTERS = 128
+# Slot 0 holds the last checkpoint, slots 1.. are workers
+MAX_WORKERS = 256
+# Players online are users seen in the last ONLINE_MINUTES, counted in bitmaps of ONLINE_BITS
+ONLINE_MINUTES = 5
+ONLINE_BITS = 4096
+# How often totals are written to the live_counters table
+CHECKPOINT_SECONDS = float(os.environ.get('LIVE_COUNTERS_CHECKPOINT_SECONDS', 30))
+
+HEADER = np.dtype([
+    ('checkpointed_at', '<f8'),
+    ('names', 'S48', (MAX_COUNTERS,)),
+])
+SLOT = np.dtype([
+    ('day', '<i8'),
+    ('counters', '<i8', (MAX_COUNTERS,)),
+    ('online_minute', '<i8', (ONLINE_MINUTES,)),
+    ('online', 'u1', (ONLINE_MINUTES, ONLINE_BITS // 8)),
+])
+
+
+class LiveCounters:
+    """Counter table in one shared memory segment.
+
+    Each process only writes its own slot, so increments take no cross-process
+    lock; readers add the slots up. The process that created the segment owns
+    the counter names, and workers forked from it inherit the mapping.
+    """
+
+    def __init__(self):
+        # A new segment is zero-filled: no names, no counts
+        self.memory = shared_memory.SharedMemory(create=True, size=HEADER.itemsize + SLOT.itemsize * (MAX_WORKERS + 1))
+        self.header = np.ndarray((), dtype=HEADER, buffer=self.memory.buf)
+        self.slots = np.ndarray((MAX_WORKERS + 1,), dtype=SLOT, buffer=self.memory.buf, offset=HEADER.itemsize)
+        self.creator_pid = os.getpid()
+        self.slot = 1
+        self.lock = threading.Lock()
+        self.indexes: Dict[str, int] = {}
+        self.register(BASE_COUNTERS)
+
+    def register(self, names: Iterable[str]):
+        """Give counters their place in the table; only the creating process may add names"""
+        table = self.header['names']
+        known = set(table[table != b''].tolist())
+        free = iter(np.flatnonzero(table == b'').tolist())
+        for name in names:
+            if name.encode() not in known:
+                index = next(free, None)
+                if index is None:
+                    logger.warning('Live counter table is full, dropping %s', name)
+                    return
+                table[index] = name.encode()
+
+    def index(self, name: str) -> Optional[int]:
+        index = self.indexes.get(name)
+        if index is None:
+            # Added by the creator since this process last looked
+            self.indexes = {value.decode(): position for position, value in
+                            enumerate(self.header['names'].tolist()) if value}
+            index = self.indexes.get(name)
+        return index
+
+    def own_slot(self, today: int):
+        slot = self.slots[self.slot]
+        if slot['day'] != today:
+            slot['counters'] = 0
+            slot['day'] = today
+        return slot
+
+    def add(self, name: str, amount: int = 1):
+        index = self.index(name)
+        if index is None:
+            return
+        with self.lock:
+            self.own_slot(date.today().toordinal())['counters'][index] += amount
+
+    def mark_online(self, username: str):
+        minute = int(time.time() // 60)
+        position = minute % ONLINE_MINUTES
+        bit = int.from_bytes(hashlib.blake2b(username.encode(), digest_size=4).digest(), 'little') % ONLINE_BITS
+        with self.lock:
+            slot = self.slots[self.slot]
+            if slot['online_minute'][position] != minute:
+                slot['online'][position] = 0
+                slot['online_minute'][position] = minute
+            slot['online'][position, bit >> 3] |= 1 << (bit & 7)
+
+    def totals(self) -> Dict[str, int]:
+        """Today's value of every named counter, across all slots"""
+        today = self.slots['day'] == date.today().toordinal()
+        sums = self.slots['counters'][today].sum(axis=0) if today.any() else np.zeros(MAX_COUNTERS, dtype=np.int64)
+        return {value.decode(): int(sums[position])
+                for position, value in enumerate(self.header['names'].tolist()) if value}
+
+    def players_online(self) -> int:
+        """Distinct users seen in the last ONLINE_MINUTES, by linear counting over the merged bitmaps"""
+        recent = self.slots['online_minute'] > int(time.time() // 60) - ONLINE_MINUTES
+        if not recent.any():
+            return 0
+        merged = np.bitwise_or.reduce(self.slots['online'][recent], axis=0)
+        empty = ONLINE_BITS - int(np.unpackbits(merged).sum())
+        return round(ONLINE_BITS * math.log(ONLINE_BITS / empty)) if empty else ONLINE_BITS
+
+    def restore(self, day: int, values: Dict[str, int]):
+        """Start slot 0 from a checkpoint, so totals carry over a restart"""
+        self.register(values)
+        base = self.slots[0]
+        base['day'] = day
+        for name, value in values.items():
+            index = self.index(name)
+            if index is not None:
+                base['counters'][index] = value
+
+    def close(self):
+        self.memory.close()
+        if os.getpid() == self.creator_pid:
+            self.memory.unlink()
+
+
+_counters: Optional[LiveCounters] = None
+_counters_lock = threading.Lock()
+
+
+def create_counters(game_types: Iterable[str] = ()) -> LiveCounters:
+    """Create the segment in this process (the gunicorn master) and load today's checkpoint"""
+    global _counters
+    with _counters_lock:
+        if _counters is None:
+            _counters = LiveCounters()
+            restore_checkpoint(_counters)
+        _counters.register(f'plays:{game_type}' for game_type in game_types)
+        return _counters
+
+
+def get_counters() -> LiveCounters:
+    """This process's counters; without a gunicorn master they are private to the process"""
+    if _counters is None:
+        from game_registry import get_registry
+        create_counters(get_registry().games)
+        # No on_exit hook will free a private segment
+        atexit.register(close_counters)
+    return _counters
+
+
+def register_games(game_types: Iterable[str]):
+    """Add plays counters for games; call in the gunicorn master after a registry reload"""
+    get_counters().register(f'plays:{game_type}' for game_type in game_types)
+
+
+def assign_worker_slot(server, worker):
+    """gunicorn pre_fork hook: hand the next worker a slot no live worker holds.
+
+    A recycled worker's slot is reused as it stands, so its counts still add up.
+    """
+    taken = {getattr(other, 'live_counters_slot', None) for other in server.WORKERS.values()}
+    slot = next(slot for slot in range(1, MAX_WORKERS + 1) if slot not in taken)
+    worker.live_counters_slot = slot
+    # Set in the master just before the fork, so the child starts with it
+    get_counters().slot = slot
+
+
+def increment(name: str, amount: int = 1):
+    counters = get_counters()
+    counters.add(name, amount)
+    maybe_checkpoint(counters)
+
+
+def mark_online(username: Optional[str]):
+    if username:
+        get_counters().mark_online(username)
+
+
+def live_stats() -> Dict[str, object]:
+    counters = get_counters()
+    totals = counters.totals()
+    return {
+        'players_online': counters.players_online(),
+        'games_today': totals.get('games_finished', 0),
+        'reps_today': totals.get('reps', 0),
+        'plays_today': {name.split(':', 1)[1]: value for name, value in totals.items()
+                        if name.startswith('plays:') and value},
+    }
+
+
+def maybe_checkpoint(counters: LiveCounters):
+    """Write totals when the last checkpoint is old; the first process to notice does it"""
+    now = time.time()
+    if now - float(counters.header['checkpointed_at']) < CHECKPOINT_SECONDS:
+        return
+    counters.header['checkpointed_at'] = now
+    try:
+        checkpoint(counters)
+    except Exception:
+        logger.exception('Live counter checkpoint failed')
+
+
+def checkpoint(counters: LiveCounters):
+    conn = get_db_connection()
+    if not conn:
+        return
+    day = date.today().isoformat()
+    conn.executemany('INSERT OR REPLACE INTO live_counters (day, name, value) VALUES (?, ?, ?)',
+                     [(day, name, value) for name, value in counters.totals().items()])
+    conn.commit()
+    conn.close()
+
+
+def restore_checkpoint(counters: LiveCounters):
+    conn = get_db_connection()
+    if not conn:
+        return
+    today = date.today()
+    try:
+        rows = conn.execute('SELECT name, value FROM live_counters WHERE day = ?', (today.isoformat(),)).fetchall()
+    except sqlite3.OperationalError:
+        # Created before the schema (gunicorn without preload_app); start from zero
+        rows = []
+    finally:
+        conn.close()
+    counters.restore(today.toordinal(), {row['name']: row['value'] for row in rows})
+    # The table now matches the checkpoint; the next write is due a full interval from here
+    counters.header['checkpointed_at'] = time.time()
+
+
+def close_counters():
+    """gunicorn on_exit hook: a last checkpoint, then free the segment"""
+    global _counters
+    if _counters is not None:
+        try:
+            checkpoint(_counters)
+        except Exception:
+            logger.exception('Live counter checkpoint failed')
+        _counters.close()
+        _counters = None
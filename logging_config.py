@@ -0,0 +1,159 @@
+# Non-blocking structured logging: request threads only enqueue, a listener thread writes
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+from flask import g, has_request_context, request
+
+# Records that would block a full queue are dropped instead
+LOG_QUEUE_SIZE = 10000
+
+# Fraction of records kept for noisy events (matched on the `event` extra); warnings are never sampled
+DEFAULT_SAMPLE_RATES = {
+    'update_score': 0.1,
+}
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+_handler = None
+
+
+def parse_mapping(value: str) -> Dict[str, str]:
+    """Parse 'a=1,b=2' config strings"""
+    mapping = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, val = item.split('=', 1)
+            mapping[key.strip()] = val.strip()
+    return mapping
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the request id and endpoint to records logged inside a request"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.endpoint = request.endpoint
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Drop a fraction of low-severity records for high-volume events"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, 'event', None))
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records rather than waiting on a full queue"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _start_listener():
+    """(Re)create the queue and its writer thread for the current process"""
+    global _listener
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler.queue = log_queue
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter())
+    _listener = QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener:
+        _listener.stop()
+
+
+def configure_logging(app):
+    """Route all logging through a queue and emit structured JSON records"""
+    global _handler
+
+    app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'INFO'))
+    app.config.setdefault('LOG_LEVELS', parse_mapping(os.environ.get('LOG_LEVELS', 'werkzeug=WARNING')))
+    sample_rates = dict(DEFAULT_SAMPLE_RATES)
+    sample_rates.update({key: float(rate) for key, rate in parse_mapping(os.environ.get('LOG_SAMPLING', '')).items()})
+    app.config.setdefault('LOG_SAMPLING', sample_rates)
+
+    root = logging.getLogger()
+    root.setLevel(app.config['LOG_LEVEL'].upper())
+    for name, level in app.config['LOG_LEVELS'].items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    if _handler is None:
+        _handler = NonBlockingQueueHandler(None)
+        _handler.addFilter(RequestContextFilter())
+        _handler.addFilter(SamplingFilter(app.config['LOG_SAMPLING']))
+        for existing in root.handlers[:]:
+            root.removeHandler(existing)
+        root.addHandler(_handler)
+        _start_listener()
+        # The listener thread does not survive gunicorn's fork, start a fresh one per worker
+        os.register_at_fork(after_in_child=_start_listener)
+        atexit.register(_stop_listener)
+
+    access_logger = logging.getLogger('fitplay.access')
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        access_logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+            'event': 'access',
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000, 2),
+        })
+        return response
@@ -0,0 +1,297 @@
+# Request metrics aggregated across gunicorn workers and exposed in Prometheus text format
+import atexit
+import fcntl
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from typing import Dict
+
+from flask import Response, g, has_app_context, request, template_rendered, before_render_template
+
+import database
+
+METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'fitplay-metrics')
+# How often a worker publishes its counters for the /metrics scrape
+FLUSH_INTERVAL_SECONDS = 1.0
+# Snapshot of workers that have exited, so their counts survive recycling
+ARCHIVE_FILE = 'archive.json'
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'fitplay_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status', None),
+    'fitplay_http_request_duration_seconds': ('histogram', 'Request latency by endpoint', LATENCY_BUCKETS),
+    'fitplay_db_queries_total': ('counter', 'SQLite statements executed by endpoint', None),
+    'fitplay_db_queries_per_request': ('histogram', 'SQLite statements per request', COUNT_BUCKETS),
+    'fitplay_db_time_per_request_seconds': ('histogram', 'Time spent in SQLite per request', LATENCY_BUCKETS),
+    'fitplay_session_load_seconds': ('histogram', 'Time to load the server-side session', LATENCY_BUCKETS),
+    'fitplay_session_save_seconds': ('histogram', 'Time to save the server-side session', LATENCY_BUCKETS),
+    'fitplay_template_render_seconds': ('histogram', 'Template render time by template', LATENCY_BUCKETS),
+    'fitplay_cache_requests_total': ('counter', 'Result cache lookups by cache and result (hit, disk_hit, miss)', None),
+    'fitplay_cache_invalidations_total': ('counter', 'Result cache invalidations by tag kind', None),
+}
+
+
+def _labels_key(labels: Dict[str, str]) -> str:
+    return json.dumps(sorted(labels.items()))
+
+
+class Registry:
+    """Counters and histograms for one process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[str, float]] = {}
+        # label key -> [bucket counts..., sum, count]
+        self.histograms: Dict[str, Dict[str, list]] = {}
+        self.dirty = False
+
+    def inc(self, name: str, labels: Dict[str, str], amount: float = 1):
+        key = _labels_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+            self.dirty = True
+
+    def observe(self, name: str, labels: Dict[str, str], value: float):
+        buckets = METRICS[name][2]
+        key = _labels_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+            self.dirty = True
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            self.dirty = False
+            return {
+                'counters': {name: dict(series) for name, series in self.counters.items()},
+                'histograms': {name: {key: list(values) for key, values in series.items()}
+                               for name, series in self.histograms.items()},
+            }
+
+
+registry = Registry()
+_flusher_pid = None
+
+
+def merge_snapshots(target: dict, source: dict):
+    """Add source's counts into target"""
+    for name, series in source.get('counters', {}).items():
+        merged = target.setdefault('counters', {}).setdefault(name, {})
+        for key, value in series.items():
+            merged[key] = merged.get(key, 0) + value
+    for name, series in source.get('histograms', {}).items():
+        merged = target.setdefault('histograms', {}).setdefault(name, {})
+        for key, values in series.items():
+            if key in merged:
+                merged[key] = [a + b for a, b in zip(merged[key], values)]
+            else:
+                merged[key] = list(values)
+
+
+def _write_json(path: str, data: dict):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def ensure_metrics_dir():
+    """Create METRICS_DIR, refusing one another user could plant snapshots in"""
+    os.makedirs(METRICS_DIR, mode=0o700, exist_ok=True)
+    info = os.lstat(METRICS_DIR)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"METRICS_DIR {METRICS_DIR} must be a directory owned by this user with mode 0700")
+
+
+def flush():
+    """Publish this process's snapshot for other workers' scrapes"""
+    ensure_metrics_dir()
+    _write_json(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), registry.snapshot())
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        if registry.dirty:
+            flush()
+
+
+def ensure_flusher():
+    """Start this process's background flusher (forked workers need their own)"""
+    global _flusher_pid
+    if _flusher_pid != os.getpid():
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def reset_metrics_dir():
+    """Remove counts left over from a previous server run (call once in the master)"""
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    ensure_metrics_dir()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect() -> dict:
+    """Merge every worker's snapshot, folding exited workers into the archive"""
+    flush()
+    with open(os.path.join(METRICS_DIR, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        archive_path = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+        archive = {}
+        if os.path.exists(archive_path):
+            with open(archive_path) as f:
+                archive = json.load(f)
+
+        combined = {}
+        archive_changed = False
+        for filename in os.listdir(METRICS_DIR):
+            pid_text, ext = os.path.splitext(filename)
+            if ext != '.json' or not pid_text.isdigit():
+                continue
+            path = os.path.join(METRICS_DIR, filename)
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if int(pid_text) != os.getpid() and not _pid_alive(int(pid_text)):
+                merge_snapshots(archive, snapshot)
+                os.remove(path)
+                archive_changed = True
+            else:
+                merge_snapshots(combined, snapshot)
+
+        if archive_changed:
+            _write_json(archive_path, archive)
+    merge_snapshots(combined, archive)
+    return combined
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def render_prometheus(snapshot: dict) -> str:
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for key, value in sorted(snapshot.get('counters', {}).get(name, {}).items()):
+                lines.append(f"{name}{_format_labels(json.loads(key))} {value}")
+            continue
+        for key, values in sorted(snapshot.get('histograms', {}).get(name, {}).items()):
+            labels = [tuple(item) for item in json.loads(key)]
+            for index, bound in enumerate(buckets):
+                lines.append(f"{name}_bucket{_format_labels(labels + [('le', repr(float(bound)))])} {values[index]}")
+            lines.append(f"{name}_bucket{_format_labels(labels + [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+def _record_query(sql, params, duration):
+    if has_app_context() and 'metrics_db' in g:
+        g.metrics_db[0] += 1
+        g.metrics_db[1] += duration
+
+
+class TimedSessionInterface:
+    """Wrap a session interface to time session loads and saves"""
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def open_session(self, app, request):
+        started = time.perf_counter()
+        try:
+            return self.wrapped.open_session(app, request)
+        finally:
+            registry.observe('fitplay_session_load_seconds', {}, time.perf_counter() - started)
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter()
+        try:
+            return self.wrapped.save_session(app, session, response)
+        finally:
+            registry.observe('fitplay_session_save_seconds', {}, time.perf_counter() - started)
+
+
+def init_metrics(app):
+    """Instrument every request and serve the merged metrics at /metrics"""
+    app.session_interface = TimedSessionInterface(app.session_interface)
+    database.QUERY_LISTENERS.append(_record_query)
+    atexit.register(flush)
+
+    def template_started(sender, template, context, **extra):
+        g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        stack = g.get('metrics_templates')
+        if stack:
+            registry.observe('fitplay_template_render_seconds', {'template': template.name or 'string'},
+                             time.perf_counter() - stack.pop())
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    @app.before_request
+    def start_request_metrics():
+        ensure_flusher()
+        g.metrics_started = time.perf_counter()
+        # [statement count, seconds in SQLite]
+        g.metrics_db = [0, 0.0]
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        registry.inc('fitplay_http_requests_total', {
+            'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)
+        })
+        registry.observe('fitplay_http_request_duration_seconds', {'endpoint': endpoint},
+                         time.perf_counter() - started)
+        queries, db_time = g.metrics_db
+        registry.inc('fitplay_db_queries_total', {'endpoint': endpoint}, queries)
+        registry.observe('fitplay_db_queries_per_request', {'endpoint': endpoint}, queries)
+        registry.observe('fitplay_db_time_per_request_seconds', {'endpoint': endpoint}, db_time)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_prometheus(collect()), mimetype='text/plain; version=0.0.4')
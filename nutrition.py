@@ -0,0 +1,157 @@
+# Nutrient table in NumPy arrays and a meal planner that scores every food combination at once
+import csv
+import os
+import random
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FOODS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'foods.csv')
+
+NUTRIENTS = ('calories', 'protein_g', 'carbs_g', 'fat_g')
+MEALS = ('breakfast', 'lunch', 'dinner', 'snacks')
+
+# Share of calories from protein, carbs and fat for each goal
+MACRO_SPLITS = {
+    'weight_loss': (0.35, 0.40, 0.25),
+    'muscle_gain': (0.30, 0.45, 0.25),
+    'maintenance': (0.25, 0.50, 0.25),
+}
+CALORIES_PER_GRAM = np.array([4.0, 4.0, 9.0])
+
+# Servings a food can be planned in
+PORTIONS = np.array([0.5, 1.0, 1.5, 2.0])
+# Relative importance of each nutrient's error when scoring a meal
+NUTRIENT_WEIGHTS = np.array([4.0, 2.0, 1.0, 1.0])
+# Score added per earlier use of a food this week, so plans vary from day to day
+REPEAT_PENALTY = 0.05
+# The best few meals are shuffled between, for variety
+SHORTLIST = 5
+
+CALORIE_TOLERANCE = 0.10
+MACRO_TOLERANCE = 0.20
+
+
+class FoodTable:
+    """Foods as parallel arrays: names, per-serving nutrients and the meals each suits"""
+
+    def __init__(self, names: List[str], servings: List[str], nutrients: np.ndarray, meal_mask: np.ndarray):
+        self.names = names
+        self.servings = servings
+        self.nutrients = nutrients      # (foods, len(NUTRIENTS))
+        self.meal_mask = meal_mask      # (foods, len(MEALS)) bool
+
+    @classmethod
+    def load(cls, path: str = FOODS_FILE) -> 'FoodTable':
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        nutrients = np.array([[float(row[name]) for name in NUTRIENTS] for row in rows])
+        meal_mask = np.array([[meal in row['meals'].split('|') for meal in MEALS] for row in rows])
+        return cls([row['name'] for row in rows], [row['serving'] for row in rows], nutrients, meal_mask)
+
+
+class MealCandidates:
+    """Every single food or pair of foods, in every portion, that can make up one meal"""
+
+    def __init__(self, table: FoodTable, meal: str):
+        foods = np.flatnonzero(table.meal_mask[:, MEALS.index(meal)])
+        # One option per (food, portion)
+        option_food = np.repeat(foods, len(PORTIONS))
+        option_portion = np.tile(PORTIONS, len(foods))
+        option_nutrients = table.nutrients[option_food] * option_portion[:, None]
+
+        first, second = np.triu_indices(len(option_food), k=1)
+        distinct = option_food[first] != option_food[second]
+        first, second = first[distinct], second[distinct]
+        singles = np.arange(len(option_food))
+
+        # -1 marks "no second food"
+        self.food_a = np.concatenate([option_food, option_food[first]])
+        self.portion_a = np.concatenate([option_portion, option_portion[first]])
+        self.food_b = np.concatenate([np.full(len(singles), -1), option_food[second]])
+        self.portion_b = np.concatenate([np.zeros(len(singles)), option_portion[second]])
+        self.nutrients = np.concatenate([option_nutrients, option_nutrients[first] + option_nutrients[second]])
+
+    def score(self, target: np.ndarray, uses: np.ndarray) -> np.ndarray:
+        """Weighted squared relative error against target, plus the repeat penalty (lower is better)"""
+        error = (self.nutrients - target) / np.maximum(target, 1.0)
+        penalty = np.append(uses, 0.0) * REPEAT_PENALTY
+        return (error ** 2) @ NUTRIENT_WEIGHTS + penalty[self.food_a] + penalty[self.food_b]
+
+
+class MealPlanner:
+    """Pick foods per meal to hit calorie and macro targets"""
+
+    def __init__(self, table: FoodTable):
+        self.table = table
+        self.candidates = {meal: MealCandidates(table, meal) for meal in MEALS}
+
+    def targets(self, daily_calories: float, goal: str) -> np.ndarray:
+        """Daily calories and grams of protein, carbs and fat"""
+        split = np.array(MACRO_SPLITS.get(goal, MACRO_SPLITS['maintenance']))
+        return np.concatenate([[daily_calories], daily_calories * split / CALORIES_PER_GRAM])
+
+    def plan_day(self, daily_calories: float, goal: str, shares: Sequence[Tuple[str, float]],
+                 rng: random.Random, uses: Optional[np.ndarray] = None) -> Dict:
+        daily_target = self.targets(daily_calories, goal)
+        if uses is None:
+            uses = np.zeros(len(self.table.names))
+
+        meals = {}
+        totals = np.zeros(len(NUTRIENTS))
+        for meal, share in shares:
+            candidates = self.candidates[meal]
+            scores = candidates.score(daily_target * share, uses)
+            shortlist = np.argpartition(scores, min(SHORTLIST, len(scores) - 1))[:SHORTLIST]
+            shortlist = shortlist[np.argsort(scores[shortlist])]
+            chosen = shortlist[rng.randrange(len(shortlist))]
+
+            meals[meal] = self.describe(candidates, chosen)
+            meals[meal]['options'] = [self.describe(candidates, index)['selected'] for index in shortlist]
+            totals += candidates.nutrients[chosen]
+            for food in (candidates.food_a[chosen], candidates.food_b[chosen]):
+                if food >= 0:
+                    uses[food] += 1
+
+        deviation = np.abs(totals - daily_target) / np.maximum(daily_target, 1.0)
+        return {
+            'meals': meals,
+            'totals': nutrient_dict(totals),
+            'targets': nutrient_dict(daily_target),
+            'within_tolerance': bool(deviation[0] <= CALORIE_TOLERANCE and np.all(deviation[1:] <= MACRO_TOLERANCE)),
+        }
+
+    def plan_week(self, daily_calories: float, goal: str, shares: Sequence[Tuple[str, float]],
+                  rng: random.Random, days: int = 7) -> List[Dict]:
+        uses = np.zeros(len(self.table.names))
+        return [self.plan_day(daily_calories, goal, shares, rng, uses) for _ in range(days)]
+
+    def describe(self, candidates: MealCandidates, index: int) -> Dict:
+        items = []
+        for food, portion in ((candidates.food_a[index], candidates.portion_a[index]),
+                              (candidates.food_b[index], candidates.portion_b[index])):
+            if food < 0:
+                continue
+            items.append({
+                'name': self.table.names[food],
+                'servings': float(portion),
+                'serving': self.table.servings[food],
+                **nutrient_dict(self.table.nutrients[food] * portion),
+            })
+        return {
+            'selected': ' + '.join(item['name'] for item in items),
+            'items': items,
+            **nutrient_dict(candidates.nutrients[index]),
+        }
+
+
+def nutrient_dict(values: np.ndarray) -> Dict:
+    return {name: int(round(value)) if name == 'calories' else round(float(value), 1)
+            for name, value in zip(NUTRIENTS, values)}
+
+
+@lru_cache(maxsize=1)
+def get_planner() -> MealPlanner:
+    """Built on first use and kept for the life of the process"""
+    return MealPlanner(FoodTable.load())
@@ -0,0 +1,168 @@
+# On-demand cProfile dumps for sampled requests, chosen endpoints or signed requests
+import cProfile
+import logging
+import os
+import pstats
+import random
+import stat
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import click
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.exceptions import HTTPException
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'fitplay-profiles')
+# Oldest dumps are deleted past this many files
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200))
+
+# Requests carrying a token from `flask profile-token` are profiled even when sampling is off
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_HEADER_ENVIRON = 'HTTP_X_PROFILE_TOKEN'
+PROFILE_TOKEN_SALT = 'fitplay-profile'
+PROFILE_TOKEN_MAX_AGE = 3600
+
+
+def parse_endpoints(value: str) -> set:
+    return {endpoint.strip() for endpoint in (value or '').split(',') if endpoint.strip()}
+
+
+class ProfilerMiddleware:
+    """WSGI middleware that writes a .pstats file for each selected request"""
+
+    def __init__(self, wsgi_app, flask_app, sample_rate: float = 0.0, endpoints=(),
+                 profile_dir: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.wsgi_app = wsgi_app
+        self.flask_app = flask_app
+        self.sample_rate = sample_rate
+        self.endpoints = set(endpoints)
+        self.profile_dir = profile_dir
+        self.max_files = max_files
+        # cProfile can't run two profilers at once; concurrent picks are skipped
+        self.busy = threading.Lock()
+
+    def endpoint_for(self, environ):
+        try:
+            endpoint, _ = self.flask_app.url_map.bind_to_environ(environ).match()
+            return endpoint
+        except HTTPException:
+            return None
+
+    def token_valid(self, token: str) -> bool:
+        try:
+            serializer(self.flask_app).loads(token, max_age=PROFILE_TOKEN_MAX_AGE)
+            return True
+        except BadSignature:
+            return False
+
+    def should_profile(self, environ, endpoint) -> bool:
+        token = environ.get(PROFILE_HEADER_ENVIRON)
+        if token and self.token_valid(token):
+            return True
+        if endpoint and endpoint in self.endpoints:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, environ, start_response):
+        if not (self.sample_rate or self.endpoints or PROFILE_HEADER_ENVIRON in environ):
+            return self.wsgi_app(environ, start_response)
+
+        endpoint = self.endpoint_for(environ)
+        if not self.should_profile(environ, endpoint) or not self.busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+
+        status = []
+
+        def capture_status(status_line, headers, exc_info=None):
+            status.append(status_line.split(' ', 1)[0])
+            return start_response(status_line, headers, exc_info)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                # Views render before returning; a streamed body is only profiled up to its first chunk
+                body = self.wsgi_app(environ, capture_status)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+            self.write(profiler, environ, endpoint, status[0] if status else '000', elapsed)
+        finally:
+            self.busy.release()
+        return body
+
+    def write(self, profiler, environ, endpoint, status, elapsed):
+        """Save as <time>-<endpoint>-<method>-<status>-<ms>ms-<pid>.pstats"""
+        ensure_profile_dir(self.profile_dir)
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S.%f')
+        name = endpoint or environ.get('PATH_INFO', '').strip('/').replace('/', '.') or 'root'
+        filename = f"{stamp}-{name}-{environ.get('REQUEST_METHOD')}-{status}-{elapsed * 1000:.0f}ms-{os.getpid()}.pstats"
+        path = os.path.join(self.profile_dir, filename)
+        profiler.dump_stats(path)
+        logger.info('Request profiled', extra={'event': 'profile', 'profile_file': path,
+                                               'duration_ms': round(elapsed * 1000, 2)})
+        self.prune()
+
+    def prune(self):
+        files = sorted(name for name in os.listdir(self.profile_dir) if name.endswith('.pstats'))
+        for name in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.profile_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+def serializer(app) -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(app.secret_key, salt=PROFILE_TOKEN_SALT)
+
+
+def ensure_profile_dir(profile_dir: str):
+    """Create profile_dir, refusing one another user could plant .pstats files (marshal data) in"""
+    os.makedirs(profile_dir, mode=0o700, exist_ok=True)
+    info = os.lstat(profile_dir)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"PROFILE_DIR {profile_dir} must be a directory owned by this user with mode 0700")
+
+
+def profile_files(profile_dir: str, endpoint: str = None):
+    files = sorted(name for name in os.listdir(profile_dir) if name.endswith('.pstats')) \
+        if os.path.isdir(profile_dir) else []
+    if endpoint:
+        files = [name for name in files if name.split('-')[1] == endpoint]
+    return [os.path.join(profile_dir, name) for name in files]
+
+
+def init_profiling(app):
+    """Wrap the WSGI app with the profiler and add the profile-token/profile-report commands"""
+    sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    endpoints = parse_endpoints(os.environ.get('PROFILE_ENDPOINTS', ''))
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, app, sample_rate, endpoints)
+
+    @app.cli.command('profile-token')
+    def profile_token():
+        """Print a token for the X-Profile-Token header (valid for an hour)"""
+        click.echo(serializer(app).dumps('profile'))
+
+    @app.cli.command('profile-report')
+    @click.option('--dir', 'profile_dir', default=PROFILE_DIR, show_default=True)
+    @click.option('--endpoint', help='only dumps for this endpoint, e.g. games.end_game')
+    @click.option('--top', default=25, show_default=True, help='functions to list')
+    @click.option('--sort', default='cumulative', show_default=True,
+                  type=click.Choice(['cumulative', 'tottime', 'ncalls']))
+    def profile_report(profile_dir, endpoint, top, sort):
+        """Aggregate saved .pstats dumps into the top hotspots"""
+        try:
+            ensure_profile_dir(profile_dir)
+        except RuntimeError as exc:
+            raise click.ClickException(str(exc))
+        files = profile_files(profile_dir, endpoint)
+        if not files:
+            raise click.ClickException(f"No .pstats files in {profile_dir}")
+        click.echo(f"{len(files)} profiled requests from {profile_dir}")
+        stats = pstats.Stats(*files, stream=click.get_text_stream('stdout'))
+        stats.strip_dirs().sort_stats(sort).print_stats(top)
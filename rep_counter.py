@@ -0,0 +1,199 @@
+# Count reps from raw accelerometer or pose-keypoint samples: band-pass filter, estimate cadence, pick peaks
+from typing import Dict, NamedTuple
+
+import numpy as np
+
+SIGNAL_KINDS = ('accelerometer', 'pose')
+MIN_SAMPLE_RATE = 10
+MAX_SAMPLE_RATE = 400
+# Longest stream accepted in one upload
+MAX_SECONDS = 600
+
+# Seconds one rep can plausibly take, (fastest, slowest), per exercise in data/games.json
+REP_PERIODS = {
+    'squat': (1.0, 6.0),
+    'jump': (0.3, 2.0),
+    'pushup': (0.8, 5.0),
+    'burpee': (2.0, 10.0),
+}
+DEFAULT_PERIOD = (0.5, 6.0)
+# Scored in seconds held still rather than in reps
+HOLD_EXERCISES = {'plank_second'}
+
+# Below this standard deviation the filtered signal is noise, not movement
+# (m/s^2 for accelerometers, image heights for pose keypoints in 0..1 coordinates)
+MIN_MOVEMENT = {'accelerometer': 0.5, 'pose': 0.01}
+# A hold counts while the 1 s rolling standard deviation stays under this
+MAX_HOLD_WOBBLE = {'accelerometer': 0.4, 'pose': 0.008}
+# Peaks must clear the filtered signal's mean by this many standard deviations
+PEAK_THRESHOLD = 0.3
+# Peaks closer than this share of the estimated rep period are the same rep
+MIN_PEAK_SPACING = 0.6
+# The rep period is the first autocorrelation peak reaching this share of the strongest one
+PERIOD_PEAK_SHARE = 0.9
+# Counts less confident than this are not scored; random shaking reaches about 0.45
+MIN_REP_CONFIDENCE = 0.5
+
+
+class SensorDataError(ValueError):
+    """The uploaded samples can't be interpreted"""
+
+
+class RepCount(NamedTuple):
+    reps: int
+    confidence: float
+    cadence_per_minute: float
+    seconds: float
+
+    def summary(self, kind: str, sample_rate: float, samples: int) -> Dict:
+        """What is kept in exercise_tracking.sensor_data instead of the raw stream"""
+        return {'kind': kind, 'sample_rate': sample_rate, 'samples': samples, 'source': 'server', **self._asdict()}
+
+
+def to_signal(samples, kind: str) -> np.ndarray:
+    """One value per sample: acceleration magnitude, or the mean height of the keypoints"""
+    try:
+        data = np.asarray(samples, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise SensorDataError('samples must be a numeric array')
+
+    if kind == 'accelerometer' and data.ndim == 2 and data.shape[1] == 3:
+        # Gravity is a constant offset, removed with the rest of the baseline
+        signal = np.sqrt(np.einsum('ij,ij->i', data, data))
+    elif kind == 'accelerometer' and data.ndim == 1:
+        signal = data
+    elif kind == 'pose' and data.ndim == 3 and data.shape[2] == 2:
+        # (samples, keypoints, x/y); keypoints the tracker lost are NaN
+        heights = data[:, :, 1]
+        seen = np.isfinite(heights)
+        counts = seen.sum(axis=1)
+        signal = np.where(counts > 0, np.where(seen, heights, 0.0).sum(axis=1) / np.maximum(counts, 1), np.nan)
+    elif kind == 'pose' and data.ndim == 2 and data.shape[1] == 2:
+        signal = data[:, 1]
+    else:
+        raise SensorDataError(f"samples for {kind} must have shape {expected_shape(kind)}, got {data.shape}")
+    return fill_gaps(signal)
+
+
+def expected_shape(kind: str) -> str:
+    return '(n, 3) or (n,)' if kind == 'accelerometer' else '(n, keypoints, 2) or (n, 2)'
+
+
+def fill_gaps(signal: np.ndarray) -> np.ndarray:
+    """Linearly interpolate over missing (NaN/inf) samples"""
+    missing = ~np.isfinite(signal)
+    if not missing.any():
+        return signal
+    if missing.all():
+        raise SensorDataError('samples contain no finite values')
+    positions = np.arange(len(signal))
+    filled = signal.copy()
+    filled[missing] = np.interp(positions[missing], positions[~missing], signal[~missing])
+    return filled
+
+
+def moving_average(signal: np.ndarray, window: int) -> np.ndarray:
+    """Centered running mean, same length as signal, edges padded with the end values"""
+    window = max(1, min(int(window), len(signal)))
+    if window == 1:
+        return signal
+    padded = np.pad(signal, (window // 2, window - 1 - window // 2), mode='edge')
+    sums = np.concatenate(([0.0], np.cumsum(padded)))
+    return (sums[window:] - sums[:-window]) / window
+
+
+def autocorrelation(signal: np.ndarray) -> np.ndarray:
+    """Normalized autocorrelation at lags 0..len-1, via FFT"""
+    size = 1 << (2 * len(signal) - 1).bit_length()
+    spectrum = np.fft.rfft(signal, size)
+    correlation = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(signal)]
+    return correlation / correlation[0] if correlation[0] > 0 else np.zeros(len(signal))
+
+
+def find_peaks(signal: np.ndarray, min_distance: int, threshold: float) -> np.ndarray:
+    """Local maxima above threshold, keeping the highest within any min_distance stretch"""
+    middle = signal[1:-1]
+    candidates = np.flatnonzero((middle > signal[:-2]) & (middle >= signal[2:]) & (middle > threshold)) + 1
+    if len(candidates) < 2 or min_distance <= 1:
+        return candidates
+    # Smoothing leaves few candidates, so suppressing neighbours one by one is cheap
+    kept = []
+    taken = np.zeros(len(signal) + 2 * min_distance, dtype=bool)
+    for peak in candidates[np.argsort(-signal[candidates], kind='stable')]:
+        if not taken[peak + min_distance]:
+            kept.append(peak)
+            taken[peak:peak + 2 * min_distance + 1] = True
+    return np.sort(np.array(kept))
+
+
+def first_strong_peak(correlation: np.ndarray) -> int:
+    """Index of the first local maximum within PERIOD_PEAK_SHARE of the highest value.
+
+    Every multiple of the period correlates nearly as well as the period itself,
+    and with noise one of them is often the highest.
+    """
+    middle = correlation[1:-1]
+    peaks = np.flatnonzero((middle >= correlation[:-2]) & (middle >= correlation[2:]) &
+                           (middle >= PERIOD_PEAK_SHARE * correlation.max())) + 1
+    return int(peaks[0]) if len(peaks) else int(np.argmax(correlation))
+
+
+def count_reps(samples, sample_rate: float, exercise: str, kind: str = 'accelerometer') -> RepCount:
+    """Reps (or seconds held, for hold exercises) in a stream of raw samples"""
+    if kind not in SIGNAL_KINDS:
+        raise SensorDataError(f"kind must be one of {', '.join(SIGNAL_KINDS)}")
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise SensorDataError(f"sample_rate must be between {MIN_SAMPLE_RATE} and {MAX_SAMPLE_RATE} Hz")
+    signal = to_signal(samples, kind)
+    if len(signal) > MAX_SECONDS * sample_rate:
+        raise SensorDataError(f"at most {MAX_SECONDS} s of samples per upload")
+    seconds = len(signal) / sample_rate
+    if len(signal) < 3:
+        return RepCount(0, 0.0, 0.0, round(seconds, 2))
+
+    if exercise in HOLD_EXERCISES:
+        return count_hold(signal, sample_rate, kind, seconds)
+
+    fastest, slowest = REP_PERIODS.get(exercise, DEFAULT_PERIOD)
+    # Band-pass: smooth out jitter faster than any rep, subtract drift slower than any rep
+    smooth = moving_average(signal, fastest * sample_rate / 4)
+    filtered = smooth - moving_average(smooth, slowest * sample_rate)
+    spread = filtered.std()
+    if spread < MIN_MOVEMENT[kind]:
+        return RepCount(0, 0.0, 0.0, round(seconds, 2))
+
+    # Cadence: the repetition period in the plausible range
+    shortest, longest = int(fastest * sample_rate), min(int(slowest * sample_rate), len(filtered) // 2)
+    periodicity, period = 0.0, shortest
+    if longest > shortest:
+        correlation = autocorrelation(filtered - filtered.mean())
+        period = shortest + first_strong_peak(correlation[shortest:longest + 1])
+        periodicity = float(np.clip(correlation[period], 0.0, 1.0))
+
+    peaks = find_peaks(filtered, max(shortest, int(period * MIN_PEAK_SPACING)),
+                       filtered.mean() + PEAK_THRESHOLD * spread)
+    reps = len(peaks)
+    if reps == 0:
+        return RepCount(0, 0.0, 0.0, round(seconds, 2))
+
+    # Confidence: how periodic the movement is and how evenly the reps are spaced
+    if reps > 2:
+        intervals = np.diff(peaks)
+        regularity = float(np.clip(1.0 - intervals.std() / intervals.mean(), 0.0, 1.0))
+        cadence = 60.0 * sample_rate / float(np.median(intervals))
+    else:
+        regularity = 0.5
+        cadence = 60.0 * sample_rate / period
+    confidence = 0.6 * periodicity + 0.4 * regularity
+    return RepCount(reps, round(confidence, 3), round(cadence, 1), round(seconds, 2))
+
+
+def count_hold(signal: np.ndarray, sample_rate: float, kind: str, seconds: float) -> RepCount:
+    """Whole seconds spent holding still, and the share of the stream that was still"""
+    window = int(sample_rate)
+    mean = moving_average(signal, window)
+    wobble = np.sqrt(np.maximum(moving_average(signal * signal, window) - mean * mean, 0.0))
+    still = wobble < MAX_HOLD_WOBBLE[kind]
+    held = int(still.sum() / sample_rate)
+    return RepCount(held, round(float(still.mean()), 3) if held else 0.0, 0.0, round(seconds, 2))
+
@@ -0,0 +1,217 @@
+# Tagged cache for read-heavy views: an LRU with a TTL in each process, an optional on-disk
+# tier shared by workers, and tag generations in shared memory so any worker can invalidate
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import stat
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+import metrics
+
+CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 1024))
+CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', 300))
+# Directory of the shared disk tier; unset keeps entries in each process only.
+# Entries are unpickled, so it must belong to the app's user and be closed to everyone else.
+CACHE_DIR = os.environ.get('RESULT_CACHE_DIR')
+# Expired files are swept from the disk tier every this many writes in a process
+DISK_SWEEP_WRITES = 500
+
+TAGS_SHM_PATH = os.environ.get('RESULT_CACHE_TAGS_PATH') or os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'fitplay-cache-tags')
+# Tags hash into this many generation counters; tags sharing one only invalidate each other
+TAG_SLOTS = 65536
+COUNTER = struct.Struct('<Q')
+
+# Every leaderboard; game:<type> covers one game's leaderboard and stats
+LEADERBOARD_TAG = 'leaderboard'
+
+
+def user_tag(username: str) -> str:
+    return f"user:{username}"
+
+
+def game_tag(game_type: str) -> str:
+    return f"game:{game_type}"
+
+
+class TagGenerations:
+    """Generation counter per tag in a file mapped by every process on the host.
+
+    Slot 0 holds a random epoch set when the file is created, so entries on disk
+    from before a reboot (when the counters start again from 0) never match.
+    """
+
+    def __init__(self, path: str = TAGS_SHM_PATH):
+        size = (TAG_SLOTS + 1) * COUNTER.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, COUNTER.size, 0)
+        try:
+            if os.fstat(self.fd).st_size < size:
+                os.ftruncate(self.fd, size)
+            self.buffer = mmap.mmap(self.fd, size)
+            if not COUNTER.unpack_from(self.buffer, 0)[0]:
+                COUNTER.pack_into(self.buffer, 0, int.from_bytes(os.urandom(8), 'little') or 1)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, COUNTER.size, 0)
+        self.thread_lock = threading.Lock()
+
+    @staticmethod
+    def slot(tag: str) -> int:
+        return 1 + int.from_bytes(hashlib.blake2b(tag.encode(), digest_size=8).digest(), 'little') % TAG_SLOTS
+
+    def current(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        """The epoch and each tag's generation, read without locking"""
+        return (COUNTER.unpack_from(self.buffer, 0)[0],
+                *(COUNTER.unpack_from(self.buffer, self.slot(tag) * COUNTER.size)[0] for tag in tags))
+
+    def bump(self, tags: Iterable[str]):
+        with self.thread_lock:
+            for slot in sorted({self.slot(tag) for tag in tags}):
+                offset = slot * COUNTER.size
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, COUNTER.size, offset)
+                try:
+                    COUNTER.pack_into(self.buffer, offset, COUNTER.unpack_from(self.buffer, offset)[0] + 1)
+                finally:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN, COUNTER.size, offset)
+
+
+class ResultCache:
+    """Entries are (expires_at, generations, value), valid until they expire or a tag moves on"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, directory: Optional[str] = CACHE_DIR):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self.disk_writes = 0
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            info = os.lstat(directory)
+            if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+                raise RuntimeError(f"RESULT_CACHE_DIR {directory} must be a directory owned by this user with mode 0700")
+
+    def get(self, key: str, generations: Tuple[int, ...]) -> Tuple[Optional[str], Any]:
+        """('hit' or 'disk_hit', value), or (None, None) on a miss"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now and entry[1] == generations:
+                    self.entries.move_to_end(key)
+                    return 'hit', entry[2]
+                del self.entries[key]
+        if not self.directory:
+            return None, None
+        entry = self._read_disk(key)
+        if entry is None or entry[0] <= now or entry[1] != generations:
+            return None, None
+        self._store(key, entry)
+        return 'disk_hit', entry[2]
+
+    def put(self, key: str, generations: Tuple[int, ...], value: Any, ttl: float):
+        entry = (time.time() + ttl, generations, value)
+        self._store(key, entry)
+        if self.directory:
+            self._write_disk(key, entry)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _store(self, key: str, entry: tuple):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.pickle')
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                stored_key, entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # A sha1 collision would otherwise hand back another key's value
+        return entry if stored_key == key else None
+
+    def _write_disk(self, key: str, entry: tuple):
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump((key, entry), f, protocol=pickle.HIGHEST_PROTOCOL)
+            # The file's mtime is its expiry, so a sweep only needs to stat
+            os.utime(temp_path, (entry[0], entry[0]))
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        self.disk_writes += 1
+        if self.disk_writes % DISK_SWEEP_WRITES == 0:
+            self.sweep_disk()
+
+    def sweep_disk(self):
+        """Remove expired files from the disk tier"""
+        now = time.time()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime <= now:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+_generations: Optional[TagGenerations] = None
+_cache = ResultCache()
+
+
+def get_generations() -> TagGenerations:
+    global _generations
+    if _generations is None:
+        _generations = TagGenerations()
+    return _generations
+
+
+def cached(name: str, tags: Callable[..., Iterable[str]], ttl: float = CACHE_TTL_SECONDS):
+    """Cache a function's result under its arguments until ttl passes or one of its tags is invalidated.
+
+    tags receives the function's arguments. Arguments must have a stable repr
+    (strings, numbers, dates); a result of None is not cached. Callers share the
+    cached value and must not modify it.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            key = repr((name, args, sorted(kwargs.items())))
+            # Read before computing: an invalidation while it runs leaves the result already stale
+            generations = get_generations().current(tags(*args, **kwargs))
+            result, value = _cache.get(key, generations)
+            metrics.registry.inc('fitplay_cache_requests_total', {'cache': name, 'result': result or 'miss'})
+            if result:
+                return value
+            value = function(*args, **kwargs)
+            if value is not None:
+                _cache.put(key, generations, value, ttl)
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidate(*tags: str):
+    """Drop every cached result carrying any of tags, in all processes; call after the write commits"""
+    if not tags:
+        return
+    get_generations().bump(tags)
+    for tag in tags:
+        metrics.registry.inc('fitplay_cache_invalidations_total', {'tag': tag.split(':', 1)[0]})
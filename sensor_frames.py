@@ -0,0 +1,100 @@
+# Binary sensor upload format: a fixed header followed by packed little-endian float32 samples
+#
+#   offset  size  field
+#   0       4     magic b'FPSF'
+#   4       1     format version (1)
+#   5       1     kind: 0 accelerometer, 1 pose
+#   6       2     channels per sample: accelerometer 1 (magnitude) or 3 (x, y, z);
+#                 pose 2 x keypoints (x0, y0, x1, y1, ...)
+#   8       4     sample count
+#   12      4     sample rate in Hz (float32)
+#   16      8     time of the first sample, Unix seconds (float64), 0 when unknown
+#   24      ...   sample count x channels float32 values, one sample after another
+#
+# Missing pose keypoints are NaN. The same bytes are stored in exercise_tracking.sensor_frame.
+import struct
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+from rep_counter import SIGNAL_KINDS, SensorDataError
+
+FRAME_MIMETYPE = 'application/octet-stream'
+FRAME_MAGIC = b'FPSF'
+FRAME_VERSION = 1
+HEADER = struct.Struct('<4sBBHIfd')
+SAMPLE_DTYPE = np.dtype('<f4')
+MAX_CHANNELS = 66  # 33 pose keypoints
+# Largest upload read from a request body
+MAX_FRAME_BYTES = 8 * 1024 * 1024
+
+
+class SensorFrame(NamedTuple):
+    kind: str
+    sample_rate: float
+    started_at: float
+    # Read-only view into the frame's bytes: (count, channels), or (count, keypoints, 2) for pose
+    samples: np.ndarray
+
+
+def parse_frame(data) -> SensorFrame:
+    """Decode a frame without copying the samples out of data (bytes, bytearray or memoryview)"""
+    view = memoryview(data)
+    if view.nbytes < HEADER.size:
+        raise SensorDataError(f"frame is shorter than its {HEADER.size}-byte header")
+    magic, version, kind_code, channels, count, sample_rate, started_at = HEADER.unpack_from(view)
+    if magic != FRAME_MAGIC:
+        raise SensorDataError('not a sensor frame (bad magic)')
+    if version != FRAME_VERSION:
+        raise SensorDataError(f"unsupported frame version {version}")
+    if kind_code >= len(SIGNAL_KINDS):
+        raise SensorDataError(f"unknown signal kind {kind_code}")
+    if not 1 <= channels <= MAX_CHANNELS:
+        raise SensorDataError(f"channels must be between 1 and {MAX_CHANNELS}")
+    expected = HEADER.size + count * channels * SAMPLE_DTYPE.itemsize
+    if view.nbytes != expected:
+        raise SensorDataError(f"frame is {view.nbytes} bytes, header describes {expected}")
+
+    kind = SIGNAL_KINDS[kind_code]
+    samples = np.frombuffer(view, dtype=SAMPLE_DTYPE, count=count * channels, offset=HEADER.size)
+    if kind == 'pose':
+        if channels % 2:
+            raise SensorDataError('pose frames need an x and y channel per keypoint')
+        samples = samples.reshape(count, channels // 2, 2)
+    else:
+        samples = samples.reshape(count, channels)
+        if channels == 1:
+            samples = samples[:, 0]
+    return SensorFrame(kind, float(sample_rate), started_at, samples)
+
+
+def encode_frame(samples, kind: str, sample_rate: float, started_at: float = 0.0) -> bytes:
+    if kind not in SIGNAL_KINDS:
+        raise SensorDataError(f"kind must be one of {', '.join(SIGNAL_KINDS)}")
+    try:
+        values = np.asarray(samples, dtype=SAMPLE_DTYPE)
+    except (TypeError, ValueError):
+        raise SensorDataError('samples must be a numeric array')
+    if values.ndim == 0 or not len(values):
+        raise SensorDataError('samples must be a non-empty array')
+    rows = values.reshape(len(values), -1)
+    if not 1 <= rows.shape[1] <= MAX_CHANNELS:
+        raise SensorDataError(f"channels must be between 1 and {MAX_CHANNELS}")
+    header = HEADER.pack(FRAME_MAGIC, FRAME_VERSION, SIGNAL_KINDS.index(kind), rows.shape[1],
+                         len(rows), sample_rate, started_at)
+    return header + np.ascontiguousarray(rows).tobytes()
+
+
+def frame_from_json(payload) -> Tuple[bytes, SensorFrame]:
+    """Compatibility path: pack a {kind, sample_rate, samples} upload into a frame"""
+    if not isinstance(payload, dict):
+        raise SensorDataError('sensor_samples must be an object with kind, sample_rate and samples')
+    if not isinstance(payload.get('samples'), list):
+        raise SensorDataError('samples must be an array')
+    try:
+        sample_rate = float(payload.get('sample_rate', 0))
+        started_at = float(payload.get('started_at', 0))
+    except (TypeError, ValueError):
+        raise SensorDataError('sample_rate and started_at must be numbers')
+    frame = encode_frame(payload['samples'], payload.get('kind', 'accelerometer'), sample_rate, started_at)
+    return frame, parse_frame(frame)
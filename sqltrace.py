@@ -0,0 +1,207 @@
+# Per-request SQL tracing: statement log, N+1 detection, slow query plans and query budgets
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from flask import g, has_app_context, request
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Identical statements run at least this many times in one request are reported as N+1
+N_PLUS_ONE_THRESHOLD = 3
+SLOW_QUERY_SECONDS = float(os.environ.get('SQL_SLOW_QUERY_MS', 50)) / 1000
+
+# Maximum statements (including COMMITs) per request; exceeding one is logged, or
+# raised when QUERY_BUDGET_STRICT is set (as tests do)
+# usage_tracker adds one query the first time a user is seen and two when it flushes usage_log
+QUERY_BUDGETS = {
+    'games.games': 5,
+    'games.start_game': 5,
+    # 2 more when the update carries a sensor frame, which is stored right away
+    'games.update_score': 5,
+    'games.heartbeat': 3,
+    'main.check_usage_limit': 1,
+    # 15 today; streak, achievements and rank run in the post_game job
+    'games.end_game': 20,
+    'jobs.job_status': 1,
+    'games.get_user_stats': 6,
+    'games.get_leaderboard': 3,
+    'games.get_exercise_history': 2,
+    'games.game_data': 1,
+    'games.activity_heatmap': 3,
+    'games.get_live_stats': 0,
+    'dashboard.stats': 2,
+    'dashboard.summary': 2,
+    'dashboard.weekly_progress': 2,
+    'dashboard.achievement_progress': 2,
+}
+
+_collectors = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryTrace:
+    """Statements executed while the trace was active"""
+
+    def __init__(self):
+        self.statements: List[Dict[str, Any]] = []
+        self.connections = 0
+
+    @property
+    def count(self) -> int:
+        return sum(1 for statement in self.statements if not _implicit(statement))
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(statement['seconds'] or 0 for statement in self.statements)
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Dict[str, Any]]:
+        """Statements executed `threshold` or more times, most repeated first"""
+        counts = Counter(statement['template'] for statement in self.statements
+                         if not _implicit(statement) and statement['template'] != 'COMMIT')
+        return [{'statement': template, 'count': count}
+                for template, count in counts.most_common() if count >= threshold]
+
+    def slow(self, seconds: float = SLOW_QUERY_SECONDS) -> List[Dict[str, Any]]:
+        return [statement for statement in self.statements
+                if statement['seconds'] is not None and statement['seconds'] >= seconds]
+
+
+def normalize(sql: str) -> str:
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def _implicit(statement: Dict[str, Any]) -> bool:
+    # BEGIN is issued by the sqlite3 module before writes, not by our code
+    return statement['template'] == 'BEGIN'
+
+
+def _active_traces() -> List[QueryTrace]:
+    traces = list(getattr(_collectors, 'stack', ()))
+    if has_app_context() and g.get('sql_trace') is not None:
+        traces.append(g.sql_trace)
+    return traces
+
+
+def _on_connection(conn):
+    traces = _active_traces()
+    if not traces:
+        return
+    for trace in traces:
+        trace.connections += 1
+
+    def trace_statement(expanded_sql):
+        statement = normalize(expanded_sql)
+        for trace in _active_traces():
+            trace.statements.append({'sql': statement, 'template': statement, 'seconds': None})
+
+    conn.set_trace_callback(trace_statement)
+
+
+def _on_query(sql, params, duration):
+    # The trace callback logged the statement as it started; attach its timing
+    for trace in _active_traces():
+        if trace.statements and trace.statements[-1]['seconds'] is None:
+            trace.statements[-1]['seconds'] = duration
+            trace.statements[-1]['template'] = normalize(sql)
+            trace.statements[-1]['params'] = params
+
+
+database.CONNECTION_LISTENERS.append(_on_connection)
+database.QUERY_LISTENERS.append(_on_query)
+
+
+@contextmanager
+def trace_queries():
+    """Collect every statement run in this thread inside the block"""
+    trace = QueryTrace()
+    stack = getattr(_collectors, 'stack', None)
+    if stack is None:
+        stack = _collectors.stack = []
+    stack.append(trace)
+    try:
+        yield trace
+    finally:
+        stack.remove(trace)
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Fail when the block runs more than `limit` statements, e.g. in a test:
+
+        with assert_max_queries(6):
+            client.get('/games/user_stats')
+    """
+    with trace_queries() as trace:
+        yield trace
+    if trace.count > limit:
+        statements = '\n'.join(statement['sql'] for statement in trace.statements)
+        raise QueryBudgetExceeded(f"{trace.count} queries executed, budget is {limit}:\n{statements}")
+
+
+def explain(sql: str, params) -> Optional[List[str]]:
+    """EXPLAIN QUERY PLAN for a SELECT, on a connection that is not traced"""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    conn = database.get_db_connection()
+    if not conn:
+        return None
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+        return [row['detail'] for row in rows]
+    except Exception:
+        return None
+    finally:
+        conn.close()
+
+
+def init_sql_trace(app):
+    """Trace requests with a query budget, or all requests when SQL_TRACE is set"""
+    app.config.setdefault('SQL_TRACE', os.environ.get('SQL_TRACE', '').lower() in ('1', 'true', 'yes'))
+    app.config.setdefault('QUERY_BUDGETS', dict(QUERY_BUDGETS))
+    app.config.setdefault('QUERY_BUDGET_STRICT', False)
+
+    @app.before_request
+    def start_sql_trace():
+        if app.config['SQL_TRACE'] or request.endpoint in app.config['QUERY_BUDGETS']:
+            g.sql_trace = QueryTrace()
+
+    @app.after_request
+    def finish_sql_trace(response):
+        trace = g.pop('sql_trace', None)
+        if trace is None:
+            return response
+
+        endpoint = request.endpoint
+        context = {'endpoint': endpoint, 'query_count': trace.count, 'connections': trace.connections}
+
+        for repeated in trace.repeated():
+            logger.warning('Repeated statement (possible N+1)', extra={'event': 'n_plus_one', **context, **repeated})
+
+        if app.config['SQL_TRACE']:
+            for statement in trace.slow():
+                logger.warning('Slow query', extra={
+                    'event': 'slow_query', **context,
+                    'statement': statement['sql'],
+                    'duration_ms': round(statement['seconds'] * 1000, 2),
+                    'query_plan': explain(statement['template'], statement.get('params'))
+                })
+            response.headers['X-Query-Count'] = str(trace.count)
+            response.headers['X-Query-Time-Ms'] = f"{trace.total_seconds * 1000:.2f}"
+
+        budget = app.config['QUERY_BUDGETS'].get(endpoint)
+        if budget is not None and trace.count > budget:
+            if app.config['QUERY_BUDGET_STRICT']:
+                statements = '\n'.join(statement['sql'] for statement in trace.statements)
+                raise QueryBudgetExceeded(f"{endpoint} ran {trace.count} queries, budget is {budget}:\n{statements}")
+            logger.warning('Query budget exceeded', extra={'event': 'query_budget', **context, 'budget': budget})
+        return response
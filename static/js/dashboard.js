@@ -2,24 +2,70 @@
 class FitPlayDashboard {
     constructor() {
         this.charts = {};
+        this.summaryVersion = null;
+        this.refreshTimer = null;
         this.init();
     }
 
     init() {
-        this.setupCharts();
-        this.updateStats();
-        this.setupAutoRefresh();
+        this.refreshSummary();
+        this.setupLiveUpdates();
     }
 
-    setupCharts() {
-        this.createWeeklyChart();
+    setupLiveUpdates() {
+        // Server pushes score and achievement changes where streams are cheap to hold
+        // (gevent workers); everywhere else, and without EventSource, poll instead
+        if (!window.EventSource || !window.FITPLAY_EVENTS_URL) {
+            this.setupAutoRefresh();
+            return;
+        }
+
+        const source = new EventSource(window.FITPLAY_EVENTS_URL);
+        ['score', 'achievement', 'resync'].forEach(type => {
+            source.addEventListener(type, () => this.refreshSummary());
+        });
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED) {
+                this.setupAutoRefresh();
+            }
+        };
     }
 
-    async createWeeklyChart() {
+    async refreshSummary() {
+        // One request for all dashboard sections; only changed sections come back
+        try {
+            const query = this.summaryVersion ? `?since=${encodeURIComponent(this.summaryVersion)}` : '';
+            const response = await fetch(`/dashboard/summary${query}`);
+            const summary = await response.json();
+            const sections = summary.sections;
+
+            if (sections.weekly_progress) {
+                this.renderWeeklyChart(sections.weekly_progress);
+            }
+            if (sections.stats) {
+                this.renderStats(sections.stats);
+            }
+            if (sections.achievement_progress) {
+                this.renderAchievementProgress(sections.achievement_progress);
+            }
+            this.summaryVersion = summary.version;
+        } catch (error) {
+            console.error('Error refreshing dashboard:', error);
+        }
+    }
+
+    renderWeeklyChart(data) {
+        if (this.charts.weekly) {
+            const chart = this.charts.weekly;
+            chart.data.labels = data.map(d => d.day);
+            chart.data.datasets[0].data = data.map(d => d.calories);
+            chart.data.datasets[1].data = data.map(d => d.workouts);
+            chart.data.datasets[2].data = data.map(d => d.time_active);
+            chart.update();
+            return;
+        }
+
         try {
-            const response = await fetch('/dashboard/weekly_progress');
-            const data = await response.json();
-            
             const ctx = document.getElementById('weeklyChart').getContext('2d');
             
             this.charts.weekly = new Chart(ctx, {
@@ -104,23 +150,16 @@ class FitPlayDashboard {
         }
     }
 
-    async updateStats() {
-        try {
-            const response = await fetch('/dashboard/stats');
-            const stats = await response.json();
-            
-            // Update stat displays with animation
-            this.animateCounter('total-points', stats.points);
-            this.animateCounter('total-workouts', stats.workouts_completed);
-            this.animateCounter('total-calories', stats.calories_burned);
-            
-            // Update time display
-            const timeElement = document.getElementById('total-time');
-            if (timeElement) {
-                timeElement.textContent = `${stats.time_active.toFixed(1)}min`;
-            }
-        } catch (error) {
-            console.error('Error updating stats:', error);
+    renderStats(stats) {
+        // Update stat displays with animation
+        this.animateCounter('total-points', stats.points);
+        this.animateCounter('total-workouts', stats.workouts_completed);
+        this.animateCounter('total-calories', stats.calories_burned);
+        
+        // Update time display
+        const timeElement = document.getElementById('total-time');
+        if (timeElement) {
+            timeElement.textContent = `${stats.time_active.toFixed(1)}min`;
         }
     }
 
@@ -152,30 +191,23 @@ class FitPlayDashboard {
         animate();
     }
 
-    async updateAchievementProgress() {
-        try {
-            const response = await fetch('/dashboard/achievement_progress');
-            const progress = await response.json();
-            
-            // Update achievement progress bars
-            Object.keys(progress).forEach(key => {
-                const achievement = progress[key];
-                const progressBar = document.querySelector(`[data-achievement="${key}"] .progress-bar`);
-                if (progressBar) {
-                    progressBar.style.width = `${achievement.progress}%`;
-                    progressBar.setAttribute('aria-valuenow', achievement.current);
-                }
-            });
-        } catch (error) {
-            console.error('Error updating achievement progress:', error);
-        }
+    renderAchievementProgress(progress) {
+        // Update achievement progress bars
+        Object.keys(progress).forEach(key => {
+            const achievement = progress[key];
+            const progressBar = document.querySelector(`[data-achievement="${key}"] .progress-bar`);
+            if (progressBar) {
+                progressBar.style.width = `${achievement.progress}%`;
+                progressBar.setAttribute('aria-valuenow', achievement.current);
+            }
+        });
     }
 
     setupAutoRefresh() {
-        // Refresh stats every 30 seconds
-        setInterval(() => {
-            this.updateStats();
-            this.updateAchievementProgress();
+        // Refresh the dashboard every 30 seconds
+        if (this.refreshTimer) return;
+        this.refreshTimer = setInterval(() => {
+            this.refreshSummary();
         }, 30000);
     }
 
@@ -221,7 +253,7 @@ document.addEventListener('DOMContentLoaded', () => {
     refreshBtn.innerHTML = '<i class="fas fa-sync-alt me-1"></i>Refresh';
     refreshBtn.onclick = () => {
         refreshBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i>Refreshing...';
-        window.fitPlayDashboard.updateStats().then(() => {
+        window.fitPlayDashboard.refreshSummary().then(() => {
             refreshBtn.innerHTML = '<i class="fas fa-sync-alt me-1"></i>Refresh';
         });
     };
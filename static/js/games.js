@@ -49,6 +49,9 @@ class FitPlayGames {
                 this.gameStartTime = Date.now();
                 this.showGameInterface(gameType);
                 this.startGameTimer();
+            } else if (response.status === 403) {
+                const result = await response.json();
+                alert(`${result.error}. Take a break and come back later!`);
             }
         } catch (error) {
             console.error('Error starting game:', error);
@@ -122,9 +125,22 @@ class FitPlayGames {
                 const progress = Math.min((seconds / targetTime) * 100, 100);
                 document.getElementById('game-progress').style.width = `${progress}%`;
             }
+
+            // Count the minute as active even when no reps are sent
+            if (seconds % 60 === 0) {
+                this.sendHeartbeat();
+            }
         }, 1000);
     }
 
+    async sendHeartbeat() {
+        try {
+            await fetch('/games/heartbeat', { method: 'POST' });
+        } catch (error) {
+            console.error('Error sending heartbeat:', error);
+        }
+    }
+
     gameAction() {
         if (!this.currentGame) return;
 
@@ -0,0 +1,71 @@
+# The app's modules read their paths at import, so every run works in a scratch directory set up
+# before test modules are collected
+import atexit
+import math
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SQUAT_SAMPLES = {
+    'kind': 'accelerometer',
+    'sample_rate': 50,
+    'samples': [[0.0, 0.0, 9.8 + 3 * math.sin(2 * math.pi * 0.5 * n / 50)] for n in range(500)],
+}
+
+
+def pytest_configure(config):
+    scratch = Path(tempfile.mkdtemp(prefix='fitplay-tests-'))
+    # Registered before the app's own exit handlers, which flush to the database, so it runs after them
+    atexit.register(shutil.rmtree, scratch, True)
+    os.chdir(scratch)
+    os.environ.update({
+        'JOB_WORKER_THREADS': '0',
+        'ADMISSION_SHM_PATH': str(scratch / 'admission'),
+        'USAGE_SHM_PATH': str(scratch / 'usage'),
+        'RESULT_CACHE_TAGS_PATH': str(scratch / 'cache-tags'),
+        'METRICS_DIR': str(scratch / 'metrics'),
+        'PROFILE_DIR': str(scratch / 'profiles'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    import database
+    database.DATABASE_FILE = str(scratch / 'fitness_games.db')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    flask_app.config.update(TESTING=True, QUERY_BUDGET_STRICT=True)
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def sign_up(client, username):
+    response = client.post('/auth/signup', data={
+        'username': username,
+        'email': f'{username}@example.com',
+        'password': 'correct horse battery',
+        'confirm_password': 'correct horse battery',
+    })
+    assert response.status_code == 302
+
+
+def play_game(client, game_type='squat_tap'):
+    """start_game, update_score (a score, then samples), heartbeat and end_game; returns end_game's body"""
+    assert client.post('/games/start_game', json={'game_type': game_type}).status_code == 200
+    assert client.post('/games/update_score', json={'score': 5}).status_code == 200
+    assert client.post('/games/update_score', json={'sensor_samples': SQUAT_SAMPLES}).status_code == 200
+    assert client.post('/games/heartbeat').status_code == 200
+    response = client.post('/games/end_game')
+    assert response.status_code == 200
+    return response.get_json()
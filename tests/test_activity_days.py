@@ -0,0 +1,77 @@
+# ActivityDays' bitset streaks against a plain set of dates
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from activity_days import ActivityDays
+
+
+def naive_current_streak(days, today):
+    end = today if today in days else today - timedelta(days=1)
+    streak = 0
+    while end - timedelta(days=streak) in days:
+        streak += 1
+    return streak
+
+
+def naive_longest_streak(days):
+    return max((naive_current_streak(days, day) for day in days), default=0)
+
+
+def d(text):
+    return date.fromisoformat(text)
+
+
+CASES = [
+    # (active days in the order they are added, today, current streak, longest streak)
+    ([], '2024-03-01', 0, 0),
+    (['2024-03-01'], '2024-03-01', 1, 1),
+    (['2024-03-01'], '2024-03-02', 1, 1),
+    (['2024-03-01'], '2024-03-03', 0, 1),
+    (['2024-03-05'], '2024-03-01', 0, 1),
+    (['2024-03-01', '2024-03-02', '2024-03-04'], '2024-03-04', 1, 2),
+    (['2024-03-01', '2024-03-02', '2024-03-04'], '2024-03-05', 1, 2),
+    (['2024-03-03', '2024-03-01', '2024-03-02'], '2024-03-03', 3, 3),
+    (['2024-03-10', '2024-03-09', '2024-02-01', '2024-03-08'], '2024-03-10', 3, 3),
+    (['2023-12-30', '2023-12-31', '2024-01-01', '2024-01-02'], '2024-01-02', 4, 4),
+    (['2024-01-01', '2023-12-31', '2023-12-30'], '2024-01-01', 3, 3),
+    (['2024-02-28', '2024-02-29', '2024-03-01'], '2024-03-02', 3, 3),
+    (['2023-12-31', '2024-12-31'], '2025-01-01', 1, 1),
+    (['2024-01-01', '2024-01-01', '2024-01-02'], '2024-01-02', 2, 2),
+]
+
+
+@pytest.mark.parametrize('added, today, current, longest', CASES)
+def test_streaks(added, today, current, longest):
+    days = [d(day) for day in added]
+    activity = ActivityDays()
+    activity.add(days)
+    assert activity.current_streak(d(today)) == current == naive_current_streak(set(days), d(today))
+    assert activity.longest_streak() == longest == naive_longest_streak(set(days))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_days_match_naive(seed):
+    rng = random.Random(seed)
+    start = date(2023, 11, 1)
+    days = [start + timedelta(days=rng.randrange(150)) for _ in range(rng.randrange(1, 120))]
+    activity = ActivityDays()
+    # Added a few at a time, out of order, the way backfilled syncs arrive
+    for i in range(0, len(days), 7):
+        activity.add(days[i:i + 7])
+    restored = ActivityDays.from_blob(activity.first_day, activity.to_blob())
+    for today in [start + timedelta(days=offset) for offset in range(-1, 152, 5)]:
+        assert restored.current_streak(today) == naive_current_streak(set(days), today)
+    assert restored.longest_streak() == naive_longest_streak(set(days))
+    assert restored.last_active() == max(days)
+    assert restored.count(date(2024, 1, 1), date(2024, 1, 31)) == len({
+        day for day in days if date(2024, 1, 1) <= day <= date(2024, 1, 31)})
+
+
+def test_add_reports_change():
+    activity = ActivityDays()
+    assert activity.add([d('2024-01-02')])
+    assert not activity.add([d('2024-01-02')])
+    assert activity.add([d('2023-12-31'), d('2024-01-02')])
+    assert activity.days(d('2023-12-30'), d('2024-01-03')) == [0, 1, 0, 1, 0]
@@ -0,0 +1,48 @@
+# Token buckets shared through SharedState, and the 429s check_rate_limits turns them into
+import pytest
+
+from admission import RATE_LIMITS, SharedState
+from conftest import sign_up
+
+SYNC = {'sessions': [{'count': 1}]}
+
+
+@pytest.fixture
+def state(tmp_path):
+    return SharedState(str(tmp_path / 'admission'))
+
+
+def test_burst_then_retry_after(state):
+    assert [state.take_token('user:a:games.update_score', 2, 3)[0] for _ in range(4)] == [True, True, True, False]
+    allowed, retry_after = state.take_token('user:a:games.update_score', 2, 3)
+    assert not allowed
+    assert 0 < retry_after <= 0.5
+
+
+def test_buckets_are_per_key(state):
+    while state.take_token('user:a:games.update_score', 1, 5)[0]:
+        pass
+    assert state.take_token('user:b:games.update_score', 1, 5) == (True, 0.0)
+
+
+def test_buckets_are_shared_between_handles(state, tmp_path):
+    other = SharedState(str(tmp_path / 'admission'))
+    for _ in range(2):
+        assert state.take_token('user:a:games.update_score', 1, 2)[0]
+    assert not other.take_token('user:a:games.update_score', 1, 2)[0]
+
+
+def test_user_gets_429_after_burst(app):
+    rate, burst = RATE_LIMITS['games.sync_exercise_data']['user']
+    client = app.test_client()
+    sign_up(client, 'burster')
+    for _ in range(burst):
+        assert client.post('/games/sync_exercise_data', json=SYNC).status_code == 200
+    response = client.post('/games/sync_exercise_data', json=SYNC)
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 1 / rate + 1
+
+    # Another user's bucket is untouched
+    neighbour = app.test_client()
+    sign_up(neighbour, 'neighbour')
+    assert neighbour.post('/games/sync_exercise_data', json=SYNC).status_code == 200
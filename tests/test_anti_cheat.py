@@ -0,0 +1,85 @@
+# audit_arrays' quarantine rules, and what a quarantine from `flask audit-sessions` changes for the player
+import numpy as np
+import pytest
+
+from anti_cheat import (FLAG_JUMP, FLAG_RATE, FLAG_TIMELINE, FLAG_UNTRACKED, audit_arrays, audit_finished_session,
+                        audit_sessions, max_units_per_second)
+from conftest import play_game, sign_up
+
+START = 1700000000.0
+# squat_tap: one rep per second at most, with RATE_TOLERANCE
+SQUAT_RATE = 1.25
+
+
+def audit(*sessions):
+    """audit_arrays for sessions given as (seconds played, final score, [(seconds in, running score), ...])"""
+    index, times, counts = [], [], []
+    for number, (_, _, points) in enumerate(sessions):
+        index.extend([number] * len(points))
+        times.extend(START + offset for offset, _ in points)
+        counts.extend(count for _, count in points)
+    return audit_arrays(np.array(index, dtype=np.int64), np.array(times, dtype=np.float64),
+                        np.array(counts, dtype=np.float64), np.full(len(sessions), START),
+                        np.array([START + seconds for seconds, _, _ in sessions]),
+                        np.array([score for _, score, _ in sessions], dtype=np.float64),
+                        np.full(len(sessions), SQUAT_RATE)).tolist()
+
+
+# One tracking point a second at a steady pace
+def steady(seconds, score):
+    return [(second, score * second // seconds) for second in range(1, seconds + 1)]
+
+
+CLEAN = (60, 30, steady(60, 30))
+
+
+@pytest.mark.parametrize('session, flags', [
+    (CLEAN, 0),
+    # No tracking points, but within the slack for taps
+    ((60, 5, []), 0),
+    # 100 squats in a minute, each second's gain looking plausible on its own
+    ((60, 100, steady(60, 100)), FLAG_RATE),
+    # 35 reps reported within one second
+    ((60, 40, [(10, 5), (11, 40)]), FLAG_JUMP),
+    # A final score the tracking points never reached
+    ((60, 50, steady(60, 20)), FLAG_UNTRACKED),
+    ((60, 30, []), FLAG_UNTRACKED),
+    # Rate, jump and untracked at once: a doctored end_game score
+    ((60, 5000, [(30, 500)]), FLAG_RATE | FLAG_JUMP | FLAG_UNTRACKED),
+    # Points before the session started, or counting down, are suspicious but not quarantined
+    ((60, 30, [(-120, 0)] + steady(60, 30)), FLAG_TIMELINE),
+    ((60, 30, steady(60, 30) + [(60, 25)]), FLAG_TIMELINE),
+], ids=['clean', 'untracked taps', 'rate', 'jump', 'untracked', 'no points', 'doctored', 'early', 'countdown'])
+def test_audit_flags(session, flags):
+    assert audit(session) == [flags]
+
+
+def test_sessions_are_flagged_independently():
+    assert audit(CLEAN, (60, 40, [(10, 5), (11, 40)]), (60, 0, []), CLEAN) == [0, FLAG_JUMP, 0, 0]
+
+
+def test_squat_rate_limit():
+    assert max_units_per_second('squat_tap') == SQUAT_RATE
+
+
+def test_clean_game_is_not_quarantined(client):
+    sign_up(client, 'honest')
+    finished = play_game(client)
+    assert not audit_finished_session(int(finished['session_id']))
+
+
+def test_quarantine_changes_owner_etag(client):
+    sign_up(client, 'doctored')
+    assert client.post('/games/start_game', json={'game_type': 'squat_tap'}).status_code == 200
+    assert client.post('/games/update_score', json={'score': 5000}).status_code == 200
+    finished = client.post('/games/end_game').get_json()
+    # Rendering a page consumes the signup flash, which would otherwise skip conditional GET
+    assert client.get('/').status_code == 200
+    before = client.get('/dashboard/stats')
+    assert before.status_code == 200 and before.headers['ETag']
+
+    report = audit_sessions()
+    assert int(finished['session_id']) in report.quarantined
+    after = client.get('/dashboard/stats', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != before.headers['ETag']
@@ -0,0 +1,93 @@
+# FoodSearchIndex: word-prefix matching in rank order, the typo fallback, and queries with no words
+import pytest
+
+from food_search import FIRST_PASS, FoodSearchIndex, normalize
+
+NAMES = [
+    'Chicken breast, grilled',
+    'Chicken curry',
+    'Grilled cheese sandwich',
+    'Greek yogurt',
+    'Brown rice',
+    'Rice pudding',
+    'Egg',
+    'Chickpea curry',
+    'Peanut butter',
+    'Butter chicken',
+]
+INDEX = FoodSearchIndex(NAMES, limit=10)
+
+
+def naive_search(query):
+    """Names with a word starting with each query word: names starting with the query, then shorter names first"""
+    terms = normalize(query).split()
+    matches = [name for name in NAMES
+               if all(any(word.startswith(term) for word in normalize(name).split()) for term in terms)]
+    matches.sort(key=lambda name: (not normalize(name).startswith(' '.join(terms)), len(name), name.lower()))
+    return matches
+
+
+def names(result):
+    return [name for name, _ in result['results']]
+
+
+@pytest.mark.parametrize('query', [
+    'chicken', 'chi', 'c', 'curry chick', 'chick curry', 'grilled chicken', 'chicken grilled', 'gr ch',
+    'Butter', 'rice', 'RICE brown', 'chicken, curry!', 'egg', 'chicken pudding',
+])
+def test_prefix_matches_any_word_order(query):
+    result = INDEX.search(query)
+    assert names(result) == naive_search(query)
+    assert not result['fuzzy'] or not naive_search(query)
+
+
+def test_word_order_does_not_change_results():
+    assert INDEX.search('curry chick') == INDEX.search('chick curry')
+    # Shorter names rank first, except that names starting with the query lead
+    assert names(INDEX.search('grilled ch')) == ['Grilled cheese sandwich', 'Chicken breast, grilled']
+
+
+def test_results_carry_catalogue_ids():
+    for name, catalogue_id in INDEX.search('c')['results']:
+        assert NAMES[catalogue_id] == name
+
+
+def test_limit():
+    # The best-ranked matches, shortest names first
+    assert names(INDEX.search('c', limit=2)) == ['Chicken curry', 'Butter chicken']
+    assert len(INDEX.search('c', limit=100)['results']) == len(naive_search('c'))
+
+
+def test_rare_combination_beyond_first_pass():
+    # The only item with both words ranks below the first FIRST_PASS items of either word
+    catalogue = [f'salad number {n:04d}' for n in range(FIRST_PASS * 3)] + ['sweet potato salad with extra long name']
+    index = FoodSearchIndex(catalogue)
+    assert names(index.search('salad potato')) == ['sweet potato salad with extra long name']
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('chiken', 'Chicken curry'),
+    ('yoghurt', 'Greek yogurt'),
+    ('peanut buter', 'Peanut butter'),
+])
+def test_typos_fall_back_to_fuzzy(query, expected):
+    result = INDEX.search(query)
+    assert result['fuzzy']
+    assert expected in names(result)
+
+
+def test_exact_matches_are_not_fuzzy():
+    assert INDEX.search('chicken')['fuzzy'] is False
+
+
+def test_nothing_close_is_not_fuzzy():
+    assert INDEX.search('xqzvw') == {'results': [], 'fuzzy': False}
+
+
+@pytest.mark.parametrize('query', ['', '   ', '!!!', ', - .', '\t\n'])
+def test_queries_without_words(query):
+    assert INDEX.search(query) == {'results': [], 'fuzzy': False}
+
+
+def test_empty_catalogue():
+    assert FoodSearchIndex([]).search('egg') == {'results': [], 'fuzzy': False}
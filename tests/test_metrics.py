@@ -0,0 +1,26 @@
+# collect() merges every <pid>.json it finds, so METRICS_DIR must be private to this user
+import os
+
+import pytest
+
+import metrics
+
+
+def test_collect_creates_private_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path / 'metrics'))
+    metrics.collect()
+    assert (tmp_path / 'metrics').stat().st_mode & 0o777 == 0o700
+    assert f"{os.getpid()}.json" in os.listdir(tmp_path / 'metrics')
+
+
+@pytest.mark.parametrize('make', [
+    # mkdir's mode is masked by the umask, so the group and other bits are set afterwards
+    lambda path: (os.mkdir(path), os.chmod(path, 0o777)),
+    lambda path: os.symlink(os.path.dirname(path), path),
+], ids=['shared mode', 'symlink'])
+def test_refuses_unsafe_directory(tmp_path, monkeypatch, make):
+    path = str(tmp_path / 'metrics')
+    make(path)
+    monkeypatch.setattr(metrics, 'METRICS_DIR', path)
+    with pytest.raises(RuntimeError, match='METRICS_DIR'):
+        metrics.flush()
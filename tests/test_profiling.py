@@ -0,0 +1,23 @@
+# Profile dumps are marshal data, so only a private directory is written to or read from
+import os
+
+import pytest
+
+from profiling import ensure_profile_dir
+
+
+def test_creates_private_directory(tmp_path):
+    ensure_profile_dir(str(tmp_path / 'profiles'))
+    assert (tmp_path / 'profiles').stat().st_mode & 0o777 == 0o700
+
+
+@pytest.mark.parametrize('make', [
+    # mkdir's mode is masked by the umask, so the group and other bits are set afterwards
+    lambda path: (os.mkdir(path), os.chmod(path, 0o755)),
+    lambda path: os.symlink(os.path.dirname(path), path),
+], ids=['shared mode', 'symlink'])
+def test_refuses_unsafe_directory(tmp_path, make):
+    path = str(tmp_path / 'profiles')
+    make(path)
+    with pytest.raises(RuntimeError, match='PROFILE_DIR'):
+        ensure_profile_dir(path)
@@ -0,0 +1,47 @@
+# Every endpoint in sqltrace.QUERY_BUDGETS, driven with QUERY_BUDGET_STRICT so going over budget fails the test
+import pytest
+
+from conftest import play_game, sign_up
+from sqltrace import QUERY_BUDGETS, QueryBudgetExceeded, assert_max_queries
+
+
+def test_budgets_name_registered_endpoints(app):
+    assert set(QUERY_BUDGETS) <= set(app.view_functions)
+
+
+@pytest.mark.parametrize('games_played', [1, 2])
+def test_game_flow_within_budget(client, games_played):
+    # The first game also creates the user's row; later ones update it
+    sign_up(client, f'budget{games_played}')
+    for _ in range(games_played):
+        finished = play_game(client)
+    assert client.get(finished['post_game_job']['status_url']).status_code == 200
+
+
+def test_read_endpoints_within_budget(client):
+    sign_up(client, 'reader')
+    play_game(client)
+    for url in ['/games/', '/games/user_stats', '/games/get_exercise_history', '/games/leaderboard/squat_tap',
+                '/games/game_data', '/games/activity', '/games/live', '/check_usage_limit', '/dashboard/stats',
+                '/dashboard/summary', '/dashboard/weekly_progress', '/dashboard/achievement_progress']:
+        # Twice: cold, then with the result cache and conditional GET versions warm
+        for _ in range(2):
+            assert client.get(url).status_code == 200, url
+
+
+def test_strict_mode_raises_over_budget(app, client, monkeypatch):
+    monkeypatch.setitem(app.config['QUERY_BUDGETS'], 'games.get_user_stats', 0)
+    sign_up(client, 'overbudget')
+    play_game(client)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/games/user_stats')
+
+
+def test_assert_max_queries(client):
+    sign_up(client, 'counted')
+    with pytest.raises(QueryBudgetExceeded):
+        with assert_max_queries(0):
+            client.post('/games/start_game', json={'game_type': 'squat_tap'})
+    with assert_max_queries(QUERY_BUDGETS['games.heartbeat']) as trace:
+        client.post('/games/heartbeat')
+    assert trace.count <= QUERY_BUDGETS['games.heartbeat']
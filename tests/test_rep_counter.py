@@ -0,0 +1,68 @@
+# count_reps on synthetic movement with a known number of reps, and random shaking that must not score
+import numpy as np
+import pytest
+
+from conftest import sign_up
+from rep_counter import MIN_REP_CONFIDENCE, count_reps
+from sensor_frames import FRAME_MIMETYPE, encode_frame
+
+RATE = 50
+SECONDS = 60
+
+
+def accelerometer(period, seed, noise=0.8):
+    """x, y, z samples: gravity on z plus one sine cycle per rep and sensor noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(SECONDS * RATE) / RATE
+    samples = rng.normal(0, noise, (len(t), 3))
+    samples[:, 2] += 9.8 + 3 * np.sin(2 * np.pi * t / period)
+    return samples
+
+
+@pytest.mark.parametrize('exercise, period', [
+    ('squat', 2.0), ('squat', 3.0), ('jump', 0.6), ('jump', 1.0), ('pushup', 1.5), ('pushup', 2.5),
+])
+@pytest.mark.parametrize('seed', range(3))
+def test_counts_accelerometer_reps(exercise, period, seed):
+    counted = count_reps(accelerometer(period, seed), RATE, exercise)
+    assert abs(counted.reps - SECONDS / period) <= 1
+    assert counted.confidence >= MIN_REP_CONFIDENCE
+    assert counted.seconds == SECONDS
+
+
+def test_counts_pose_reps():
+    rate, period = 30, 2.5
+    rng = np.random.default_rng(0)
+    t = np.arange(SECONDS * rate) / rate
+    heights = 0.5 + 0.1 * np.sin(2 * np.pi * t / period)[:, None] + rng.normal(0, 0.01, (len(t), 17))
+    keypoints = np.stack([np.full_like(heights, 0.5), heights], axis=-1)
+    counted = count_reps(keypoints, rate, 'squat', 'pose')
+    assert abs(counted.reps - SECONDS / period) <= 1
+    assert counted.confidence >= MIN_REP_CONFIDENCE
+
+
+@pytest.mark.parametrize('exercise', ['squat', 'jump', 'pushup'])
+@pytest.mark.parametrize('seed', range(5))
+def test_noise_is_not_confident(exercise, seed):
+    shaking = 9.8 + np.random.default_rng(seed).normal(0, 3, (SECONDS * RATE, 3))
+    assert count_reps(shaking, RATE, exercise).confidence < MIN_REP_CONFIDENCE
+
+
+def test_noise_upload_scores_no_reps(client):
+    sign_up(client, 'shaker')
+    assert client.post('/games/start_game', json={'game_type': 'squat_tap'}).status_code == 200
+    shaking = 9.8 + np.random.default_rng(0).normal(0, 3, (SECONDS * RATE, 3))
+    response = client.post('/games/update_score', data=encode_frame(shaking, 'accelerometer', RATE),
+                           content_type=FRAME_MIMETYPE)
+    assert response.status_code == 200
+    assert response.get_json()['score'] == 0
+    assert response.get_json()['confidence'] < MIN_REP_CONFIDENCE
+
+
+def test_rhythmic_upload_scores_reps(client):
+    sign_up(client, 'squatter')
+    assert client.post('/games/start_game', json={'game_type': 'squat_tap'}).status_code == 200
+    response = client.post('/games/update_score', data=encode_frame(accelerometer(2.0, 0), 'accelerometer', RATE),
+                           content_type=FRAME_MIMETYPE)
+    assert response.status_code == 200
+    assert abs(response.get_json()['score'] - SECONDS / 2.0) <= 1
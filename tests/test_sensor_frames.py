@@ -0,0 +1,73 @@
+# The binary sensor frame format: round trips, and headers or payloads that don't add up
+import struct
+
+import numpy as np
+import pytest
+
+from rep_counter import SensorDataError
+from sensor_frames import FRAME_MAGIC, FRAME_VERSION, HEADER, encode_frame, frame_from_json, parse_frame
+
+SAMPLES = np.arange(30, dtype=np.float32).reshape(10, 3)
+
+
+def frame(kind_code=0, channels=3, count=10, magic=FRAME_MAGIC, version=FRAME_VERSION, values=SAMPLES):
+    """A frame with a hand-built header, which may disagree with its values"""
+    return HEADER.pack(magic, version, kind_code, channels, count, 50.0, 0.0) + values.astype('<f4').tobytes()
+
+
+def test_round_trip():
+    parsed = parse_frame(encode_frame(SAMPLES, 'accelerometer', 50, started_at=1700000000.5))
+    assert parsed.kind == 'accelerometer'
+    assert parsed.sample_rate == 50
+    assert parsed.started_at == 1700000000.5
+    np.testing.assert_array_equal(parsed.samples, SAMPLES)
+
+
+def test_magnitude_and_pose_shapes():
+    assert parse_frame(encode_frame(np.ones(8), 'accelerometer', 50)).samples.shape == (8,)
+    keypoints = np.full((4, 17, 2), 0.5)
+    assert parse_frame(encode_frame(keypoints, 'pose', 30)).samples.shape == (4, 17, 2)
+
+
+def test_json_upload_matches_binary():
+    frame_bytes, parsed = frame_from_json({'kind': 'accelerometer', 'sample_rate': 50, 'samples': SAMPLES.tolist()})
+    assert frame_bytes == encode_frame(SAMPLES, 'accelerometer', 50)
+    np.testing.assert_array_equal(parsed.samples, SAMPLES)
+
+
+@pytest.mark.parametrize('data', [b'', frame()[:HEADER.size - 1], b'FPSF'], ids=['empty', 'cut header', 'magic only'])
+def test_truncated_header(data):
+    with pytest.raises(SensorDataError, match='header'):
+        parse_frame(data)
+
+
+@pytest.mark.parametrize('data, message', [
+    (frame(magic=b'JPEG'), 'magic'),
+    (frame(version=FRAME_VERSION + 1), 'version'),
+    (frame(kind_code=7), 'kind'),
+    (frame(channels=0, values=SAMPLES[:0]), 'channels'),
+    (frame(kind_code=1, channels=3), 'x and y'),
+])
+def test_malformed_header(data, message):
+    with pytest.raises(SensorDataError, match=message):
+        parse_frame(data)
+
+
+@pytest.mark.parametrize('data', [
+    frame(count=11),
+    frame(count=9),
+    frame()[:-1],
+    frame() + b'\0' * 4,
+    # The largest count the header can hold
+    frame(count=2 ** 32 - 1),
+], ids=['count too high', 'count too low', 'truncated samples', 'trailing bytes', 'huge count'])
+def test_sample_count_must_match_payload(data):
+    with pytest.raises(SensorDataError, match='header describes'):
+        parse_frame(data)
+
+
+def test_samples_are_not_copied():
+    data = bytearray(encode_frame(SAMPLES, 'accelerometer', 50))
+    parsed = parse_frame(data)
+    struct.pack_into('<f', data, HEADER.size, 99.0)
+    assert parsed.samples[0, 0] == 99.0
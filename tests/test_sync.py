@@ -0,0 +1,13 @@
+# /games/sync_exercise_data: every upload is new activity, even one repeating an earlier payload
+from conftest import sign_up
+
+
+def test_repeated_upload_gets_its_own_job(client):
+    sign_up(client, 'syncer')
+    upload = {'sessions': [{'count': 10, 'source': 'watch'}]}
+    jobs = []
+    for _ in range(2):
+        response = client.post('/games/sync_exercise_data', json=upload)
+        assert response.status_code == 200
+        jobs.append(response.get_json()['achievements_job']['id'])
+    assert jobs[0] != jobs[1]
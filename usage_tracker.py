@@ -0,0 +1,304 @@
+# Active minutes per user over a sliding 24-hour window, shared by all workers and logged to SQLite in batches
+import atexit
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from flask import session
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# 0 turns the limit off
+DAILY_USAGE_LIMIT_MINUTES = int(os.environ.get('DAILY_USAGE_LIMIT_MINUTES', 120))
+WINDOW_MINUTES = 24 * 60
+# Activity this close to the previous event counts every minute in between
+ACTIVE_GAP_MINUTES = 5
+# Buffered minutes are written to usage_log this often, or once this many pile up
+USAGE_FLUSH_SECONDS = float(os.environ.get('USAGE_FLUSH_SECONDS', 15))
+USAGE_FLUSH_MINUTES = 500
+# usage_log rows older than this are pruned now and then
+LOG_RETENTION_MINUTES = 2 * WINDOW_MINUTES
+
+SHM_PATH = os.environ.get('USAGE_SHM_PATH') or os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'fitplay-usage')
+
+# Open-addressed table of users: key hash, last active minute, and one bit per
+# minute of the window, minute m at bit m % WINDOW_MINUTES
+ENTRY = struct.Struct(f'<Qq{WINDOW_MINUTES // 8}s')
+ENTRY_SLOTS = 16384
+ENTRY_PROBES = 8
+SHM_SIZE = ENTRY_SLOTS * ENTRY.size
+FULL_WINDOW = (1 << WINDOW_MINUTES) - 1
+
+
+def current_minute() -> int:
+    return int(time.time() // 60)
+
+
+def ring_mask(start: int, count: int) -> int:
+    """Bits for count consecutive minutes from start, wrapping around the ring"""
+    if count <= 0:
+        return 0
+    if count >= WINDOW_MINUTES:
+        return FULL_WINDOW
+    start %= WINDOW_MINUTES
+    end = start + count
+    if end <= WINDOW_MINUTES:
+        return ((1 << count) - 1) << start
+    return ((1 << (end - WINDOW_MINUTES)) - 1) | (((1 << (WINDOW_MINUTES - start)) - 1) << start)
+
+
+def window_bits(last: int, bits: int, now: int) -> int:
+    """bits without the minutes that have slid out of the window ending at now"""
+    if last <= 0 or now - last >= WINDOW_MINUTES:
+        return 0
+    # The ring holds last - WINDOW_MINUTES + 1 .. last; the oldest now - last of those are gone
+    return bits & ~ring_mask(last + 1, now - last)
+
+
+class UsageTable:
+    """mmap'd file shared by every worker process on the host"""
+
+    def __init__(self, path: str = SHM_PATH):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < SHM_SIZE:
+            os.ftruncate(self.fd, SHM_SIZE)
+        self.buffer = mmap.mmap(self.fd, SHM_SIZE)
+        # fcntl record locks only exclude other processes, threads need their own lock
+        self.thread_lock = threading.Lock()
+
+    def _read(self, index: int) -> Tuple[int, int, int]:
+        key_hash, last, bits = ENTRY.unpack_from(self.buffer, index * ENTRY.size)
+        return key_hash, last, int.from_bytes(bits, 'little')
+
+    def _write(self, index: int, key_hash: int, last: int, bits: int):
+        ENTRY.pack_into(self.buffer, index * ENTRY.size, key_hash, last, bits.to_bytes(WINDOW_MINUTES // 8, 'little'))
+
+    def find(self, key_hash: int) -> Optional[int]:
+        """Index of key's entry, read without locking"""
+        start = key_hash % ENTRY_SLOTS
+        for probe in range(ENTRY_PROBES):
+            index = (start + probe) % ENTRY_SLOTS
+            if ENTRY.unpack_from(self.buffer, index * ENTRY.size)[0] == key_hash:
+                return index
+        return None
+
+    def minutes(self, key_hash: int, now: int) -> Optional[int]:
+        """Active minutes in the window, or None when the user has no entry"""
+        index = self.find(key_hash)
+        if index is None:
+            return None
+        _, last, bits = self._read(index)
+        return window_bits(last, bits, now).bit_count()
+
+    def update(self, key_hash: int, now: int, minute: Optional[int] = None,
+               loaded: Optional[List[int]] = None) -> List[int]:
+        """Mark minute active (and fill a short gap before it) or create the entry from loaded minutes.
+
+        Returns the minutes that became active, for the flush log.
+        """
+        start = key_hash % ENTRY_SLOTS
+        with self.thread_lock:
+            # Lock the probe run so two workers can't claim different slots for one user
+            offset, length = start * ENTRY.size, ENTRY_PROBES * ENTRY.size
+            wrapped = start + ENTRY_PROBES > ENTRY_SLOTS
+            if wrapped:
+                offset, length = 0, SHM_SIZE
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, offset)
+            try:
+                index = self.find(key_hash)
+                if index is None:
+                    index = self._free_slot(start)
+                    self._write(index, key_hash, 0, 0)
+                    if loaded is None:
+                        loaded = []
+                if loaded is not None:
+                    self._load(index, key_hash, loaded, now)
+                if minute is None:
+                    return []
+                return self._mark(index, key_hash, minute, now)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, length, offset)
+
+    def _free_slot(self, start: int) -> int:
+        """An empty slot among the probes, else the one idle the longest"""
+        chosen, oldest = None, None
+        for probe in range(ENTRY_PROBES):
+            index = (start + probe) % ENTRY_SLOTS
+            key_hash, last, _ = self._read(index)
+            if key_hash == 0:
+                return index
+            if oldest is None or last < oldest:
+                chosen, oldest = index, last
+        return chosen
+
+    def _load(self, index: int, key_hash: int, minutes: List[int], now: int):
+        _, last, bits = self._read(index)
+        bits = window_bits(last, bits, now)
+        for minute in minutes:
+            if now - WINDOW_MINUTES < minute <= now:
+                bits |= 1 << (minute % WINDOW_MINUTES)
+        self._write(index, key_hash, max([last, *minutes]) if bits else 0, bits)
+
+    def _mark(self, index: int, key_hash: int, minute: int, now: int) -> List[int]:
+        _, last, bits = self._read(index)
+        if minute <= now - WINDOW_MINUTES:
+            return []
+        if minute <= last:
+            # Late event inside the window: no gap to fill
+            new = [minute] if not bits >> (minute % WINDOW_MINUTES) & 1 else []
+        else:
+            # Ring positions after last are reused, so drop what they held a window ago
+            bits = window_bits(last, bits, minute)
+            new = list(range(last + 1, minute + 1)) if 0 < minute - last <= ACTIVE_GAP_MINUTES else [minute]
+            last = minute
+        for active in new:
+            bits |= 1 << (active % WINDOW_MINUTES)
+        self._write(index, key_hash, last, bits)
+        return new
+
+
+class FlushLog:
+    """Minutes this process has marked active but not yet written to usage_log"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending: List[Tuple[str, int]] = []
+        self.flushed_at = time.monotonic()
+        self.flushes = 0
+
+    def add(self, username: str, minutes: List[int]):
+        with self.lock:
+            self.pending.extend((username, minute) for minute in minutes)
+            due = (len(self.pending) >= USAGE_FLUSH_MINUTES or
+                   time.monotonic() - self.flushed_at >= USAGE_FLUSH_SECONDS)
+        if due:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Usage log flush failed')
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+            self.flushed_at = time.monotonic()
+            self.flushes += 1
+            prune = self.flushes % 100 == 0
+        if not pending and not prune:
+            return
+        conn = get_db_connection()
+        if not conn:
+            self._requeue(pending)
+            return
+        try:
+            conn.executemany('INSERT OR IGNORE INTO usage_log (username, minute) VALUES (?, ?)', pending)
+            if prune:
+                conn.execute('DELETE FROM usage_log WHERE minute <= ?', (current_minute() - LOG_RETENTION_MINUTES,))
+            conn.commit()
+        except sqlite3.Error:
+            # Keep the minutes for the next flush, e.g. when the database is busy
+            self._requeue(pending)
+            raise
+        finally:
+            conn.close()
+
+    def _requeue(self, pending: List[Tuple[str, int]]):
+        with self.lock:
+            self.pending[:0] = pending
+
+
+_table: Optional[UsageTable] = None
+_log = FlushLog()
+atexit.register(_log.flush)
+
+
+def get_usage_table() -> UsageTable:
+    global _table
+    if _table is None:
+        _table = UsageTable()
+    return _table
+
+
+def _key_hash(username: str) -> int:
+    return int.from_bytes(hashlib.blake2b(username.encode(), digest_size=8).digest(), 'little') or 1
+
+
+def _load_from_log(table: UsageTable, key_hash: int, username: str, now: int):
+    """Rebuild a user's window from usage_log, after a restart of the host or an eviction"""
+    conn = get_db_connection()
+    minutes = []
+    if conn:
+        minutes = [row[0] for row in conn.execute(
+            'SELECT minute FROM usage_log WHERE username = ? AND minute > ?', (username, now - WINDOW_MINUTES))]
+        conn.close()
+    table.update(key_hash, now, loaded=minutes)
+
+
+def record_usage(username: Optional[str], at: Optional[float] = None):
+    """Count the minute of at (default now) as active for the user"""
+    if not username:
+        return
+    table = get_usage_table()
+    key_hash = _key_hash(username)
+    now = current_minute()
+    if table.find(key_hash) is None:
+        _load_from_log(table, key_hash, username, now)
+    minute = now if at is None else int(at // 60)
+    new = table.update(key_hash, now, minute=minute)
+    if new:
+        _log.add(username, new)
+
+
+def usage_minutes(username: str) -> int:
+    """Active minutes in the last 24 hours: a lookup in shared memory once the user is loaded"""
+    table = get_usage_table()
+    key_hash = _key_hash(username)
+    now = current_minute()
+    minutes = table.minutes(key_hash, now)
+    if minutes is None:
+        _load_from_log(table, key_hash, username, now)
+        minutes = table.minutes(key_hash, now) or 0
+    return minutes
+
+
+def remaining_minutes(username: str) -> Optional[int]:
+    """Minutes left under DAILY_USAGE_LIMIT_MINUTES, or None with no limit"""
+    if DAILY_USAGE_LIMIT_MINUTES <= 0:
+        return None
+    return max(0, DAILY_USAGE_LIMIT_MINUTES - usage_minutes(username))
+
+
+def session_username() -> Optional[str]:
+    """Username of the signed-in user, without a database lookup; None for guests"""
+    user_id = session.get('user_id')
+    if user_id in (None, 'guest'):
+        return None
+    return session.get('username') or str(user_id)
+
+
+def usage_limit_status(username: Optional[str]) -> dict:
+    """Body of /check_usage_limit"""
+    if username is None or DAILY_USAGE_LIMIT_MINUTES <= 0:
+        # Guests keep the old per-session figure
+        usage = session.get('daily_usage', 0)
+        limit = DAILY_USAGE_LIMIT_MINUTES or None
+        remaining = max(0, limit - usage) if limit else None
+    else:
+        usage = usage_minutes(username)
+        remaining = max(0, DAILY_USAGE_LIMIT_MINUTES - usage)
+    return {
+        'limit_reached': remaining == 0,
+        'remaining_time': remaining,
+        'used_minutes': usage,
+        'window_minutes': WINDOW_MINUTES,
+    }